@@ -9,5 +9,19 @@ from .version_info import VERSION_INT, VERSION  # noqa
 
 # Import main classes
 from .model import Model    # noqa
-from .protocol import Protocol    # noqa
+from . import metrics    # noqa
+from . import sensitivity    # noqa
+from . import propagator    # noqa
+from .protocol import Protocol, Dose, DoseTable    # noqa
 from .compartment import Compartment     # noqa
+from .linear import LinearSystem     # noqa
+from .population import Population     # noqa
+from .cache import SolutionCache     # noqa
+from .stats import SolveStats, StatsCollector     # noqa
+from .checkpoint import Checkpoint     # noqa
+from .store import ResultStore     # noqa
+
+# Import functions
+from .parameter_sweep import sweep     # noqa
+from .stats import collect_stats     # noqa
+from .fitting import fit     # noqa
@@ -0,0 +1,206 @@
+"""Benchmarks of the hot paths of pkmodel: the cost of a single
+:meth:`pkmodel.Model.rhs` call, the wall time and rhs evaluation counts of
+:meth:`pkmodel.Model.solve`, and the throughput of population solves.
+
+Run the suite and store its results as a JSON baseline with::
+
+    python -m pkmodel.benchmarks --save baseline.json
+
+and check a later run for regressions against that baseline with::
+
+    python -m pkmodel.benchmarks --compare baseline.json
+
+Timings are machine dependent, so baselines should be compared on the
+machine which produced them. Evaluation counts are deterministic, and any
+change in them is reported.
+"""
+import pkmodel as pk
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy
+import scipy
+
+
+# Numbers of peripheral compartments, protocol times [h] and population
+# sizes benchmarked by the full and quick suites
+PERIPHERALS = [1, 10, 50, 200]
+TIMES = [1.0, 24.0, 720.0]
+PATIENTS = [10, 100, 1000]
+QUICK_PERIPHERALS = [1, 10]
+QUICK_TIMES = [1.0, 24.0]
+QUICK_PATIENTS = [10]
+
+# Metrics which are timings, and so are compared with a tolerance
+TIMINGS = ('time_per_call', 'wall_time', 'time_per_patient')
+
+
+def _model(n_peripheral, k_a):
+    """Returns a model with n_peripheral compartments of increasing
+    volume, which makes the system increasingly stiff.
+    """
+    peripheral = [pk.Compartment(1.0 + i, 1.0 / (1 + i)) for i in range(n_peripheral)]
+    return pk.Model(pk.Compartment(1.0, 1.0), peripheral, k_a)
+
+
+def _protocol(time):
+    return pk.Protocol(1.0, time, doses=pk.Dose.repeat(1.0, 8.0, int(time // 8)))
+
+
+def _best_of(func, repeat):
+    """Returns the smallest wall time of repeat calls to func, and the
+    result of the last call.
+    """
+    best = numpy.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark_rhs(n_peripheral, k_a, repeat=3, number=1000):
+    """Returns the wall time of a single call to Model.rhs.
+    """
+    model = _model(n_peripheral, k_a)
+    protocol = _protocol(1.0)
+    q = numpy.ones(model.n_states)
+
+    def calls():
+        for _ in range(number):
+            model.rhs(0.5, q, protocol)
+
+    best, _ = _best_of(calls, repeat)
+    return {'time_per_call': best / number}
+
+
+def benchmark_solve(n_peripheral, k_a, time, method, repeat=3):
+    """Returns the wall time and evaluation counts of Model.solve.
+    """
+    model = _model(n_peripheral, k_a)
+    protocol = _protocol(time)
+    best, sol = _best_of(lambda: model.solve(protocol, method=method), repeat)
+    return {'wall_time': best, 'nfev': int(sol.nfev), 'njev': int(sol.njev)}
+
+
+def benchmark_population(n_patients, n_peripheral, repeat=3):
+    """Returns the wall time per patient and evaluation count of a
+    Population solve, with randomly (but reproducibly) varied
+    parameters.
+    """
+    rng = numpy.random.default_rng(1)
+    scale = rng.uniform(0.5, 1.5, size=(n_patients, n_peripheral + 1))
+    population = pk.Population(
+        scale[:, 0], numpy.ones(n_patients),
+        scale[:, 1:] * (1.0 + numpy.arange(n_peripheral)),
+        numpy.ones((n_patients, n_peripheral)) / (1.0 + numpy.arange(n_peripheral)),
+    )
+    protocol = _protocol(24.0)
+    best, sol = _best_of(lambda: population.solve(protocol), repeat)
+    return {'time_per_patient': best / n_patients, 'nfev': int(sol.nfev)}
+
+
+def cases(quick=False):
+    """Returns the benchmark cases as a dict mapping a name to a
+    function without arguments which runs the benchmark.
+    """
+    peripherals = QUICK_PERIPHERALS if quick else PERIPHERALS
+    times = QUICK_TIMES if quick else TIMES
+    patients = QUICK_PATIENTS if quick else PATIENTS
+    repeat = 1 if quick else 3
+    result = {}
+    for n in peripherals:
+        for dosing, k_a in [('iv', None), ('sc', 1.5)]:
+            name = 'rhs[{0}, n_peripheral={1}]'.format(dosing, n)
+            result[name] = lambda n=n, k_a=k_a: benchmark_rhs(n, k_a, repeat)
+            for t in times:
+                for method in ['RK45', 'BDF']:
+                    name = 'solve[{0}, n_peripheral={1}, time={2}, {3}]'.format(dosing, n, t, method)
+                    result[name] = lambda n=n, k_a=k_a, t=t, method=method: benchmark_solve(
+                        n, k_a, t, method, repeat)
+    for n in patients:
+        name = 'population[n_patients={0}, n_peripheral=2]'.format(n)
+        result[name] = lambda n=n: benchmark_population(n, 2, repeat)
+    return result
+
+
+def run(quick=False, out=None):
+    """Runs the benchmark suite.
+
+    Args:
+        quick: Whether to run a smaller, faster suite.
+        out: An optional stream to report each result to.
+
+    Returns:
+        A JSON-serializable dict with the environment and the metrics
+        of each benchmark.
+    """
+    results = {}
+    for name, benchmark in cases(quick).items():
+        results[name] = benchmark()
+        if out is not None:
+            out.write('{0}: {1}\n'.format(name, results[name]))
+    return {
+        'pkmodel': pk.VERSION,
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'scipy': scipy.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(baseline, current, tolerance=0.25):
+    """Compares two sets of benchmark results.
+
+    Args:
+        baseline: Results returned by :func:`run`.
+        current: Later results returned by :func:`run`.
+        tolerance: The relative increase in a timing which counts as a
+            regression.
+
+    Returns:
+        A list of (name, metric, baseline value, current value) tuples
+        for each timing which increased by more than the tolerance, and
+        each evaluation count which changed.
+    """
+    regressions = []
+    for name, metrics in current['results'].items():
+        old = baseline['results'].get(name, {})
+        for metric, value in metrics.items():
+            if metric not in old:
+                continue
+            if metric in TIMINGS:
+                regressed = value > old[metric] * (1 + tolerance)
+            else:
+                regressed = value != old[metric]
+            if regressed:
+                regressions.append((name, metric, old[metric], value))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Runs the pkmodel benchmarks.')
+    parser.add_argument('--quick', action='store_true', help='run a smaller, faster suite')
+    parser.add_argument('--save', metavar='FILE', help='store the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare the results to a JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='relative slow down counted as a regression')
+    args = parser.parse_args(args)
+    results = run(args.quick, out=sys.stdout)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.tolerance)
+        for name, metric, old, new in regressions:
+            print('REGRESSION {0} {1}: {2} -> {3}'.format(name, metric, old, new))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import pkmodel as pk
+import collections
+import hashlib
+import os
+import tempfile
+import scipy.optimize
+import numpy
+
+
+class SolutionCache:
+    """A cache of PK model solutions, keyed by a stable hash of the
+    model parameters, the protocol and the solver settings.
+
+    Solutions are kept in memory, evicting the least recently used once
+    maxsize is reached, and optionally written to a directory of .npy
+    files which are memory-mapped when read back, so that they survive
+    process restarts.
+
+    A protocol whose dose_func is an arbitrary callable cannot be
+    hashed, as the cache cannot tell whether two callables give the
+    same doses. Such a protocol is only cached if it was created with
+    an explicit cache_key, which must change whenever its dose_func
+    does. Otherwise it is solved without the cache.
+
+    Attributes:
+        maxsize: The maximum number of solutions kept in memory.
+        directory: An optional directory in which solutions are stored.
+        hits: The number of solutions returned from the cache.
+        misses: The number of solutions which had to be computed.
+    """
+    def __init__(self, maxsize=128, directory=None):
+        if type(maxsize) is not int or maxsize < 0:
+            raise TypeError('maxsize must be an integer greater than or equal to 0')
+        self.maxsize = maxsize
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._solutions = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._solutions)
+
+    def key(self, model, protocol, method='auto', t_eval=None):
+        """Returns the key of a solve, as a hex string.
+
+        Args:
+            model: The Model to be solved.
+            protocol: The Protocol it is solved with.
+            method: The solver method, see :meth:`pkmodel.Model.solve`.
+            t_eval: The optional times at which the solution is stored.
+
+        Raises:
+            ValueError: If the protocol has an arbitrary dose_func and no
+                cache_key.
+        """
+        h = hashlib.sha256()
+        for token in [pk.VERSION, method] + model_tokens(model) + protocol_tokens(protocol):
+            h.update(repr(token).encode())
+            h.update(b'\0')
+        if t_eval is not None:
+            h.update(numpy.ascontiguousarray(t_eval, dtype=float).tobytes())
+        return h.hexdigest()
+
+    def solve(self, model, protocol, method='auto', t_eval=None):
+        """Returns the solution of :meth:`pkmodel.Model.solve`, from the
+        cache if possible. The arrays of a cached solution are
+        read-only, as they are shared between callers.
+
+        Args:
+            model: The Model to be solved.
+            protocol: The Protocol it is solved with.
+            method: The solver method, see :meth:`pkmodel.Model.solve`.
+            t_eval: Optional times at which to store the solution.
+
+        Returns:
+            A solution with attributes t and y.
+        """
+        try:
+            key = self.key(model, protocol, method, t_eval)
+        except ValueError:
+            self.misses += 1
+            return model.solve(protocol, method=method, t_eval=t_eval)
+        sol = self._get(key)
+        if sol is not None:
+            self.hits += 1
+            return sol
+        self.misses += 1
+        sol = model.solve(protocol, method=method, t_eval=t_eval)
+        if sol.success:
+            sol = self._put(key, sol.t, sol.y)
+        return sol
+
+    def clear(self, disk=False):
+        """Empties the in-memory cache, and the directory if disk is
+        True.
+        """
+        self._solutions.clear()
+        if disk and self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith('.npy'):
+                    os.remove(os.path.join(self.directory, name))
+
+    def _get(self, key):
+        if key in self._solutions:
+            self._solutions.move_to_end(key)
+            return self._solutions[key]
+        if self.directory is None:
+            return None
+        paths = self._paths(key)
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        t, y = [numpy.load(path, mmap_mode='r') for path in paths]
+        return self._remember(key, _solution(t, y))
+
+    def _put(self, key, t, y):
+        t = numpy.array(t, dtype=float)
+        y = numpy.array(y, dtype=float)
+        if self.directory is not None:
+            # y is written before t, so a solution is complete once t exists
+            for path, array in zip(reversed(self._paths(key)), [y, t]):
+                fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    numpy.save(f, array)
+                os.replace(tmp, path)
+        t.flags.writeable = False
+        y.flags.writeable = False
+        return self._remember(key, _solution(t, y))
+
+    def _remember(self, key, sol):
+        if self.maxsize > 0:
+            self._solutions[key] = sol
+            self._solutions.move_to_end(key)
+            while len(self._solutions) > self.maxsize:
+                self._solutions.popitem(last=False)
+        return sol
+
+    def _paths(self, key):
+        return [os.path.join(self.directory, '{0}.{1}.npy'.format(key, name)) for name in ['t', 'y']]
+
+
+def _solution(t, y):
+    return scipy.optimize.OptimizeResult(
+        t=t, y=y, sol=None, t_events=None, y_events=None, status=0, success=True,
+        message='The solution was read from the cache.',
+    )
+
+
+def model_tokens(model):
+    """Returns the parameters of a model as a list of hashable tokens,
+    with floats in their exact hex representation. Two models with the
+    same tokens have the same solutions, see :class:`SolutionCache` and
+    :class:`pkmodel.Checkpoint`.
+    """
+    (v_c, *v_p), (cl, *q_p) = model.volumes.tolist(), model.transition_rates.tolist()
+    tokens = ['model', v_c.hex(), cl.hex(), None if model.k_a is None else model.k_a.hex()]
+    for v, q in zip(v_p, q_p):
+        tokens += [v.hex(), q.hex()]
+    for source, target, rate in model.flows:
+        tokens += ['flow', source, target, rate.hex()]
+    return tokens
+
+
+def protocol_tokens(protocol):
+    """Returns the dosing of a protocol as a list of hashable tokens.
+
+    Raises:
+        ValueError: If the protocol has a dose_func other than a
+            DoseTable and no cache_key, so that it cannot be identified.
+    """
+    tokens = ['protocol', protocol.initial_dose.hex(), protocol.time.hex()]
+    for d in protocol.doses:
+        tokens += [d.time.hex(), d.amount.hex(), d.duration.hex(), d.compartment]
+    dose_func = protocol.dose_func
+    if protocol.cache_key is not None:
+        tokens += ['key', protocol.cache_key]
+    elif dose_func is pk.protocol.no_dose:
+        tokens += ['no_dose']
+    elif isinstance(dose_func, pk.DoseTable):
+        tokens += ['table', dose_func.kind, dose_func.rates.shape,
+                   dose_func.times.tobytes(), dose_func.rates.tobytes()]
+    else:
+        raise ValueError('a protocol with an arbitrary dose_func needs a cache_key to be cached.')
+    return tokens
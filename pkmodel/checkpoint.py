@@ -0,0 +1,67 @@
+import pkmodel as pk
+import numpy
+
+
+class Checkpoint:
+    """The state at the end of a solve, from which the solution can be
+    continued with :meth:`pkmodel.Model.resume` without solving the
+    earlier interval again.
+
+    Every solve made by :meth:`pkmodel.Model.solve` or
+    :meth:`pkmodel.Model.resume` stores one as the checkpoint attribute
+    of its solution.
+
+    Attributes:
+        time: The time [h] of the checkpoint, the end of the solve.
+        y: A read-only array of the drug quantities at that time,
+            including any boluses given at that time.
+        step: The size of the last step of the integrator, or None if
+            the solution was not integrated numerically.
+        method: The solver method which was used.
+        protocol: The Protocol which was solved.
+    """
+    def __init__(self, model, protocol, y, method, step=None):
+        self.time = protocol.time
+        self.y = numpy.array(y, dtype=float)
+        self.y.flags.writeable = False
+        self.step = step
+        self.method = method
+        self.protocol = protocol
+        self._model = pk.cache.model_tokens(model)
+
+    def check(self, model, protocol):
+        """Checks that a protocol continues the protocol of the
+        checkpoint: it must end at or after the checkpoint, and have the
+        same initial dose, dose_func and doses up to the checkpoint
+        time, so that only doses after it are new.
+
+        Args:
+            model: The Model to continue, which must have the same
+                parameters as the one which was solved.
+            protocol: The extended Protocol.
+
+        Raises:
+            TypeError: If model or protocol are of the wrong type.
+            ValueError: If the model or protocol do not continue the
+                checkpoint.
+        """
+        if not isinstance(model, pk.Model):
+            raise TypeError('model must be type pk.Model.')
+        if not isinstance(protocol, pk.Protocol):
+            raise TypeError('protocol must be type pk.Protocol.')
+        if pk.cache.model_tokens(model) != self._model:
+            raise ValueError('the model differs from the model of the checkpoint.')
+        old = self.protocol
+        if protocol.time < self.time:
+            raise ValueError('protocol time must not be before the checkpoint time.')
+        if protocol.initial_dose != old.initial_dose or protocol.dose_func is not old.dose_func:
+            raise ValueError('protocol must have the initial_dose and dose_func of the checkpoint.')
+        if _history(protocol, self.time) != _history(old, self.time):
+            raise ValueError('protocol must have the same doses as the checkpoint up to its time.')
+
+
+def _history(protocol, time):
+    """Returns the doses of a protocol given up to time.
+    """
+    return sorted(
+        (d.time, d.amount, d.duration, d.compartment or '') for d in protocol.doses if d.time <= time)
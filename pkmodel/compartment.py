@@ -12,6 +12,7 @@ class Compartment:
         clearance/elimination rate, in the case of a central
         compartment.
     """
+    __slots__ = ('volume', 'transition_rate')
 
     def __init__(self, volume: float, transition_rate: float):
         # Argument validation
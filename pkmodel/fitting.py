@@ -0,0 +1,236 @@
+import pkmodel as pk
+import scipy.optimize
+import scipy.sparse
+import numpy
+
+
+def parameter_names(model):
+    """Returns the names of the parameters of a model, as used by
+    :func:`pkmodel.parameter_sweep.expand_grid`: 'v_c', 'cl', 'v_p1',
+    'q_p1', ..., and 'k_a' for subcutaneous dosing.
+    """
+    names = ['v_c', 'cl']
+    for i in range(1, len(model.volumes)):
+        names += ['v_p{0}'.format(i), 'q_p{0}'.format(i)]
+    if model.k_a is not None:
+        names.append('k_a')
+    return names
+
+
+def get_parameters(model):
+    """Returns a dict of the parameters of a model, see
+    :func:`parameter_names`.
+    """
+    return {name: _get(model, name) for name in parameter_names(model)}
+
+
+def with_parameters(model, parameters):
+    """Returns a copy of a model with some parameters changed.
+
+    Args:
+        model: A Model.
+        parameters: A dict mapping parameter names, see
+            :func:`parameter_names`, to their new values.
+
+    Returns:
+        A new Model.
+
+    Raises:
+        ValueError: If a parameter name is not one of the model's.
+    """
+    _check_names(model, parameters)
+    values = get_parameters(model)
+    values.update({name: float(value) for name, value in parameters.items()})
+    peripheral = [
+        pk.Compartment(values['v_p{0}'.format(i)], values['q_p{0}'.format(i)])
+        for i in range(1, len(model.volumes))
+    ]
+    return pk.Model(
+        pk.Compartment(values['v_c'], values['cl']), peripheral, values.get('k_a'), model.flows or None)
+
+
+def sensitivities(model, protocol, parameters=None, method='auto', t_eval=None):
+    """Solves a model together with its forward sensitivity equations,
+    giving the derivatives of the drug quantities with respect to its
+    parameters in a single solve.
+
+    The sensitivity S_j = dq/dp_j of each parameter p_j satisfies
+    dS_j/dt = A S_j + (dA/dp_j) q with S_j(0) = 0, as the doses do not
+    depend on the parameters. Together with dq/dt = A q + b Dose(t)
+    this is again a linear system, which is solved with the same
+    methods as :meth:`pkmodel.Model.solve`, including 'analytic'.
+
+    Args:
+        model: The Model to solve.
+        protocol: The Protocol it is solved with.
+        parameters: An optional list of parameter names, by default all
+            of the model's, see :func:`parameter_names`.
+        method: The solver method, see :meth:`pkmodel.Model.solve`.
+        t_eval: Optional times at which to store the solution, by
+            default 1000 points spanning the protocol time.
+
+    Returns:
+        A solution with attributes t, y as returned by
+        :meth:`pkmodel.Model.solve`, and sensitivities, an array of
+        shape (len(parameters), n_states, len(t)).
+
+    Raises:
+        TypeError: If model or protocol are of the wrong type.
+        ValueError: If a parameter name is not one of the model's.
+    """
+    # Argument validation
+    if not isinstance(model, pk.Model):
+        raise TypeError('model must be type pk.Model.')
+    if not isinstance(protocol, pk.Protocol):
+        raise TypeError('protocol must be type pk.Protocol.')
+    parameters = parameter_names(model) if parameters is None else list(parameters)
+    _check_names(model, parameters)
+    if t_eval is None:
+        t_eval = numpy.linspace(0, protocol.time, 1000)
+    A, b = model.compile()
+    n, p = model.n_states, len(parameters)
+    # The augmented system is block lower triangular
+    blocks = [[A] + [None] * p]
+    for j, name in enumerate(parameters):
+        blocks.append([_derivative(model, A, name)] + [A if k == j else None for k in range(p)])
+    M = scipy.sparse.bmat(blocks, format='csr')
+    y0 = numpy.zeros(n * (p + 1))
+    y0[0] = protocol.initial_dose
+    boluses, infusions = protocol.events(model.state_names)
+    if method == 'analytic':
+        pk.model.check_analytic(protocol)
+        t_eval = numpy.asarray(t_eval, dtype=float)
+        sol = scipy.optimize.OptimizeResult(
+            t=t_eval, y=pk.LinearSystem(M.toarray()).solve(t_eval, y0, boluses, infusions),
+            nfev=0, njev=0, nlu=0, status=0, success=True,
+            message='The solution was evaluated analytically.',
+        )
+    else:
+        method, atol = pk.model.resolve_method(A, [protocol], method)
+        if len(y0) < pk.model.SPARSE_STATES:
+            M = M.toarray()
+        dose_func = protocol.continuous_dose_func
+        b = numpy.pad(b, (0, n * p))
+        sol = pk.model.integrate(
+            lambda t, y: M @ y + b * dose_func(t, y[:n]), y0, protocol.time, t_eval,
+            method=method, jac=pk.model.constant_jacobian(M, method), boluses=boluses, infusions=infusions,
+            breakpoints=protocol.breakpoints, atol=atol,
+        )
+    sol.method = method
+    sol.sensitivities = sol.y[n:].reshape(p, n, -1)
+    sol.y = sol.y[:n]
+    return sol
+
+
+def fit(model, protocol, times, concentrations, parameters=None, method='auto', **options):
+    """Fits the parameters of a model to measured plasma (central
+    compartment) concentrations by nonlinear least squares.
+
+    The exact Jacobian of the residuals is given to
+    scipy.optimize.least_squares from the forward sensitivities (see
+    :func:`sensitivities`), so each iteration costs a single solve
+    instead of one per parameter for finite differences. Parameters are
+    fitted on a log scale, which keeps them positive.
+
+    Args:
+        model: A Model giving the initial values of the parameters, and
+            the values of any which are not fitted.
+        protocol: The Protocol under which the concentrations were
+            measured.
+        times: The sorted times of the measurements, within the
+            protocol time.
+        concentrations: The measured concentrations at those times.
+        parameters: An optional list of the names of the parameters to
+            fit, by default all of them, see :func:`parameter_names`.
+        method: The solver method, see :meth:`pkmodel.Model.solve`.
+        **options: Further options passed to least_squares.
+
+    Returns:
+        The result of least_squares, with the attributes model, the
+        fitted Model, and parameters, a dict of the fitted values.
+
+    Raises:
+        TypeError: If model or protocol are of the wrong type.
+        ValueError: If the measurements do not match, or a fitted
+            parameter is unknown or has an initial value of 0.
+    """
+    # Argument validation
+    if not isinstance(model, pk.Model):
+        raise TypeError('model must be type pk.Model.')
+    times = numpy.asarray(times, dtype=float)
+    concentrations = numpy.asarray(concentrations, dtype=float)
+    if times.ndim != 1 or times.shape != concentrations.shape:
+        raise ValueError('times and concentrations must be 1 dimensional arrays of the same length.')
+    parameters = parameter_names(model) if parameters is None else list(parameters)
+    _check_names(model, parameters)
+    initial = numpy.array([_get(model, name) for name in parameters])
+    if numpy.any(initial <= 0):
+        raise ValueError('the initial values of fitted parameters must be greater than 0.')
+    c = 0 if model.k_a is None else 1
+    v_c = numpy.array([name == 'v_c' for name in parameters])
+    solved = {}
+
+    def solve(x):
+        # least_squares evaluates the residuals and their Jacobian at
+        # the same point, which share a single solve
+        key = x.tobytes()
+        if key not in solved:
+            solved.clear()
+            values = numpy.exp(x)
+            trial = with_parameters(model, dict(zip(parameters, values)))
+            sol = sensitivities(trial, protocol, parameters, method, times)
+            volume = trial.volumes[0]
+            conc = sol.y[c] / volume
+            # dC/dp = S_c / V_c, less C / V_c for p = V_c, and
+            # dC/dlog(p) = p dC/dp
+            dconc = (sol.sensitivities[:, c] / volume - numpy.outer(v_c, conc / volume)) * values[:, None]
+            solved[key] = conc - concentrations, dconc.T
+        return solved[key]
+
+    result = scipy.optimize.least_squares(
+        lambda x: solve(x)[0], numpy.log(initial), jac=lambda x: solve(x)[1], **options)
+    result.parameters = dict(zip(parameters, numpy.exp(result.x).tolist()))
+    result.model = with_parameters(model, result.parameters)
+    return result
+
+
+def _check_names(model, parameters):
+    unknown = set(parameters) - set(parameter_names(model))
+    if unknown:
+        raise ValueError('unknown parameters: {0}.'.format(', '.join(sorted(unknown))))
+
+
+def _get(model, name):
+    if name == 'k_a':
+        return model.k_a
+    array = model.volumes if name[0] == 'v' else model.transition_rates
+    return float(array[_index(name)])
+
+
+def _index(name):
+    """Returns the index of the compartment of a volume or rate.
+    """
+    return 0 if name in ['v_c', 'cl'] else int(name[3:])
+
+
+def _derivative(model, A, name):
+    """Returns the derivative of the rate matrix A with respect to a
+    parameter.
+    """
+    c = 0 if model.k_a is None else 1
+    dA = numpy.zeros(A.shape)
+    if name == 'k_a':
+        dA[0, 0], dA[c, 0] = -1.0, 1.0
+        return dA
+    i = _index(name)
+    volume = model.volumes[i]
+    if name[0] == 'v':
+        # Every rate out of a compartment is proportional to 1 / volume
+        dA[:, c + i] = -A[:, c + i] / volume
+    elif i == 0:
+        dA[c, c] = -1.0 / volume
+    else:
+        v_c, p = model.volumes[0], c + i
+        dA[c, c], dA[p, c] = -1.0 / v_c, 1.0 / v_c
+        dA[p, p], dA[c, p] = -1.0 / volume, 1.0 / volume
+    return dA
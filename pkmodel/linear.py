@@ -0,0 +1,163 @@
+import numpy
+import scipy.linalg
+
+
+class LinearSystem:
+    """Exact solution of the linear compartment system
+    dq/dt = A q + inputs, as produced by :meth:`pkmodel.Model.compile`.
+
+    The rate matrix is eigendecomposed once, A = V diag(w) V^-1, so
+    that the response to any bolus dose or constant-rate infusion can
+    be evaluated at arbitrary times by superposition. If the rate
+    matrix is defective (or close to it, e.g. when k_a equals an
+    elimination rate) the eigenvectors cannot be trusted, and the
+    solution is instead stepped between consecutive time points using
+    the matrix exponential.
+
+    Attributes:
+        A: The (n, n) rate matrix.
+        eigenvalues: The eigenvalues w of A.
+        eigenvectors: The matrix V whose columns are eigenvectors of A.
+        defective: Whether the eigendecomposition was rejected.
+    """
+
+    # Largest condition number of V for which superposition is used
+    max_condition = 1e8
+
+    def __init__(self, A):
+        A = numpy.asarray(A, dtype=float)
+        if A.ndim != 2 or A.shape[0] != A.shape[1]:
+            raise ValueError('A must be a square matrix.')
+        self.A = A
+        w, V = numpy.linalg.eig(A)
+        if numpy.all(numpy.abs(w.imag) == 0):
+            w, V = w.real, V.real
+        self.eigenvalues = w
+        self.eigenvectors = V
+        self.defective = numpy.linalg.cond(V) > self.max_condition
+        if not self.defective:
+            self._inverse = numpy.linalg.inv(V)
+
+    @property
+    def n_states(self) -> int:
+        return self.A.shape[0]
+
+    def solve(self, t, y0=None, boluses=(), infusions=()):
+        """Evaluates the solution at the requested times.
+
+        Boluses add their amount to a state instantaneously, and the
+        solution is right-continuous, so a bolus given at one of the
+        requested times is included at that time. Infusions add a
+        constant rate to a state over [start, stop).
+
+        Args:
+            t: Array of times >= 0 at which to evaluate the solution.
+            y0: Optional initial state at t=0, zero by default.
+            boluses: Sequence of (time, amount, state) tuples.
+            infusions: Sequence of (start, stop, rate, state) tuples.
+
+        Returns:
+            A (n_states, len(t)) array of drug quantities.
+        """
+        t = numpy.asarray(t, dtype=float)
+        if numpy.any(t < 0):
+            raise ValueError('t must be greater than or equal to 0.')
+        y0 = numpy.zeros(self.n_states) if y0 is None else numpy.asarray(y0, dtype=float)
+        boluses = [(0.0, 1.0, y0)] + [(time, amount, state) for time, amount, state in boluses]
+        if self.defective:
+            return self._solve_stepwise(t, boluses, infusions)
+        return self._solve_superposition(t, boluses, infusions)
+
+    def _inputs(self, states):
+        """Returns the eigenbasis coordinates of each input, given as
+        either a state index or a full state vector.
+        """
+        columns = []
+        for state in states:
+            if numpy.ndim(state) == 0:
+                columns.append(self._inverse[:, state])
+            else:
+                columns.append(self._inverse @ state)
+        return numpy.array(columns).reshape(len(columns), self.n_states)
+
+    def _solve_superposition(self, t, boluses, infusions):
+        w = self.eigenvalues
+        z = numpy.zeros((len(t), self.n_states), dtype=w.dtype)
+        # Bolus responses, V exp(w (t - t_k)) V^-1 e_k a_k
+        times, amounts, states = zip(*boluses)
+        times = numpy.array(times, dtype=float)
+        inputs = self._inputs(states) * numpy.array(amounts, dtype=float)[:, None]
+        dt = t[None, :] - times[:, None]
+        decay = numpy.exp(w * numpy.maximum(dt, 0)[..., None])
+        z += numpy.sum((dt >= 0)[..., None] * decay * inputs[:, None, :], axis=0)
+        # Infusion responses, V exp(w (t - m)) phi(w, m - s) V^-1 e_k r_k
+        # where m = min(t, stop) and phi(w, h) = (exp(w h) - 1) / w
+        if len(infusions):
+            starts, stops, rates, states = zip(*infusions)
+            starts = numpy.array(starts, dtype=float)
+            stops = numpy.array(stops, dtype=float)
+            inputs = self._inputs(states) * numpy.array(rates, dtype=float)[:, None]
+            m = numpy.clip(t[None, :], starts[:, None], stops[:, None])
+            h = (m - starts[:, None])[..., None]
+            # Before an infusion starts h is 0, and the decay is clamped
+            # so that it does not overflow
+            decay = numpy.exp(w * numpy.maximum(t[None, :] - m, 0)[..., None])
+            z += numpy.sum(decay * _phi(w, h) * inputs[:, None, :], axis=0)
+        y = self.eigenvectors @ z.T
+        return y.real if numpy.iscomplexobj(y) else y
+
+    def _solve_stepwise(self, t, boluses, infusions):
+        n = self.n_states
+        order = numpy.argsort(t)
+        # Every time at which the input changes, or output is required
+        breaks = set(t.tolist())
+        breaks.update(time for time, _, _ in boluses)
+        for start, stop, _, _ in infusions:
+            breaks.update([start, stop])
+        breaks = sorted(b for b in breaks if 0 <= b <= t.max(initial=0))
+        y = numpy.zeros((n, len(t)))
+        q = numpy.zeros(n)
+        previous = 0.0
+        i = 0
+        for time in breaks:
+            rate = numpy.zeros(n)
+            for start, stop, r, state in infusions:
+                if start <= previous < stop:
+                    rate += r * self._unit(state)
+            q = self._step(q, rate, time - previous)
+            for bolus_time, amount, state in boluses:
+                if bolus_time == time:
+                    q += amount * self._unit(state)
+            while i < len(t) and t[order[i]] == time:
+                y[:, order[i]] = q
+                i += 1
+            previous = time
+        return y
+
+    def _unit(self, state):
+        """Returns the input vector for a state index or vector.
+        """
+        if numpy.ndim(state) == 0:
+            e = numpy.zeros(self.n_states)
+            e[state] = 1.0
+            return e
+        return numpy.asarray(state, dtype=float)
+
+    def _step(self, q, rate, dt):
+        """Advances q by dt under a constant input rate, using the
+        matrix exponential of the augmented system [[A, rate], [0, 0]].
+        """
+        n = self.n_states
+        if dt == 0:
+            return q.copy()
+        M = numpy.zeros((n + 1, n + 1))
+        M[:n, :n] = self.A
+        M[:n, n] = rate
+        return (scipy.linalg.expm(M * dt) @ numpy.append(q, 1.0))[:n]
+
+
+def _phi(w, h):
+    """Returns (exp(w h) - 1) / w, taking the limit h when w is 0.
+    """
+    safe = numpy.where(w == 0, 1, w)
+    return numpy.where(w == 0, h, numpy.expm1(w * h) / safe)
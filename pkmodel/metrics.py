@@ -0,0 +1,203 @@
+"""Summary metrics of PK solutions, computed incrementally from the
+solver's steps so that the trajectory is never stored, see
+:meth:`pkmodel.Model.metrics` and :meth:`pkmodel.Population.metrics`.
+"""
+import scipy.optimize
+import numpy
+
+
+# Each step is sampled at this many subintervals to locate maxima and
+# threshold crossings, which are then refined on the step's interpolant
+SUBINTERVALS = 8
+
+# Iterations of the golden section and bisection searches, which shrink
+# the bracket to below 1e-8 of the step size
+ITERATIONS = 40
+
+# Gauss-Legendre nodes and weights on [-1, 1], which integrate the
+# polynomial interpolants of all solve_ivp methods exactly
+_NODES, _WEIGHTS = numpy.polynomial.legendre.leggauss(4)
+
+_GOLDEN = (numpy.sqrt(5) - 1) / 2
+
+# The interpolants of all solve_ivp methods are polynomials of degree
+# at most 12 (LSODA's highest order), so each step's interpolant is
+# recovered exactly from its values at DEGREE + 1 Chebyshev points
+DEGREE = 12
+_CHEBYSHEV = numpy.cos(numpy.pi * (numpy.arange(DEGREE + 1) + 0.5) / (DEGREE + 1))
+_TO_COEFFICIENTS = numpy.linalg.inv(numpy.polynomial.chebyshev.chebvander(_CHEBYSHEV, DEGREE))
+
+
+class Metrics:
+    """Accumulates the summary metrics of the concentration in one
+    compartment of each of a batch of patients, one solver step at a
+    time.
+
+    Args:
+        n_patients: The number of patients.
+        threshold: An optional concentration for the time above it, or
+            an array of one per patient.
+        dose_times: The times of the doses, at which troughs are taken.
+        auc: 'exact' to integrate the solver's interpolant exactly, or
+            'trapezoid' to apply the trapezoid rule to the solver's steps.
+    """
+    def __init__(self, n_patients, threshold=None, dose_times=(), auc='exact'):
+        if auc not in ['exact', 'trapezoid']:
+            raise ValueError("auc must be 'exact' or 'trapezoid'.")
+        if threshold is not None:
+            threshold = numpy.broadcast_to(numpy.asarray(threshold, dtype=float), (n_patients,))
+        self.threshold = threshold
+        self.dose_times = numpy.unique([t for t in dose_times if t > 0])
+        self.exact = auc == 'exact'
+        self.cmax = numpy.full(n_patients, -numpy.inf)
+        self.tmax = numpy.zeros(n_patients)
+        self.auc = numpy.zeros(n_patients)
+        self.time_above = numpy.zeros(n_patients)
+        self.troughs = numpy.full((n_patients, len(self.dose_times)), numpy.nan)
+
+    def add(self, t0, t1, conc):
+        """Adds a step of the solution.
+
+        Args:
+            t0: The start time of the step.
+            t1: The end time of the step.
+            conc: A function conc(t) giving the (n_patients, len(t))
+                concentrations at an array of times in [t0, t1].
+        """
+        if t1 <= t0:
+            self._update_max(numpy.full(len(self.cmax), t1), conc(numpy.array([t1]))[:, 0])
+            return
+        tau = numpy.linspace(t0, t1, SUBINTERVALS + 1)
+        c = conc(tau)
+        if self.exact:
+            half = (t1 - t0) / 2
+            self.auc += half * conc(t0 + half * (_NODES + 1)) @ _WEIGHTS
+        else:
+            self.auc += (t1 - t0) * (c[:, 0] + c[:, -1]) / 2
+        pointwise = _Pointwise(conc, t0, t1)
+        self._add_max(tau, c, pointwise)
+        if self.threshold is not None:
+            self._add_time_above(tau, c, pointwise)
+        k = numpy.searchsorted(self.dose_times, t1)
+        if k < len(self.dose_times) and self.dose_times[k] == t1:
+            # The step ends before the dose is given
+            self.troughs[:, k] = c[:, -1]
+
+    def result(self):
+        """Returns the metrics as an OptimizeResult with attributes
+        cmax, tmax, auc, troughs (at each of trough_times) and, with a
+        threshold, time_above.
+        """
+        result = scipy.optimize.OptimizeResult(
+            cmax=self.cmax, tmax=self.tmax, auc=self.auc, troughs=self.troughs,
+            trough_times=self.dose_times,
+        )
+        if self.threshold is not None:
+            result.time_above = self.time_above
+        return result
+
+    def _update_max(self, t, c):
+        better = c > self.cmax
+        self.cmax[better] = c[better]
+        self.tmax[better] = t[better]
+
+    def _add_max(self, tau, c, pointwise):
+        i = numpy.argmax(c, axis=1)
+        patients = numpy.arange(len(c))
+        best = c[patients, i]
+        # Interior maxima of the samples are refined on the interpolant
+        interior = (i > 0) & (i < len(tau) - 1) & (best > self.cmax)
+        t = tau[i]
+        if interior.any():
+            p = patients[interior]
+            t[p], best[p] = _golden_max(pointwise, p, tau[i[p] - 1], tau[i[p] + 1])
+        self._update_max(t, best)
+
+    def _add_time_above(self, tau, c, pointwise):
+        above = c >= self.threshold[:, None]
+        dt = numpy.diff(tau)
+        # Subintervals entirely above, and those which cross
+        self.time_above += (above[:, :-1] & above[:, 1:]) @ dt
+        patients, j = numpy.nonzero(above[:, :-1] != above[:, 1:])
+        if len(patients):
+            t = _bisect(pointwise, patients, tau[j], tau[j + 1], self.threshold[patients], above[patients, j])
+            rising = ~above[patients, j]
+            numpy.add.at(self.time_above, patients, numpy.where(rising, tau[j + 1] - t, t - tau[j]))
+
+
+class _Pointwise:
+    """Evaluates the concentration of each of a subset of patients at
+    its own time within a step, in time and memory linear in the number
+    of patients.
+
+    The step's interpolant is evaluated once for all patients, on the
+    first call, at Chebyshev points, from which the coefficients of each
+    patient's polynomial are recovered.
+    """
+    def __init__(self, conc, t0, t1):
+        self.conc = conc
+        self.t0 = t0
+        self.t1 = t1
+        self.coefficients = None
+
+    def __call__(self, patients, t):
+        if self.coefficients is None:
+            half = (self.t1 - self.t0) / 2
+            values = self.conc(self.t0 + half * (_CHEBYSHEV + 1))
+            self.coefficients = _TO_COEFFICIENTS @ values.T
+        x = (2 * t - self.t0 - self.t1) / (self.t1 - self.t0)
+        return numpy.polynomial.chebyshev.chebval(x, self.coefficients[:, patients], tensor=False)
+
+
+def _golden_max(pointwise, patients, a, b):
+    """Maximizes each patient's concentration over [a, b] by golden
+    section search.
+    """
+    x1, x2 = b - _GOLDEN * (b - a), a + _GOLDEN * (b - a)
+    f1, f2 = pointwise(patients, x1), pointwise(patients, x2)
+    for _ in range(ITERATIONS):
+        # Keep [a, x2] if the maximum is left of x2, else [x1, b], and
+        # reuse the remaining interior point
+        left = f1 > f2
+        a, b = numpy.where(left, a, x1), numpy.where(left, x2, b)
+        x1, x2 = numpy.where(left, b - _GOLDEN * (b - a), x2), numpy.where(left, x1, a + _GOLDEN * (b - a))
+        f_new = pointwise(patients, numpy.where(left, x1, x2))
+        f1, f2 = numpy.where(left, f_new, f2), numpy.where(left, f1, f_new)
+    t = (a + b) / 2
+    return t, pointwise(patients, t)
+
+
+def _bisect(pointwise, patients, a, b, threshold, above_a):
+    """Finds the time in [a, b] at which each patient's concentration
+    crosses the threshold.
+    """
+    for _ in range(ITERATIONS):
+        m = (a + b) / 2
+        same = (pointwise(patients, m) >= threshold) == above_a
+        a, b = numpy.where(same, m, a), numpy.where(same, b, m)
+    return (a + b) / 2
+
+
+def summarize(solver_steps, n_states, state, volume, threshold=None, dose_times=(), auc='exact'):
+    """Computes the metrics of the concentration in one state of a
+    batch of patients from the steps of a solve.
+
+    Args:
+        solver_steps: The steps of a solve, see :func:`pkmodel.model.steps`,
+            of a state vector of the n_states states of each patient.
+        n_states: The number of states of each patient.
+        state: The index of the state.
+        volume: The volume of that compartment, an array with one
+            value per patient.
+        threshold: An optional concentration for the time above it.
+        dose_times: The times of the doses, at which troughs are taken.
+        auc: 'exact' or 'trapezoid', see :class:`Metrics`.
+
+    Returns:
+        The metrics, see :meth:`Metrics.result`.
+    """
+    volume = numpy.atleast_1d(volume)[:, None]
+    metrics = Metrics(len(volume), threshold, dose_times, auc)
+    for t_old, t, interpolant, _ in solver_steps:
+        metrics.add(t_old, t, lambda s: interpolant(s).reshape(len(volume), n_states, -1)[:, state] / volume)
+    return metrics.result()
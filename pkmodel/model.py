@@ -1,15 +1,448 @@
 import pkmodel as pk
+import itertools
 import scipy.integrate
-import matplotlib.pylab as plt
+import scipy.optimize
+import scipy.sparse
 import numpy
 
 
+# solve_ivp methods which make use of a Jacobian
+IMPLICIT_METHODS = ('Radau', 'BDF', 'LSODA')
+
+# The scipy.integrate OdeSolvers which solve_ivp methods refer to
+SOLVERS = ('RK23', 'RK45', 'DOP853', 'Radau', 'BDF', 'LSODA')
+
+# Models with at least this many states are solved with a sparse rate
+# matrix and Jacobian
+SPARSE_STATES = 64
+
+# With method='auto', systems whose fastest mode needs more than
+# STIFF_STEPS explicit steps to remain stable are solved implicitly, with
+# LSODA if the ratio of the fastest to the slowest mode is below
+# STIFF_RATIO and otherwise with Radau (BDF for large, sparse systems).
+# Batches of rate matrices use BDF instead of LSODA, which only accepts
+# a dense Jacobian
+STIFF_STEPS = 500
+STIFF_RATIO = 1e4
+
+# The absolute tolerance of method='auto', relative to the largest dose
+AUTO_ATOL = 1e-6
+
+
+# The flows of a model without flows
+_NO_FLOW_NODES = numpy.zeros((2, 0), dtype=int)
+_NO_FLOW_NODES.flags.writeable = False
+_NO_FLOW_RATES = numpy.zeros(0)
+_NO_FLOW_RATES.flags.writeable = False
+
+
+def stiffness(A, time):
+    """Estimates the stiffness of the linear system dy/dt = A y over
+    [0, time] from the eigenvalues of A.
+
+    Args:
+        A: A rate matrix, or an array of rate matrices (e.g. one per
+            patient), or a scipy.sparse matrix.
+        time: The length of the integration.
+
+    Returns:
+        A tuple (span, ratio), where span is time times the fastest
+        decay rate, proportional to the number of steps an explicit
+        method needs to remain stable, and ratio is the fastest divided
+        by the slowest nonzero decay rate. For an array of rate
+        matrices the span is that of the fastest matrix, and the ratio
+        the largest ratio of any one matrix, as each is stiff on its
+        own only if its own rates differ widely. For a sparse matrix the
+        fastest rate is bounded by Gershgorin's theorem, and the ratio
+        is not estimated (inf).
+    """
+    if scipy.sparse.issparse(A):
+        fastest = abs(A).sum(axis=1).max()
+        return time * fastest, numpy.inf
+    rates = numpy.abs(numpy.linalg.eigvals(A).real).reshape(-1, numpy.shape(A)[-1])
+    fastest = rates.max(axis=1)
+    # Rates which are zero up to rounding are ignored
+    nonzero = rates > 1e-12 * numpy.maximum(fastest, 1)[:, None]
+    if not nonzero.any():
+        return 0.0, 1.0
+    slowest = numpy.where(nonzero, rates, numpy.inf).min(axis=1)
+    ratios = fastest[nonzero.any(axis=1)] / slowest[nonzero.any(axis=1)]
+    return time * fastest.max(), float(ratios.max())
+
+
+def choose_method(A, time):
+    """Returns the solver method used by method='auto': 'RK45' if the
+    system is not stiff, otherwise 'LSODA', 'Radau' or 'BDF' (see
+    :data:`STIFF_STEPS` and :data:`STIFF_RATIO`). An array of rate
+    matrices is never solved with LSODA, whose dense Jacobian of the
+    stacked system grows with the square of the batch size.
+
+    Args:
+        A: A rate matrix, or an array of rate matrices, or a
+            scipy.sparse matrix.
+        time: The length of the integration.
+    """
+    span, ratio = stiffness(A, time)
+    if span < STIFF_STEPS:
+        return 'RK45'
+    if ratio < STIFF_RATIO:
+        return 'BDF' if numpy.ndim(A) == 3 else 'LSODA'
+    return 'BDF' if scipy.sparse.issparse(A) else 'Radau'
+
+
+def resolve_method(A, protocols, method):
+    """Returns the solver method and absolute tolerance of a solve.
+
+    Args:
+        A: The rate matrix or matrices, see :func:`choose_method`.
+        protocols: The list of protocols being solved.
+        method: A solver method, or 'auto' to choose it from the
+            stiffness of A, with an absolute tolerance of
+            :data:`AUTO_ATOL` times the largest dose.
+
+    Returns:
+        A tuple (method, atol).
+    """
+    if method != 'auto':
+        return method, 1e-6
+    amounts = [p.initial_dose for p in protocols] + [d.amount for p in protocols for d in p.doses]
+    return choose_method(A, protocols[0].time), AUTO_ATOL * (max(amounts) or 1.0)
+
+
+def constant_jacobian(A, method):
+    """Returns the Jacobian of a linear system dy/dt = A y + f(t) in the
+    form passed to solve_ivp.
+
+    Args:
+        A: The rate matrix, a numpy array or scipy.sparse matrix.
+        method: The solver method.
+
+    Returns:
+        A callable jac(t, y) returning A (dense for LSODA) for the
+        implicit methods, or None for the explicit methods, which do
+        not use a Jacobian.
+    """
+    if method not in IMPLICIT_METHODS:
+        return None
+    if method == 'LSODA' and scipy.sparse.issparse(A):
+        # LSODA only accepts a dense Jacobian
+        A = A.toarray()
+    return lambda t, y: A
+
+
+def check_analytic(protocol):
+    """Checks that a protocol can be solved with method='analytic'.
+
+    Args:
+        protocol: The Protocol.
+
+    Raises:
+        ValueError: If the protocol has a dose_func other than a
+            piecewise-constant DoseTable.
+    """
+    if protocol.continuous_dose_func is not pk.protocol.no_dose:
+        raise ValueError('the analytic method requires a protocol without a dose_func, '
+                         'or with a piecewise-constant DoseTable.')
+
+
+def integrate(fun, y0, time, t_eval, method='RK45', jac=None, boluses=(), infusions=(), breakpoints=(),
+              atol=1e-6, t0=0.0, first_step=None, rtol=1e-3):
+    """Integrates dy/dt = fun(t, y) from t0 to time with scipy's
+    solve_ivp, restarting the integration at every dosing event.
+
+    Between events the infusion rates are constant, so the solver
+    never has to step across a discontinuity. Boluses are applied as
+    jumps in the state, and the solution is right-continuous, so a
+    bolus given at one of the t_eval times is included at that time.
+
+    Args:
+        fun: The rhs, fun(t, y).
+        y0: The initial state, at t0.
+        time: The end time of the integration.
+        t_eval: Sorted times in [t0, time] at which to store the
+            solution.
+        method: The integration method passed to solve_ivp.
+        jac: An optional Jacobian passed to solve_ivp.
+        boluses: Sequence of (time, amount, state) tuples, where state
+            indexes y.
+        infusions: Sequence of (start, stop, rate, state) tuples.
+        breakpoints: Further times at which fun is discontinuous.
+        atol: The absolute tolerance of the solver.
+        t0: The start time of the integration. Boluses given at t0 are
+            added to y0.
+        first_step: An optional size of the first step, e.g. the last
+            step of an earlier integration which is being continued.
+        rtol: The relative tolerance of the solver.
+
+    Returns:
+        A solution with the same attributes as returned by solve_ivp,
+        summing the evaluation counts over all segments, an array
+        step_sizes of the size of each accepted step, and y_end, the
+        state at time.
+    """
+    t_eval = numpy.asarray(t_eval, dtype=float)
+    if numpy.any(t_eval < t0) or numpy.any(t_eval > time) or numpy.any(numpy.diff(t_eval) < 0):
+        raise ValueError('t_eval must be sorted and within the protocol time.')
+    breaks = restart_times(time, boluses, infusions, breakpoints, t0)
+    options = {'atol': atol, 'rtol': rtol} if jac is None else {'atol': atol, 'rtol': rtol, 'jac': jac}
+    y = numpy.array(y0, dtype=float)
+    ys = []
+    step_sizes = []
+    sol = scipy.optimize.OptimizeResult(
+        t=t_eval, y=None, sol=None, t_events=None, y_events=None,
+        nfev=0, njev=0, nlu=0, status=0, success=True,
+        message='The solver successfully reached the end of the integration interval.',
+    )
+    for a, c in zip(breaks[:-1], breaks[1:]):
+        apply_boluses(y, boluses, a)
+        f = _add_infusions(fun, infusions, a, len(y))
+        if first_step is not None and a == t0:
+            options['first_step'] = min(first_step, c - a)
+        segment = scipy.integrate.solve_ivp(f, [a, c], y, method=method, dense_output=True, **options)
+        options.pop('first_step', None)
+        for key in ['nfev', 'njev', 'nlu']:
+            sol[key] += segment[key]
+        step_sizes.append(numpy.diff(segment.t))
+        if not segment.success:
+            sol.update(status=segment.status, success=False, message=segment.message)
+            break
+        t = t_eval[(t_eval >= a) & ((t_eval < c) | (c == time))]
+        ys.append(segment.sol(t) if len(t) else numpy.zeros((len(y), 0)))
+        y = segment.y[:, -1].copy()
+    sol.y = numpy.concatenate(ys, axis=1) if ys else numpy.zeros((len(y), 0))
+    sol.step_sizes = numpy.concatenate(step_sizes) if step_sizes else numpy.zeros(0)
+    applied = sol.success and apply_boluses(y, boluses, time)
+    if len(breaks) == 1:
+        # t0 is the end time, so every sample is the state at that time
+        sol.y = numpy.repeat(y[:, None], len(t_eval), axis=1)
+    elif applied and len(t_eval) and t_eval[-1] == time:
+        sol.y[:, -1] = y
+    sol.y_end = y
+    return sol
+
+
+def steps(fun, y0, time, method='RK45', jac=None, boluses=(), infusions=(), breakpoints=(), atol=1e-6,
+          rtol=1e-3):
+    """Integrates dy/dt = fun(t, y) from 0 to time one solver step at a
+    time, restarting at every dosing event as in :func:`integrate`.
+
+    Only the current step is held in memory, so arbitrarily long
+    horizons can be integrated in constant memory.
+
+    Args:
+        fun: The rhs, fun(t, y).
+        y0: The initial state.
+        time: The end time of the integration.
+        method: The name of a scipy.integrate OdeSolver, e.g. 'RK45'.
+        jac: An optional Jacobian passed to the solver.
+        boluses: Sequence of (time, amount, state) tuples.
+        infusions: Sequence of (start, stop, rate, state) tuples.
+        breakpoints: Further times at which fun is discontinuous.
+        atol: The absolute tolerance of the solver.
+        rtol: The relative tolerance of the solver.
+
+    Yields:
+        Tuples (t_old, t, interpolant, end) for each step, where
+        interpolant is the solver's dense output over [t_old, t] and
+        end is the time of the next dosing event. A final tuple
+        (time, time, interpolant, inf) gives the state at the end time,
+        including any boluses given at that time.
+
+    Raises:
+        ValueError: If method is not a scipy.integrate OdeSolver.
+        RuntimeError: If the solver fails.
+    """
+    if method not in SOLVERS:
+        raise ValueError('method must be one of {0}.'.format(', '.join(SOLVERS)))
+    options = {'atol': atol, 'rtol': rtol} if jac is None else {'atol': atol, 'rtol': rtol, 'jac': jac}
+    y = numpy.array(y0, dtype=float)
+    breaks = restart_times(time, boluses, infusions, breakpoints)
+    for a, c in zip(breaks[:-1], breaks[1:]):
+        apply_boluses(y, boluses, a)
+        f = _add_infusions(fun, infusions, a, len(y))
+        solver = getattr(scipy.integrate, method)(f, a, y, c, **options)
+        while solver.status == 'running':
+            message = solver.step()
+            if solver.status == 'failed':
+                raise RuntimeError(message)
+            yield solver.t_old, solver.t, solver.dense_output(), c
+        y = solver.y.copy()
+    apply_boluses(y, boluses, time)
+    yield time, time, lambda t: numpy.multiply.outer(y, numpy.ones_like(t)), numpy.inf
+
+
+def restart_times(time, boluses, infusions, breakpoints, t0=0.0):
+    """Returns the times at which :func:`integrate` restarts the
+    integration: t0, time, and every dosing event and breakpoint
+    between them.
+
+    Args:
+        time: The end time of the integration.
+        boluses: Sequence of (time, amount, state) tuples.
+        infusions: Sequence of (start, stop, rate, state) tuples.
+        breakpoints: Further times at which the rhs is discontinuous.
+        t0: The start time of the integration.
+
+    Returns:
+        The sorted list of times in [t0, time].
+    """
+    breaks = {float(t0), time}
+    breaks.update(float(t) for t in breakpoints if t0 < t < time)
+    breaks.update(t for t, _, _ in boluses if t0 < t < time)
+    for start, stop, _, _ in infusions:
+        breaks.update(t for t in [start, stop] if t0 < t < time)
+    return sorted(breaks)
+
+
+def apply_boluses(y, boluses, time):
+    """Adds the boluses given at a time to a state in place.
+
+    Args:
+        y: The state, a 1d array.
+        boluses: Sequence of (time, amount, state) tuples, where state
+            indexes y.
+        time: The time of the boluses to add.
+
+    Returns:
+        Whether any boluses were given at time.
+    """
+    applied = False
+    for t, amount, state in boluses:
+        if t == time:
+            y[state] += amount
+            applied = True
+    return applied
+
+
+def infusion_rates(infusions, time, n):
+    """Returns the total rate of the infusions active from a time until
+    the next infusion starts or stops.
+
+    Args:
+        infusions: Sequence of (start, stop, rate, state) tuples.
+        time: The time.
+        n: The number of states.
+
+    Returns:
+        An array of the rate into each of the n states.
+    """
+    rate = numpy.zeros(n)
+    for start, stop, r, state in infusions:
+        if start <= time < stop:
+            rate[state] += r
+    return rate
+
+
+def _sorted_times(t_eval, time):
+    """Iterates over t_eval, checking that it is sorted and within
+    [0, time].
+    """
+    previous = 0.0
+    for t in t_eval:
+        t = float(t)
+        if t < previous or t > time:
+            raise ValueError('t_eval must be sorted and within the protocol time.')
+        previous = t
+        yield t
+
+
+def _sample_chunks(solver_steps, times, chunk_size):
+    """Evaluates the solver steps at the sample times, yielding chunks of
+    up to chunk_size samples.
+    """
+    t_chunk, y_chunk = [], []
+    s = next(times, None)
+    for t_old, t, interpolant, end in solver_steps:
+        # Samples at a dosing event belong to the step after it
+        while s is not None and t_old <= s <= t and s < end:
+            t_chunk.append(s)
+            y_chunk.append(interpolant(s))
+            if len(t_chunk) == chunk_size:
+                yield numpy.array(t_chunk), numpy.array(y_chunk).T
+                t_chunk, y_chunk = [], []
+            s = next(times, None)
+    if t_chunk:
+        yield numpy.array(t_chunk), numpy.array(y_chunk).T
+
+
+def _dense_chunks(solver_steps, chunk_size):
+    """Groups the interpolants of the solver steps into OdeSolutions of
+    up to chunk_size steps.
+    """
+    ts, interpolants = [], []
+    for t_old, t, interpolant, _ in solver_steps:
+        if t_old == t:
+            continue
+        if not ts or ts[-1] != t_old:
+            ts.append(t_old)
+        ts.append(t)
+        interpolants.append(interpolant)
+        if len(interpolants) == chunk_size:
+            yield scipy.integrate.OdeSolution(ts, interpolants)
+            ts, interpolants = [], []
+    if interpolants:
+        yield scipy.integrate.OdeSolution(ts, interpolants)
+
+
+def _add_infusions(fun, infusions, time, n):
+    """Returns the rhs with the infusion rates active from time added.
+    """
+    rate = infusion_rates(infusions, time, n)
+    if not rate.any():
+        return fun
+
+    def f(t, y):
+        return fun(t, y) + rate
+    return f
+
+
+def _cycles_to_steady_state(Phi, trough, state, fraction):
+    """Returns the number of cycles from the first dose after which the
+    drug quantity in a state at the start of every cycle is at least
+    fraction of its steady-state trough.
+
+    The quantity at the start of cycle k + 1 falls short of the trough
+    by Phi^k trough, whose total never increases, as the rate matrix
+    only moves and eliminates drug. Once that total is within the
+    tolerance, so is the state's shortfall in every later cycle.
+    """
+    tolerance = (1 - fraction) * trough[state]
+    if tolerance <= 0:
+        return 1
+    deficit = Phi @ trough
+    cycles = 1
+    k = 1
+    while deficit.sum() > tolerance:
+        if deficit[state] > tolerance:
+            cycles = k + 1
+        deficit = Phi @ deficit
+        k += 1
+    return cycles
+
+
 class Model:
     """A Pharmokinetic (PK) model class which takes in a central
     compartment, and a list of peripheral compartments and other
     relevant information with which to build a PK model. The user can
     then sovle and visualise this PK model using a dosing protocol.
 
+    The compartment parameters are copied into a single array, so a
+    model holds no Compartment objects, and its compiled rate matrix
+    is cached until the model is changed. Changing a Compartment after
+    it was passed to the model does not change the model; use
+    :meth:`set_compartment` instead.
+
+    Besides the exchange of each peripheral compartment with the
+    central compartment, any directed flows between compartments can
+    be given, e.g. to build physiologically based models of many organ
+    compartments. A flow (source, target, rate) moves drug from
+    compartment source to compartment target (or out of the body, if
+    target is None) at rate [mL/h] times the source concentration.
+    Compartments are numbered 0 for the central compartment and i for
+    peripheral compartment i, and a peripheral compartment with a
+    transition_rate of 0 only takes part in the flows. Large models
+    are solved with a sparse rate matrix, see :meth:`compile`.
+
     Attributes:
         central_component: A Compartment representing the central
             compartment of the PK model.
@@ -19,8 +452,12 @@ class Model:
             case of subcontinuous dosing. The presence of this argument
             determines whether or not the dosing model is modelling
             I.V. or subcontinous dosing.
+        flows: An optional list of (source, target, rate) tuples of
+            directed flows between compartments.
     """
-    def __init__(self, central_compartment, peripheral_compartments, k_a=None):
+    __slots__ = ('_parameters', '_k_a', '_flow_nodes', '_flow_rates', '_compiled')
+
+    def __init__(self, central_compartment, peripheral_compartments, k_a=None, flows=None):
         # Argument validation
         if not isinstance(central_compartment, pk.Compartment):
             raise TypeError('central_compartment must be type pk.Compartment')
@@ -29,14 +466,24 @@ class Model:
         for c in peripheral_compartments:
             if not isinstance(c, pk.Compartment):
                 raise TypeError('each peripheral compartment must be type pk.Compartment')
-        if type(k_a) not in [float, int] and k_a is not None:
-            raise TypeError('k_a must be type pk.Compartment')
-        self.central_compartment = central_compartment
-        self.peripheral_compartments = peripheral_compartments
-        if k_a is not None:
-            self.k_a = float(k_a)
-        else:
-            self.k_a = None
+        # Column 0 is the central compartment, and column i peripheral
+        # compartment i, with rows of volumes and transition rates
+        compartments = [central_compartment] + peripheral_compartments
+        self._parameters = numpy.array(
+            [[c.volume for c in compartments], [c.transition_rate for c in compartments]])
+        # Flows as (source, target) columns, with a target of -1 for
+        # elimination, and their rates. Models without flows share the
+        # same read-only empty arrays
+        self._flow_nodes = _NO_FLOW_NODES
+        self._flow_rates = _NO_FLOW_RATES
+        self.k_a = k_a
+        if flows is not None:
+            if type(flows) is not list:
+                raise TypeError('flows must be a list of (source, target, rate) tuples.')
+            for flow in flows:
+                if type(flow) is not tuple or len(flow) != 3:
+                    raise TypeError('flows must be a list of (source, target, rate) tuples.')
+                self.add_flow(*flow)
 
     def __str__(self):
         """Returns the name of the model as a string.
@@ -45,25 +492,114 @@ class Model:
 
     @property
     def name(self) -> str:
-        # Create a string of all peripheral compartments
-        pc_str = ""
-        for c in self.peripheral_compartments:
-            pc_str = pc_str + str(c) + ", "
-        pc_str = pc_str[:-2]
-        # Piece the rest of the string together
-        if type(self.k_a) is None:
-            return 'v_c={0}, cl={1}, peripheral={2}'.format(
-                str(self.central_compartment.volume),
-                str(self.central_compartment.transition_rate),
-                pc_str,
-            )
-        else:
-            return 'v_c={0}, cl={1}, peripheral={2}, K_a={3}'.format(
-                str(self.central_compartment.volume),
-                str(self.central_compartment.transition_rate),
-                pc_str,
-                str(self.k_a),
-            )
+        pc_str = ', '.join(c.name for c in self.peripheral_compartments)
+        name = 'v_c={0}, cl={1}, peripheral={2}, K_a={3}'.format(
+            self._parameters[0, 0], self._parameters[1, 0], pc_str, self.k_a)
+        if len(self._flow_rates):
+            name += ', flows={0}'.format(len(self._flow_rates))
+        return name
+
+    @property
+    def k_a(self):
+        return self._k_a
+
+    @k_a.setter
+    def k_a(self, k_a):
+        if type(k_a) not in [float, int] and k_a is not None:
+            raise TypeError('k_a must be type pk.Compartment')
+        self._k_a = None if k_a is None else float(k_a)
+        self._compiled = None
+
+    @property
+    def central_compartment(self):
+        """A copy of the central Compartment.
+        """
+        return pk.Compartment(*self._parameters[:, 0].tolist())
+
+    @property
+    def peripheral_compartments(self) -> list:
+        """A list of copies of the peripheral Compartments.
+        """
+        return [pk.Compartment(v, q) for v, q in self._parameters[:, 1:].T.tolist()]
+
+    @property
+    def volumes(self):
+        """A read-only array of the compartment volumes, the central
+        compartment first.
+        """
+        volumes = self._parameters[0]
+        volumes.flags.writeable = False
+        return volumes
+
+    @property
+    def transition_rates(self):
+        """A read-only array of the compartment transition rates, the
+        clearance of the central compartment first.
+        """
+        rates = self._parameters[1]
+        rates.flags.writeable = False
+        return rates
+
+    def set_compartment(self, index, compartment):
+        """Replaces the parameters of a compartment in place.
+
+        Args:
+            index: 0 for the central compartment, or i for peripheral
+                compartment i.
+            compartment: A Compartment with the new parameters.
+
+        Raises:
+            TypeError: If compartment is not of type Compartment.
+            IndexError: If the model has no compartment index.
+        """
+        if not isinstance(compartment, pk.Compartment):
+            raise TypeError('compartment must be type pk.Compartment.')
+        if type(index) is not int or not 0 <= index < self._parameters.shape[1]:
+            raise IndexError('compartment index out of range.')
+        self._parameters[:, index] = compartment.volume, compartment.transition_rate
+        self._compiled = None
+
+    @property
+    def flows(self) -> list:
+        """The list of (source, target, rate) flows between
+        compartments.
+        """
+        return [
+            (source, None if target < 0 else target, rate)
+            for (source, target), rate in zip(self._flow_nodes.T.tolist(), self._flow_rates.tolist())
+        ]
+
+    def add_flow(self, source, target, rate):
+        """Adds a directed flow between two compartments.
+
+        Args:
+            source: The index of the compartment the drug flows from, 0
+                for the central compartment or i for peripheral
+                compartment i.
+            target: The index of the compartment the drug flows to, or
+                None if it is eliminated.
+            rate: The flow rate [mL/h], which multiplies the source
+                concentration.
+
+        Raises:
+            TypeError: If the arguments are not of the right type, or
+                rate is negative.
+            ValueError: If the model has no such compartments, or source
+                equals target.
+        """
+        n = self._parameters.shape[1]
+        if type(source) is not int or (target is not None and type(target) is not int):
+            raise TypeError('source and target must be compartment indices.')
+        if type(rate) not in [int, float] or rate < 0:
+            raise TypeError('rate should be a number greater than or equal to 0')
+        if not 0 <= source < n or (target is not None and not 0 <= target < n):
+            raise ValueError('model has no compartment with that index.')
+        if source == target:
+            raise ValueError('source and target must be different compartments.')
+        nodes = [[source], [-1 if target is None else target]]
+        self._flow_nodes = numpy.concatenate([self._flow_nodes, nodes], axis=1)
+        self._flow_rates = numpy.append(self._flow_rates, float(rate))
+        self._compiled = None
 
     def add_compartment(self, new_compartment):
         """Add a peripheral compartment to the PK model.
@@ -77,26 +613,130 @@ class Model:
         """
         if not isinstance(new_compartment, pk.Compartment):
             raise TypeError('new peripheral compartment must be type pk.Compartment.')
-        self.peripheral_compartments.append(new_compartment)
+        column = [[new_compartment.volume], [new_compartment.transition_rate]]
+        self._parameters = numpy.concatenate([self._parameters, column], axis=1)
+        self._compiled = None
 
     def remove_compartment(self, delete_compartment):
-        """Add a peripheral compartment to the PK model.
+        """Removes the first peripheral compartment with the same
+        parameters from the PK model. Any flows to or from the
+        compartment are removed as well.
 
         Args:
-            new_compartment: An instance of type compartment to be
+            delete_compartment: An instance of type compartment to be
                 removed from the existing list of peripheral
                 compartments in the PK model.
 
         Raises:
             TypeError: If delete_compartment is not of type
                 Compartment.
+            ValueError: If the model has no such peripheral compartment.
         """
         if not isinstance(delete_compartment, pk.Compartment):
             raise TypeError('peripheral compartment to be removed must be type pk.Compartment.')
-        if delete_compartment in self.peripheral_compartments:
-            self.peripheral_compartments.remove(delete_compartment)
-        else:
+        volumes, rates = self._parameters[:, 1:]
+        match = numpy.flatnonzero(
+            numpy.logical_and(volumes == delete_compartment.volume, rates == delete_compartment.transition_rate))
+        if len(match) == 0:
             raise ValueError('peripheral compartment is not in list of compartments for this model.')
+        index = match[0] + 1
+        self._parameters = numpy.delete(self._parameters, index, axis=1)
+        # Remove the flows of the compartment, and renumber the others
+        keep = (self._flow_nodes != index).all(axis=0)
+        nodes = self._flow_nodes[:, keep]
+        self._flow_nodes = nodes - (nodes > index)
+        self._flow_rates = self._flow_rates[keep]
+        self._compiled = None
+
+    @property
+    def n_states(self) -> int:
+        """The number of state variables (drug quantities) in the
+        model: the central compartment, one per peripheral compartment
+        and, for subcutaneous dosing, the absorption compartment.
+        """
+        n = self._parameters.shape[1]
+        if self.k_a is not None:
+            n += 1
+        return n
+
+    @property
+    def state_names(self) -> list:
+        """The names of the state variables, in the order used by
+        :meth:`compile`.
+        """
+        names = ['q_c'] + ['q_p{0}'.format(i) for i in range(1, self._parameters.shape[1])]
+        if self.k_a is not None:
+            names.insert(0, 'q_0')
+        return names
+
+    def compile(self, sparse=False):
+        """Compiles the compartment parameters into the linear system
+        dq/dt = A q + b Dose(t).
+
+        The state vector is ordered [q_c, q_p1, ..., q_pn] for I.V.
+        dosing and [q_0, q_c, q_p1, ..., q_pn] for subcutaneous dosing,
+        so that the dose always enters the first state.
+
+        The matrix is assembled from its nonzero entries, one per
+        connection between compartments, and is cached until the model
+        is changed, so the arrays are read-only.
+
+        Args:
+            sparse: Whether to return A as a scipy.sparse CSR matrix.
+
+        Returns:
+            A tuple (A, b) where A is the (n_states, n_states) rate
+            matrix and b is the dosing input vector of length n_states.
+        """
+        if self._compiled is None:
+            self._compiled = self._compile()
+        A, A_dense, b = self._compiled
+        if not sparse and A_dense is None:
+            A_dense = A.toarray()
+            A_dense.flags.writeable = False
+            self._compiled = A, A_dense, b
+        return (A if sparse else A_dense), b
+
+    def sparsity(self):
+        """Returns the sparsity pattern of the rate matrix, and so of
+        the Jacobian, as a boolean scipy.sparse CSR matrix.
+        """
+        A = self.compile(sparse=True)[0]
+        return scipy.sparse.csr_matrix((numpy.ones(A.nnz, dtype=bool), A.indices, A.indptr), shape=A.shape)
+
+    def _compile(self):
+        n = self.n_states
+        c = 0 if self.k_a is None else 1
+        volumes, rates = self._parameters
+        p = numpy.arange(1, len(volumes))
+        # Each connection moves drug from a source to a target state
+        # (-1 for elimination) at rate k times the source quantity:
+        # clearance, exchange with each peripheral and the other flows
+        flow_source, flow_target = self._flow_nodes
+        source = [[c], numpy.full(len(p), c), c + p, c + flow_source]
+        target = [[-1], c + p, numpy.full(len(p), c), numpy.where(flow_target < 0, -1, c + flow_target)]
+        k = [
+            [rates[0] / volumes[0]], rates[1:] / volumes[0], rates[1:] / volumes[1:],
+            self._flow_rates / volumes[flow_source],
+        ]
+        if self.k_a is not None:
+            source.append([0])
+            target.append([c])
+            k.append([self.k_a])
+        source, target, k = [numpy.concatenate(x) for x in [source, target, k]]
+        flows = target >= 0
+        A = scipy.sparse.coo_matrix(
+            (numpy.concatenate([-k, k[flows]]),
+             (numpy.concatenate([source, target[flows]]), numpy.concatenate([source, source[flows]]))),
+            shape=(n, n),
+        ).tocsr()
+        A.sum_duplicates()
+        A.eliminate_zeros()
+        A.data.flags.writeable = False
+        b = numpy.zeros(n)
+        b[0] = 1.0
+        b.flags.writeable = False
+        return A, None, b
 
     def rhs(self, t, q, protocol):
         """Returns the right-hand-sides of a system of equation of
@@ -106,81 +746,476 @@ class Model:
         Args:
             t: float representing the dependent variable, time in this
                 case
-            q: float representing the time-dependent variable, drug
-                quantity in this case
+            q: array of length n_states representing the
+                time-dependent variables, the drug quantity in each
+                compartment in this case
+            protocol: Protocol object providing the dose function.
 
         Returns:
-            List of equations representing the rhs of the PK model
-            given in terms of t and q.
-        """
-        eqns = []
-        q_c = q
-        q_p = q
-        q_0 = q
-        v_c = self.central_compartment.volume
-        q_c = self.central_compartment.transition_rate
-        if not self.k_a:
-            # I.V. dosing
-            dqc_dt = protocol.dose_func(t,q) - (q_c / v_c) * q_c
-        else:
-            # Subcontinuous dosing
-            dq0_dt = protocol.dose_func(t,q) - (self.k_a * q_0)
-            eqns = (dq0_dt)
-            dqc_dt = (self.k_a * q_c) - (q_c / v_c) * q_c
-        # Calculate transitions which will be used in both dqc_dt and dqp_dt
-        res_p = []
-        for pc in self.peripheral_compartments:
-            dqp_dt = pc.transition_rate * ((q_c / v_c) - (q_p / pc.volume))
-            res_p.append(dqp_dt)
-        res = dqc_dt
-        for p in res_p:
-            res += p
-        return res
+            Array representing the rhs of the PK model given in terms
+            of t and q.
+        """
+        A, b = self.compile(sparse=self.n_states >= SPARSE_STATES)
+        return A @ q + b * protocol.dose_func(t, q)
+
+    def jac(self, t, q, protocol):
+        """Returns the Jacobian of :meth:`rhs` with respect to q.
+
+        The model is linear in q, so the Jacobian is the constant rate
+        matrix, whose sparsity pattern is given by :meth:`sparsity`.
+        The dose function is treated as an external input and
+        does not contribute to the Jacobian.
+
+        Args:
+            t: float representing time.
+            q: array of drug quantities in each compartment.
+            protocol: Protocol object providing the dose function.
+
+        Returns:
+            The (n_states, n_states) Jacobian matrix.
+        """
+        return self.compile()[0]
 
     def plot_sol(self, sol):
-        """Plots the solution to the PK model.
+        """Plots the solution to the PK model and displays it, see
+        :func:`pkmodel.plot.plot_solution`.
 
         Args:
             sol: An object of type scipy.integrate._ivp.ivp.OdeResult
             that represents the quantities of a drug in a given
             compartment over time.
         """
-        fig = plt.figure()
-        plt.plot(sol.t, sol.y[0, :], label=self.name + '- q_c')
-        plt.plot(sol.t, sol.y[1, :], label=self.name + '- q_protocol1')
-        plt.legend()
-        plt.ylabel('drug mass [ng]')
-        plt.xlabel('time [h]')
-        plt.show()
+        import pkmodel.plot
+        pkmodel.plot.plot_solution(sol, self)
+        pkmodel.plot.show()
 
-    def solve(self, protocol):
+    def solve(self, protocol, method='auto', t_eval=None, plot=False, stats=None):
         """Solves the PK model given a protocol, using scipy's solve_ivp
         function.
 
+        The model is compiled once into its rate matrix, so each rhs
+        evaluation is a single matrix-vector product. For the implicit
+        methods ('Radau', 'BDF' and 'LSODA') the constant analytic
+        Jacobian is passed to the solver. The protocol's discrete
+        doses are applied exactly, by integrating piecewise between
+        dosing events (see :func:`integrate`).
+
+        With method='analytic' the linear system is instead solved
+        exactly by eigendecomposition and superposition (see
+        :class:`pkmodel.LinearSystem`). This requires a protocol
+        without a dose_func, or whose dose_func is a single-patient
+        piecewise-constant DoseTable.
+
+        With method='exponential' the solution is stepped over the
+        t_eval grid with exact propagators of the linear system, see
+        :func:`pkmodel.propagator.propagate`. This is exact for the
+        discrete doses, and second order in the grid spacing for a
+        dose_func.
+
+        By default (method='auto') the method is chosen from the
+        stiffness of the rate matrix by :func:`choose_method`, with an
+        absolute tolerance relative to the largest dose. The method
+        used is stored in the method attribute of the solution.
+
         Args:
             protocol: Protocol object representing the dosing protocol
                 that will be used to solve the PK model.
+            method: 'auto', the integration method passed to solve_ivp,
+                'analytic' or 'exponential'.
+            t_eval: Optional times at which to store the solution, by
+                default 1000 points spanning the protocol time.
+            plot: Whether to plot the solution with :meth:`plot_sol`.
+            stats: An optional :class:`pkmodel.SolveStats` to fill in
+                with statistics of the solve, or a callable which is
+                passed them. Statistics are also gathered while
+                :func:`pkmodel.collect_stats` is active.
 
         Returns:
             A solution to the PK model representing the drug quantitiy
             in each compartment over time.
+
+        Raises:
+            TypeError: If protocol is not of type Protocol.
+            ValueError: If method is 'analytic' and the protocol has
+                another dose_func, or a dose is given into a compartment that
+                this model does not have.
         """
         # Argument validation
         if not isinstance(protocol, pk.Protocol):
             raise TypeError('protocol must be type pk.Protocol.')
+        sol = self._run(protocol, method, t_eval, stats)
+        if plot:
+            self.plot_sol(sol)
+        return sol
+
+    def resume(self, checkpoint, protocol, method=None, t_eval=None, stats=None):
+        """Continues a solution from its checkpoint to the end of an
+        extended protocol, solving only the new interval. This gives the
+        same solution as solving the extended protocol from the start.
+
+        For example, to add a dose and solve for a further day::
+
+            sol = model.solve(protocol)
+            longer = protocol.extend(protocol.time + 24, [pk.Dose(protocol.time + 2, 10)])
+            rest = model.resume(sol.checkpoint, longer)
+
+        Args:
+            checkpoint: The :class:`pkmodel.Checkpoint` of an earlier
+                solution of this model.
+            protocol: A Protocol continuing the protocol of the
+                checkpoint, see :meth:`pkmodel.Checkpoint.check`.
+            method: The solver method, by default the method of the
+                checkpoint.
+            t_eval: Optional times at which to store the solution, by
+                default 1000 points spanning the new interval.
+            stats: Statistics of the solve, as in :meth:`solve`.
+
+        Returns:
+            The solution over the new interval, with its own checkpoint.
+
+        Raises:
+            TypeError: If the arguments are of the wrong type.
+            ValueError: If the protocol does not continue the
+                checkpoint.
+        """
+        # Argument validation
+        if not isinstance(checkpoint, pk.Checkpoint):
+            raise TypeError('checkpoint must be type pk.Checkpoint.')
+        checkpoint.check(self, protocol)
+        method = checkpoint.method if method is None else method
+        return self._run(protocol, method, t_eval, stats, checkpoint)
+
+    def _run(self, protocol, method, t_eval, stats, checkpoint=None):
+        if stats is not None and not (isinstance(stats, pk.SolveStats) or callable(stats)):
+            raise TypeError('stats must be type pk.SolveStats or a callable.')
+        if stats is None and not pk.stats.active():
+            return self._solve(protocol, method, t_eval, pk.stats.NullTimer(), checkpoint)
+        return self._solve_instrumented(protocol, method, t_eval, stats, checkpoint)
+
+    def _solve(self, protocol, method, t_eval, timer, checkpoint=None):
+        start = self._start(protocol, checkpoint)
         # Create a list of timesteps
-        t_eval = numpy.linspace(0, protocol.time, 1000)
-        # Determine how many initial conditions to set
-        if not self.k_a:
-            y0 = numpy.zeros(len(self.peripheral_compartments) + 1)
+        if t_eval is None:
+            t_eval = numpy.linspace(start[0], protocol.time, 1000)
+        with timer.phase('compile'):
+            A, b = self.compile(sparse=method not in ['analytic', 'exponential'] and self.n_states >= SPARSE_STATES)
+        events = protocol.events(self.state_names)
+        if checkpoint is not None:
+            # Boluses up to the checkpoint are included in its state
+            events = [bolus for bolus in events[0] if bolus[0] > checkpoint.time], events[1]
+        if method == 'analytic':
+            sol = self._solve_analytic(A, start, protocol, t_eval, events)
+            step = None
+        elif method == 'exponential':
+            sol = self._solve_exponential(A, b, start, protocol, t_eval, events)
+            step = None
         else:
-            y0 = numpy.zeros(len(self.peripheral_compartments) + 2)
+            method, atol = resolve_method(A, [protocol], method)
+            sol = self._solve_numerical(A, b, start, protocol, t_eval, method, atol, events, timer)
+            step = float(sol.step_sizes[-1]) if len(sol.step_sizes) else start[2]
+        sol.method = method
+        sol.checkpoint = pk.Checkpoint(self, protocol, sol.y_end, method, step) if sol.success else None
+        return sol
+
+    def _start(self, protocol, checkpoint):
+        """Returns the time, state and first step size at which a solve
+        starts.
+        """
+        if checkpoint is not None:
+            return checkpoint.time, checkpoint.y.copy(), checkpoint.step
+        y0 = numpy.zeros(self.n_states)
         y0[0] = protocol.initial_dose
+        return 0.0, y0, None
+
+    def _solve_instrumented(self, protocol, method, t_eval, stats, checkpoint):
+        record = stats if isinstance(stats, pk.SolveStats) else pk.SolveStats()
+        timer = pk.stats.PhaseTimer(record)
+        with timer.phase('solver'):
+            sol = self._solve(protocol, method, t_eval, timer, checkpoint)
+        # The rhs time includes the dose time, and the total time
+        # includes every other phase
+        for times in [record.wall_time, record.cpu_time]:
+            times['model'] -= times['dose']
+            times['solver'] -= times['compile'] + times['model'] + times['dose']
+        record.model = self.name
+        record.protocol = protocol.name
+        record.method = sol.method
+        record.success = bool(sol.success)
+        record.nfev, record.njev, record.nlu = int(sol.nfev), int(sol.njev), int(sol.nlu)
+        record.step_sizes = sol.get('step_sizes', numpy.zeros(0))
+        if stats is not None and stats is not record:
+            stats(record)
+        pk.stats.publish(record)
+        return sol
+
+    def iter_solve(self, protocol, t_eval=None, chunk_size=1000, method='auto', dense_output=False):
+        """Solves the PK model incrementally, yielding the solution in
+        chunks as the integration advances, so that long horizons can be
+        solved in constant memory.
+
+        Args:
+            protocol: Protocol object representing the dosing protocol
+                that will be used to solve the PK model.
+            t_eval: An optional sorted iterable, which may be a
+                generator, of times at which to sample the solution. By
+                default 1000 points spanning the protocol time.
+            chunk_size: The number of samples, or of solver steps with
+                dense_output, in each chunk.
+            method: 'auto', the integration method or 'analytic', as in
+                :meth:`solve`. The 'exponential' method steps over a
+                stored grid, so it is not supported.
+            dense_output: Whether to yield the solver's interpolants
+                instead of samples at t_eval.
+
+        Returns:
+            A generator of tuples (t, y) of the sample times and the
+            (n_states, len(t)) drug quantities at those times or, with
+            dense_output, scipy.integrate.OdeSolution objects which
+            can be evaluated anywhere in the interval they cover.
+
+        Raises:
+            TypeError: If protocol is not of type Protocol.
+            ValueError: If method is not supported, or t_eval is not
+                sorted and within the protocol time (when the generator
+                reaches it).
+        """
+        # Argument validation
+        if not isinstance(protocol, pk.Protocol):
+            raise TypeError('protocol must be type pk.Protocol.')
+        if type(chunk_size) is not int or chunk_size < 1:
+            raise TypeError('chunk_size must be an integer greater than 0.')
+        if method not in ('auto', 'analytic') + SOLVERS:
+            raise ValueError('method must be auto, analytic or one of {0}.'.format(', '.join(SOLVERS)))
+        if method == 'analytic' and dense_output:
+            raise ValueError('the analytic method does not have a dense output.')
+        if t_eval is None:
+            t_eval = numpy.linspace(0, protocol.time, 1000)
+        return self._iter_solve(protocol, t_eval, chunk_size, method, dense_output)
+
+    def _iter_solve(self, protocol, t_eval, chunk_size, method, dense_output):
+        if method == 'analytic':
+            yield from self._iter_analytic(protocol, t_eval, chunk_size)
+            return
+        solver_steps, _ = self._steps(protocol, method)
+        if dense_output:
+            yield from _dense_chunks(solver_steps, chunk_size)
+        else:
+            yield from _sample_chunks(solver_steps, _sorted_times(t_eval, protocol.time), chunk_size)
+
+    def metrics(self, protocol, threshold=None, compartment='q_c', auc='exact', method='auto'):
+        """Computes summary metrics of the concentration in a compartment
+        as the integration advances, without storing the solution.
+
+        Maxima and threshold crossings are located exactly on the
+        solver's interpolant within each step, and the AUC is either
+        integrated exactly or by the trapezoid rule over the solver's
+        steps (see :class:`pkmodel.metrics.Metrics`).
+
+        Args:
+            protocol: The Protocol to solve.
+            threshold: An optional concentration, for the time spent at
+                or above it.
+            compartment: The state name of the compartment, 'q_c' or a
+                peripheral compartment.
+            auc: 'exact' or 'trapezoid'.
+            method: The solver method, see :meth:`solve`, other than
+                'analytic'.
+
+        Returns:
+            An OptimizeResult with attributes cmax, the maximum
+            concentration, tmax, the time it is reached, auc, the area
+            under the concentration curve, troughs, the concentrations
+            just before each dose at trough_times, time_above if a
+            threshold is given, and method, the solver method.
+
+        Raises:
+            TypeError: If protocol is not of type Protocol.
+            ValueError: If compartment is not a compartment with a
+                volume.
+        """
+        # Argument validation
+        if not isinstance(protocol, pk.Protocol):
+            raise TypeError('protocol must be type pk.Protocol.')
+        if compartment not in self.state_names or compartment == 'q_0':
+            raise ValueError('compartment must be q_c or a peripheral compartment.')
+        i = 0 if compartment == 'q_c' else int(compartment[3:])
+        solver_steps, method = self._steps(protocol, method)
+        result = pk.metrics.summarize(
+            solver_steps, self.n_states, self.state_names.index(compartment), self.volumes[i],
+            threshold, [d.time for d in protocol.doses], auc,
+        )
+        for key in ['cmax', 'tmax', 'auc', 'troughs', 'time_above']:
+            if key in result:
+                result[key] = result[key][0]
+        result.method = method
+        return result
+
+    def steady_state(self, doses, interval, t_eval=None, compartment='q_c', fraction=0.9):
+        """Computes the periodic steady state of a regimen repeated every
+        interval, directly from one dosing cycle rather than by solving
+        until the solution plateaus.
+
+        Over one cycle the drug quantities map linearly as
+        q(interval) = Phi q(0) + c, where Phi is the propagator of the
+        cycle (see :func:`pkmodel.propagator.propagators`) and c is the
+        response to one cycle's doses. The steady state is the fixed
+        point q(0) = (I - Phi)^-1 c, from which the cycle is evaluated
+        exactly (see :class:`pkmodel.LinearSystem`).
+
+        Args:
+            doses: A list of the Doses given in each cycle, with times
+                relative to the start of the cycle, ending within it.
+            interval: The length of the dosing cycle [h].
+            t_eval: Optional times in [0, interval] at which to store
+                the steady-state cycle, by default 1000 points.
+            compartment: The state name of the compartment of the
+                accumulation ratio and time to steady state.
+            fraction: The fraction of the steady state of the time to
+                steady state.
+
+        Returns:
+            An OptimizeResult with attributes t and y, the (n_states,
+            len(t)) drug quantities over the steady-state cycle, trough,
+            the drug quantities at the start of the cycle, auc, the area
+            under the concentration curve in the compartment over a
+            cycle, cavg, the average concentration, accumulation, the
+            ratio of auc to that of the first cycle, and cycles and
+            time_to_steady_state, the number of cycles and the time
+            after which the concentration at the start of every cycle
+            is at least fraction of its steady-state value.
+
+        Raises:
+            TypeError: If doses is not a list of Doses.
+            ValueError: If doses is empty or a dose is outside the cycle,
+                compartment is not a compartment with a volume, or the
+                model does not eliminate the drug, so that it has no
+                steady state.
+        """
+        # Argument validation
+        interval = float(interval)
+        if interval <= 0:
+            raise ValueError('interval must be greater than 0.')
+        protocol = pk.Protocol(0, interval, doses=doses)
+        if not protocol.doses:
+            raise ValueError('doses must not be empty.')
+        if any(d.time >= interval or d.time + d.duration > interval for d in protocol.doses):
+            raise ValueError('doses must be given and end within the interval.')
+        if compartment not in self.state_names or compartment == 'q_0':
+            raise ValueError('compartment must be q_c or a peripheral compartment.')
+        if not 0 < fraction < 1:
+            raise ValueError('fraction must be between 0 and 1.')
+        if t_eval is None:
+            t_eval = numpy.linspace(0, interval, 1000)
+        A = self.compile()[0]
+        boluses, infusions = protocol.events(self.state_names)
+        Phi, Gamma = [P[0, 0] for P in pk.propagator.propagators(A[None], [interval])]
+        eye = numpy.eye(self.n_states)
+        if numpy.linalg.cond(eye - Phi) > 1 / numpy.finfo(float).eps:
+            raise ValueError('the model has no steady state, as it does not eliminate the drug.')
+        system = pk.LinearSystem(A)
+        trough = numpy.linalg.solve(eye - Phi, system.solve([interval], None, boluses, infusions)[:, 0])
+        # Every dose is eliminated in the end, so the steady-state AUC of
+        # a cycle is the AUC of one cycle's doses to infinity
+        amounts = numpy.zeros(self.n_states)
+        for _, amount, state in boluses:
+            amounts[state] += amount
+        for start, stop, rate, state in infusions:
+            amounts[state] += rate * (stop - start)
+        state = self.state_names.index(compartment)
+        i = 0 if compartment == 'q_c' else int(compartment[3:])
+        auc = -numpy.linalg.solve(A, amounts)[state]
+        # The first cycle lacks the decay of the trough over the cycle
+        first = auc - (Gamma @ trough)[state]
+        cycles = _cycles_to_steady_state(Phi, trough, state, fraction)
+        return scipy.optimize.OptimizeResult(
+            t=numpy.asarray(t_eval, dtype=float), y=system.solve(t_eval, trough, boluses, infusions),
+            trough=trough, auc=auc / self.volumes[i], cavg=auc / self.volumes[i] / interval,
+            accumulation=auc / first, cycles=cycles, time_to_steady_state=cycles * interval,
+        )
+
+    def _steps(self, protocol, method):
+        """Returns a generator of the solver steps of a solve, see
+        :func:`steps`, and the solver method.
+        """
+        A, b = self.compile(sparse=self.n_states >= SPARSE_STATES)
+        method, atol = resolve_method(A, [protocol], method)
+        y0 = numpy.zeros(self.n_states)
+        y0[0] = protocol.initial_dose
+        dose_func = protocol.continuous_dose_func
+        boluses, infusions = protocol.events(self.state_names)
+        solver_steps = steps(
+            lambda t, y: A @ y + b * dose_func(t, y), y0, protocol.time, method=method,
+            jac=constant_jacobian(A, method), boluses=boluses, infusions=infusions,
+            breakpoints=protocol.breakpoints, atol=atol,
+        )
+        return solver_steps, method
+
+    def _iter_analytic(self, protocol, t_eval, chunk_size):
+        check_analytic(protocol)
+        system = pk.LinearSystem(self.compile()[0])
+        y0 = numpy.zeros(self.n_states)
+        y0[0] = protocol.initial_dose
+        boluses, infusions = protocol.events(self.state_names)
+        times = _sorted_times(t_eval, protocol.time)
+        while True:
+            t = numpy.fromiter(itertools.islice(times, chunk_size), dtype=float)
+            if not len(t):
+                return
+            yield t, system.solve(t, y0, boluses, infusions)
+
+    @staticmethod
+    def solve_batch(models, protocol, method='auto', t_eval=None):
+        """Solves a list of PK models with the same structure together,
+        see :meth:`pkmodel.Population.solve`.
+
+        Args:
+            models: A list of Models with the same number of peripheral
+                compartments and dosing type.
+            protocol: A Protocol shared by all models, or a list of one
+                Protocol per model.
+            method: The integration method, see :meth:`pkmodel.Population.solve`.
+            t_eval: Optional times at which to store the solution.
+
+        Returns:
+            A solution whose y attribute has shape (len(models),
+            n_states, len(t)).
+        """
+        population = pk.Population.from_models(models)
+        return population.solve(protocol, method=method, t_eval=t_eval)
+
+    def _solve_numerical(self, A, b, start, protocol, t_eval, method, atol, events, timer):
+        t0, y0, first_step = start
+        dose_func = timer.wrap(protocol.continuous_dose_func, 'dose')
+        boluses, infusions = events
+        jac = constant_jacobian(A, method)
         # Solve ODE based on system of equations, timespan, and initial conditions
-        sol = scipy.integrate.solve_ivp(
-            fun=lambda t, y: self.rhs(t, y, protocol),
-            t_span=[t_eval[0], t_eval[-1]],
-            y0=y0, t_eval=t_eval
+        return integrate(
+            timer.wrap(lambda t, y: A @ y + b * dose_func(t, y), 'model'), y0, protocol.time, t_eval,
+            method=method, jac=jac, boluses=boluses, infusions=infusions,
+            breakpoints=protocol.breakpoints, atol=atol, t0=t0, first_step=first_step,
         )
-        self.plot_sol(sol)
+
+    def _solve_exponential(self, A, b, start, protocol, t_eval, events):
+        t0, y0, _ = start
+        f = protocol.continuous_dose_func
+        # The propagator passes the states of a batch of one model
+        dose_func = None if f is pk.protocol.no_dose else (lambda t, Y: f(t, Y[0]))
+        sol = pk.propagator.propagate(
+            A[None], y0, protocol.time, t_eval, b, dose_func, events[0], events[1], protocol.breakpoints, t0,
+        )
+        sol.y, sol.y_end = sol.y[0], sol.y_end[0]
         return sol
+
+    def _solve_analytic(self, A, start, protocol, t_eval, events):
+        t0, y0, _ = start
+        check_analytic(protocol)
+        t_eval = numpy.asarray(t_eval, dtype=float)
+        # The linear system starts at t=0, so shift the events to t0
+        boluses = [(t - t0, amount, state) for t, amount, state in events[0]]
+        infusions = [(max(a - t0, 0.0), c - t0, rate, state) for a, c, rate, state in events[1] if c > t0]
+        y = pk.LinearSystem(A).solve(numpy.append(t_eval, protocol.time) - t0, y0, boluses, infusions)
+        return scipy.optimize.OptimizeResult(
+            t=t_eval, y=y[:, :-1], y_end=y[:, -1], sol=None, t_events=None, y_events=None,
+            nfev=0, njev=0, nlu=0, status=0, success=True,
+            message='The solution was evaluated analytically.',
+        )
@@ -0,0 +1,156 @@
+import pkmodel as pk
+import concurrent.futures
+import collections
+import itertools
+import os
+import re
+import scipy.optimize
+
+
+def expand_grid(grid):
+    """Expands a parameter grid into a list of parameter sets.
+
+    Parameters are named 'v_c' and 'cl' for the central compartment
+    volume and clearance, 'v_p1', 'q_p1', 'v_p2', 'q_p2', ... for the
+    volume and transition rate of each peripheral compartment, and
+    optionally 'k_a' for the absorption rate.
+
+    Args:
+        grid: Either a dict mapping each parameter name to a list of
+            values, which is expanded to their Cartesian product, or a
+            list of dicts giving each parameter set explicitly.
+
+    Returns:
+        A list of dicts, one per parameter set.
+
+    Raises:
+        TypeError: If grid is not a dict or list of dicts.
+    """
+    if isinstance(grid, dict):
+        names = list(grid)
+        return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    if type(grid) is list and all(isinstance(p, dict) for p in grid):
+        return [dict(p) for p in grid]
+    raise TypeError('grid must be a dict of parameter values or a list of dicts.')
+
+
+def to_population(points):
+    """Creates a Population from a list of parameter sets with the same
+    parameter names, see :func:`expand_grid`.
+
+    Args:
+        points: A non-empty list of parameter set dicts.
+
+    Returns:
+        A Population with one patient per parameter set.
+
+    Raises:
+        ValueError: If the parameter names are invalid or differ
+            between parameter sets.
+    """
+    names = set(points[0])
+    if any(set(p) != names for p in points):
+        raise ValueError('all parameter sets must have the same parameter names.')
+    n_peripheral = len([name for name in names if re.fullmatch(r'v_p\d+', name)])
+    expected = {'v_c', 'cl'} | {'{0}{1}'.format(prefix, i)
+                                for prefix in ['v_p', 'q_p'] for i in range(1, n_peripheral + 1)}
+    if names - {'k_a'} != expected:
+        raise ValueError('parameters must be v_c, cl, optionally k_a, and v_p<i>, q_p<i> for i=1..P.')
+    return pk.Population.from_columns({name: [p[name] for p in points] for name in names})
+
+
+def sweep(grid, protocol, workers=None, chunksize=None, method='auto', t_eval=None, progress=None):
+    """Solves the PK model for every parameter set of a grid, spreading
+    the work over a pool of processes.
+
+    The parameter sets are split into chunks, each of which is solved
+    as a single :class:`pkmodel.Population`. Only a bounded number of
+    chunks are in flight at once, and results are yielded in the order
+    of the grid as soon as they are available. With more than one
+    worker the protocol must be picklable, so its dose_func should be
+    a module-level function rather than a lambda.
+
+    Args:
+        grid: A dict or list of parameter sets, see :func:`expand_grid`.
+        protocol: The Protocol used for every parameter set.
+        workers: The number of worker processes, by default the number
+            of CPUs. With 1 worker, the sweep runs in this process.
+        chunksize: The number of parameter sets per task, by default
+            chosen to give each worker several tasks.
+        method: The integration method, see :meth:`pkmodel.Population.solve`.
+        t_eval: Optional times at which to store each solution.
+        progress: An optional callable, called as progress(done, total)
+            each time a chunk of parameter sets has been solved.
+
+    Yields:
+        Tuples (parameters, solution) in grid order, where solution has
+        attributes t and y as returned by :meth:`pkmodel.Model.solve`.
+
+    Raises:
+        TypeError: If protocol is not of type Protocol.
+        ValueError: If workers or chunksize is not positive.
+    """
+    if not isinstance(protocol, pk.Protocol):
+        raise TypeError('protocol must be type pk.Protocol.')
+    points = expand_grid(grid)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError('workers must be greater than 0.')
+    if chunksize is None:
+        chunksize = max(1, -(-len(points) // (4 * workers)))
+    if chunksize < 1:
+        raise ValueError('chunksize must be greater than 0.')
+    chunks = [points[i:i + chunksize] for i in range(0, len(points), chunksize)]
+    done = 0
+    for chunk, (t, y) in zip(chunks, _map(chunks, protocol, method, t_eval, workers)):
+        for parameters, y_k in zip(chunk, y):
+            yield parameters, scipy.optimize.OptimizeResult(t=t, y=y_k, success=True)
+        done += len(chunk)
+        if progress is not None:
+            progress(done, len(points))
+
+
+def _map(chunks, protocol, method, t_eval, workers):
+    """Solves each chunk, yielding the results in order. At most two
+    chunks per worker are submitted ahead of the one being yielded.
+    """
+    if workers == 1:
+        for chunk in chunks:
+            yield solve_parameter_sets(chunk, protocol, method, t_eval)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        chunks = iter(chunks)
+        for chunk in itertools.islice(chunks, 2 * workers):
+            pending.append(executor.submit(solve_parameter_sets, chunk, protocol, method, t_eval))
+        while pending:
+            result = pending.popleft().result()
+            for chunk in itertools.islice(chunks, 1):
+                pending.append(executor.submit(solve_parameter_sets, chunk, protocol, method, t_eval))
+            yield result
+
+
+def solve_parameter_sets(parameter_sets, protocol, method='auto', t_eval=None):
+    """Solves a list of parameter sets together as one
+    :class:`pkmodel.Population`, in this process.
+
+    Args:
+        parameter_sets: A list of parameter sets, named as in
+            :func:`expand_grid`.
+        protocol: A Protocol shared by all parameter sets, or a list of
+            one Protocol per parameter set.
+        method: The integration method, see :meth:`pkmodel.Population.solve`.
+        t_eval: Optional times at which to store the solutions.
+
+    Returns:
+        A tuple (t, y) of the times and the (len(parameter_sets),
+        n_states, len(t)) array of drug quantities.
+
+    Raises:
+        RuntimeError: If the solver fails.
+    """
+    sol = to_population(parameter_sets).solve(protocol, method=method, t_eval=t_eval)
+    if not sol.success:
+        raise RuntimeError(sol.message)
+    return sol.t, sol.y
@@ -0,0 +1,221 @@
+"""Visualisation of PK model solutions.
+
+matplotlib is only imported when a plot is made, so that ``import
+pkmodel`` and solving models stay fast and work without a display.
+
+Populations are plotted as percentile bands with a few individual
+traces, each reduced to about as many points as the figure has pixels
+across, so that drawing and saving a plot takes time proportional to
+its size in pixels rather than to the number of patients and times.
+"""
+import os
+import numpy
+
+
+# The maximum number of values of which percentiles are computed at once
+PERCENTILE_CHUNK = 2 ** 24
+
+
+def _pyplot():
+    """Imports and returns matplotlib.pyplot.
+    """
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def plot_solution(sol, model=None, ax=None, filename=None):
+    """Plots the drug quantity in each compartment over time.
+
+    Args:
+        sol: A solution returned by :meth:`pkmodel.Model.solve`.
+        model: The Model which was solved, used to label the lines.
+        ax: An optional matplotlib Axes to draw on, by default a new
+            figure is created.
+        filename: An optional file to save the figure to.
+
+    Returns:
+        The matplotlib Figure containing the plot.
+    """
+    plt = _pyplot()
+    if ax is None:
+        fig, ax = plt.subplots()
+    else:
+        fig = ax.figure
+    prefix = '' if model is None else model.name + '- '
+    names = ['q_{0}'.format(i) for i in range(len(sol.y))] if model is None else model.state_names
+    for name, y in zip(names, sol.y):
+        ax.plot(sol.t, y, label=prefix + name)
+    ax.legend()
+    ax.set_ylabel('drug mass [ng]')
+    ax.set_xlabel('time [h]')
+    if filename is not None:
+        fig.savefig(filename)
+    return fig
+
+
+def percentiles(y, q=(5, 50, 95)):
+    """Computes percentiles over patients at each time, in chunks of
+    times so that memory stays bounded for large or memory-mapped
+    arrays, such as those of :meth:`pkmodel.ResultStore.select`.
+
+    Args:
+        y: An array of shape (N, T) of values of each patient at each
+            time.
+        q: The percentiles to compute, in [0, 100].
+
+    Returns:
+        An array of shape (len(q), T).
+    """
+    N, T = numpy.shape(y)
+    columns = max(1, PERCENTILE_CHUNK // max(N, 1))
+    result = numpy.empty((len(q), T))
+    for start in range(0, T, columns):
+        result[:, start:start + columns] = numpy.percentile(y[:, start:start + columns], q, axis=0)
+    return result
+
+
+def lttb(t, y, n_out):
+    """Downsamples traces to n_out points each with the Largest Triangle
+    Three Buckets algorithm, which keeps the points that most change the
+    shape of each trace. It is vectorized over traces, so its cost is
+    n_out vectorized steps.
+
+    Args:
+        t: The times, of length T.
+        y: An array of traces of shape (..., T).
+        n_out: The number of points to keep, at least 3.
+
+    Returns:
+        A tuple (t, y) of the kept times and values, each of shape
+        (..., n_out), or of the inputs if they have at most n_out
+        points.
+    """
+    t = numpy.asarray(t, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    T = len(t)
+    if n_out >= T:
+        return numpy.broadcast_to(t, y.shape), y
+    if n_out < 3:
+        raise ValueError('n_out must be at least 3.')
+    Y = y.reshape(-1, T)
+    rows = numpy.arange(len(Y))
+    # The first and last points are kept, and one point from each of
+    # n_out - 2 buckets in between
+    edges = numpy.append(numpy.floor(numpy.arange(n_out - 1) * (T - 2) / (n_out - 2)).astype(int) + 1, T)
+    index = numpy.zeros((len(Y), n_out), dtype=int)
+    index[:, -1] = T - 1
+    for i in range(n_out - 2):
+        start, stop, end = edges[i], edges[i + 1], edges[i + 2]
+        # The point of the bucket making the largest triangle with the
+        # last kept point and the mean of the next bucket
+        a = index[:, i]
+        t_a, y_a = t[a][:, None], Y[rows, a][:, None]
+        t_c, y_c = t[stop:end].mean(), Y[:, stop:end].mean(axis=1)[:, None]
+        area = numpy.abs((t_a - t_c) * (Y[:, start:stop] - y_a) - (t_a - t[start:stop]) * (y_c - y_a))
+        index[:, i + 1] = start + numpy.argmax(area, axis=1)
+    return t[index].reshape(y.shape[:-1] + (n_out,)), Y[rows[:, None], index].reshape(y.shape[:-1] + (n_out,))
+
+
+def _envelope(t, y, reduce, n_out):
+    """Reduces a curve to at most n_out points by taking reduce, e.g.
+    numpy.minimum, over buckets of consecutive times.
+    """
+    if len(t) <= n_out:
+        return t, y
+    edges = numpy.linspace(0, len(t), n_out + 1).astype(int)[:-1]
+    return t[edges], reduce.reduceat(y, edges)
+
+
+def plot_population(t, y, q=(5, 50, 95), traces=10, width=800, ax=None, filename=None, label=None, seed=0):
+    """Plots the distribution of a quantity over a population as shaded
+    percentile bands, with a line for a middle percentile and a few
+    randomly chosen individual traces.
+
+    Percentiles are computed from every patient, and every line is then
+    reduced to at most width points: the lower edge of each band by its
+    minimum and the upper edge by its maximum over buckets of times, so
+    that no peak is lost, and the traces by :func:`lttb`.
+
+    Args:
+        t: The times, of length T.
+        y: An array of shape (N, T) of the values of each patient, e.g.
+            ``sol.y[:, 1]`` of a :meth:`pkmodel.Population.solve`
+            solution, or a memory-mapped array of a ResultStore.
+        q: The percentiles, in increasing order. Symmetric pairs, such
+            as 5 and 95, are shaded as bands, and a middle percentile
+            is drawn as a line.
+        traces: The number of individual traces to draw.
+        width: The maximum number of points per line, about the width of
+            the plot in pixels.
+        ax: An optional matplotlib Axes to draw on, by default a new
+            figure is created.
+        filename: An optional file to save the figure to.
+        label: An optional label of the y axis.
+        seed: The seed of the choice of traces.
+
+    Returns:
+        The matplotlib Figure containing the plot.
+    """
+    t = numpy.asarray(t, dtype=float)
+    if ax is None:
+        fig, ax = _pyplot().subplots()
+    else:
+        fig = ax.figure
+    bands = percentiles(y, q)
+    for i in range(len(q) // 2):
+        t_band, low = _envelope(t, bands[i], numpy.minimum, width)
+        _, high = _envelope(t, bands[-1 - i], numpy.maximum, width)
+        ax.fill_between(t_band, low, high, color='C0', alpha=0.2, linewidth=0, label='{0}-{1}%'.format(q[i], q[-1 - i]))
+    if len(q) % 2:
+        ax.plot(*lttb(t, bands[len(q) // 2], width), color='C0', label='{0}%'.format(q[len(q) // 2]))
+    rng = numpy.random.default_rng(seed)
+    chosen = numpy.sort(rng.choice(len(y), min(traces, len(y)), replace=False))
+    t_traces, y_traces = lttb(t, y[chosen], width)
+    for t_k, y_k in zip(t_traces, y_traces):
+        ax.plot(t_k, y_k, color='grey', alpha=0.5, linewidth=0.5)
+    ax.legend()
+    ax.set_xlabel('time [h]')
+    if label is not None:
+        ax.set_ylabel(label)
+    if filename is not None:
+        fig.savefig(filename)
+    return fig
+
+
+def save_population_plots(t, y, state_names, directory, fmt='png', **options):
+    """Renders a plot of each compartment of a population solve to a file,
+    without a display, see :func:`plot_population`. Each figure is closed
+    once saved, so any number of plots can be rendered in a batch.
+
+    Args:
+        t: The times, of length T.
+        y: An array of shape (N, n_states, T), such as the y of a
+            :meth:`pkmodel.Population.solve` solution or of a
+            ResultStore.
+        state_names: The names of the compartments, which name the
+            files.
+        directory: The directory to write the files to.
+        fmt: The file format.
+        **options: Further options passed to :func:`plot_population`.
+
+    Returns:
+        The list of file names.
+    """
+    # Figures are created without pyplot, so they are neither shown nor
+    # kept open
+    import matplotlib.figure
+    os.makedirs(directory, exist_ok=True)
+    filenames = []
+    for i, name in enumerate(state_names):
+        fig = matplotlib.figure.Figure()
+        filename = os.path.join(directory, '{0}.{1}'.format(name, fmt))
+        plot_population(t, y[:, i], ax=fig.add_subplot(), filename=filename,
+                        label='{0} drug mass [ng]'.format(name), **options)
+        filenames.append(filename)
+    return filenames
+
+
+def show():
+    """Displays all open figures.
+    """
+    _pyplot().show()
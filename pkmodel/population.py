@@ -0,0 +1,531 @@
+import pkmodel as pk
+import re
+import scipy.sparse
+import numpy
+
+
+# The names of the peripheral parameter columns of a table, see
+# :meth:`Population.from_columns`
+_PERIPHERAL = re.compile(r'[vq]_p\d+')
+
+# The relative tolerance of each patient, that of solve_ivp and so of
+# Model.solve
+RTOL = 1e-3
+
+
+class Population:
+    """A population of PK models which share the same structure (number
+    of peripheral compartments and dosing type) but each have their own
+    parameters. The parameters are held as arrays, so that all patients
+    can be solved together with a single vectorized rhs.
+
+    Attributes:
+        central_volume: An array of shape (N,) with the volume of the
+            central compartment of each patient.
+        clearance: An array of shape (N,) with the clearance rate of
+            each patient.
+        peripheral_volumes: An array of shape (N, P) with the volume of
+            each peripheral compartment of each patient.
+        peripheral_rates: An array of shape (N, P) with the transition
+            rate between the central compartment and each peripheral
+            compartment of each patient.
+        k_a: An optional array of shape (N,) with the absorption rate
+            of each patient, for subcutaneous dosing.
+    """
+    def __init__(self, central_volume, clearance, peripheral_volumes=None,
+                 peripheral_rates=None, k_a=None):
+        self.central_volume = _as_array(central_volume, 'central_volume', ndim=1)
+        n = len(self.central_volume)
+        self.clearance = _as_array(clearance, 'clearance', ndim=1)
+        if peripheral_volumes is None:
+            peripheral_volumes = numpy.zeros((n, 0))
+        if peripheral_rates is None:
+            peripheral_rates = numpy.zeros((n, 0))
+        self.peripheral_volumes = _as_array(peripheral_volumes, 'peripheral_volumes', ndim=2)
+        self.peripheral_rates = _as_array(peripheral_rates, 'peripheral_rates', ndim=2)
+        if k_a is not None:
+            k_a = _as_array(k_a, 'k_a', ndim=1)
+        self.k_a = k_a
+        # Argument validation
+        if len(self.clearance) != n or self.peripheral_volumes.shape[0] != n:
+            raise ValueError('all parameters must have one row per patient.')
+        if self.peripheral_volumes.shape != self.peripheral_rates.shape:
+            raise ValueError('peripheral_volumes and peripheral_rates must have the same shape.')
+        if k_a is not None and len(k_a) != n:
+            raise ValueError('all parameters must have one row per patient.')
+        if numpy.any(self.central_volume <= 0) or numpy.any(self.peripheral_volumes <= 0):
+            raise ValueError('volumes must be greater than 0.')
+        if numpy.any(self.clearance < 0) or numpy.any(self.peripheral_rates < 0):
+            raise ValueError('transition rates must be greater than or equal to 0.')
+        if k_a is not None and numpy.any(k_a < 0):
+            raise ValueError('k_a must be greater than or equal to 0.')
+
+    @classmethod
+    def from_models(cls, models):
+        """Creates a population from a list of models with the same
+        structure.
+
+        Args:
+            models: A non-empty list of Models.
+
+        Returns:
+            A Population with one patient per model.
+
+        Raises:
+            TypeError: If models is not a list of Models.
+            ValueError: If the models do not share the same structure,
+                or have flows between compartments.
+        """
+        if type(models) is not list or not models:
+            raise TypeError('models must be a non-empty list of pk.Model.')
+        for m in models:
+            if not isinstance(m, pk.Model):
+                raise TypeError('each model must be type pk.Model.')
+        structure = {(m.n_states, m.k_a is None) for m in models}
+        if len(structure) != 1:
+            raise ValueError('all models must have the same compartments and dosing type.')
+        if any(m.flows for m in models):
+            raise ValueError('models with flows between compartments cannot form a population.')
+        volumes = numpy.array([m.volumes for m in models])
+        rates = numpy.array([m.transition_rates for m in models])
+        return cls(
+            volumes[:, 0], rates[:, 0], volumes[:, 1:], rates[:, 1:],
+            None if models[0].k_a is None else [m.k_a for m in models],
+        )
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Creates a population from a table of parameters held as
+        columns, with one row per patient. Every row is validated at
+        once, without creating an object per patient.
+
+        The parameter columns are named as in
+        :func:`pkmodel.parameter_sweep.expand_grid`: 'v_c', 'cl',
+        'v_p<i>' and 'q_p<i>' for i=1..P, and optionally 'k_a'. Other
+        columns, such as patient IDs or covariates, are ignored.
+
+        Args:
+            columns: A mapping from column names to 1D arrays, such as a
+                dict of arrays, a numpy structured array, an .npz file
+                opened with numpy.load, or a pandas DataFrame or pyarrow
+                Table.
+
+        Returns:
+            A Population with one patient per row.
+
+        Raises:
+            TypeError: If a parameter column is not numeric.
+            ValueError: If parameter columns are missing or have
+                different lengths, or a row has a volume which is not
+                greater than 0, a negative rate or a value which is not
+                finite.
+        """
+        names = _column_names(columns)
+        n_peripheral = len([name for name in names if re.fullmatch(r'v_p\d+', name)])
+        parameters = ['v_c', 'cl']
+        for i in range(1, n_peripheral + 1):
+            parameters += ['v_p{0}'.format(i), 'q_p{0}'.format(i)]
+        if 'k_a' in names:
+            parameters.append('k_a')
+        unexpected = {name for name in names if _PERIPHERAL.fullmatch(name)} - set(parameters)
+        if unexpected or not set(parameters) <= set(names):
+            raise ValueError('the columns must be v_c, cl, optionally k_a, and v_p<i>, q_p<i> for i=1..P.')
+        try:
+            values = [numpy.asarray(columns[name], dtype=float) for name in parameters]
+        except (TypeError, ValueError):
+            raise TypeError('parameter columns must be numeric.')
+        if len({v.shape for v in values}) != 1 or values[0].ndim != 1:
+            raise ValueError('parameter columns must be 1D arrays of the same length.')
+        # Argument validation
+        values = numpy.array(values)
+        volumes = values[0:2 + 2 * n_peripheral:2]
+        invalid = ~numpy.isfinite(values).all(axis=0) | (values < 0).any(axis=0) | (volumes == 0).any(axis=0)
+        if invalid.any():
+            raise ValueError('row {0}: volumes must be greater than 0, and all parameters finite and greater than '
+                             'or equal to 0.'.format(numpy.argmax(invalid)))
+        return cls(
+            values[0], values[1], values[2:2 + 2 * n_peripheral:2].T, values[3:3 + 2 * n_peripheral:2].T,
+            values[-1] if 'k_a' in names else None,
+        )
+
+    @classmethod
+    def read_csv(cls, path, delimiter=','):
+        """Creates a population from a CSV file, whose header row names
+        the columns, see :meth:`from_columns`. Only the parameter
+        columns are parsed, in a single pass, so other columns may hold
+        text.
+
+        Args:
+            path: The path of the file.
+            delimiter: The delimiter between columns.
+
+        Returns:
+            A Population with one patient per row.
+
+        Raises:
+            ValueError: If the parameter columns are invalid, see
+                :meth:`from_columns`, or hold values which are not
+                numbers.
+        """
+        with open(path) as f:
+            header = [name.strip().strip('"') for name in f.readline().split(delimiter)]
+            used = [i for i, name in enumerate(header) if name in ['v_c', 'cl', 'k_a'] or _PERIPHERAL.fullmatch(name)]
+            if not used:
+                raise ValueError('the columns must be v_c, cl, optionally k_a, and v_p<i>, q_p<i> for i=1..P.')
+            table = numpy.loadtxt(f, delimiter=delimiter, usecols=used, ndmin=2)
+        return cls.from_columns({header[i]: table[:, j] for j, i in enumerate(used)})
+
+    def __len__(self):
+        return len(self.central_volume)
+
+    def __getitem__(self, index):
+        """Returns the sub-population of a slice or array of patient
+        indices.
+        """
+        if numpy.ndim(index) == 0 and not isinstance(index, slice):
+            index = [index]
+        return Population(
+            self.central_volume[index], self.clearance[index], self.peripheral_volumes[index],
+            self.peripheral_rates[index], None if self.k_a is None else self.k_a[index],
+        )
+
+    @property
+    def n_states(self) -> int:
+        """The number of state variables of each patient, ordered as in
+        :meth:`pkmodel.Model.compile`.
+        """
+        n = self.peripheral_volumes.shape[1] + 1
+        if self.k_a is not None:
+            n += 1
+        return n
+
+    @property
+    def state_names(self) -> list:
+        """The names of the state variables of each patient, see
+        :attr:`pkmodel.Model.state_names`.
+        """
+        names = ['q_c'] + ['q_p{0}'.format(i + 1) for i in range(self.peripheral_volumes.shape[1])]
+        if self.k_a is not None:
+            names.insert(0, 'q_0')
+        return names
+
+    def events(self, protocols):
+        """Returns the discrete doses of each patient's protocol as
+        boluses and infusions into the stacked state vector, see
+        :meth:`pkmodel.Protocol.events`.
+        """
+        n = self.n_states
+        per_patient = [p.events(self.state_names) for p in protocols]
+        if len(protocols) == 1:
+            boluses, infusions = per_patient[0]
+            patients = numpy.arange(len(self)) * n
+            table = protocols[0].dose_func
+            if _is_patient_table(table):
+                # One piecewise-constant rate per patient, as infusions
+                stops = numpy.append(table.times[1:], numpy.inf)
+                infusions = infusions + list(zip(table.times, stops, table.rates.T, [0] * len(stops)))
+            return (
+                [(t, a, patients + s) for t, a, s in boluses],
+                [(t0, t1, r, patients + s) for t0, t1, r, s in infusions],
+            )
+        boluses = []
+        infusions = []
+        for k, (b, i) in enumerate(per_patient):
+            boluses.extend((t, a, k * n + s) for t, a, s in b)
+            infusions.extend((t0, t1, r, k * n + s) for t0, t1, r, s in i)
+        return boluses, infusions
+
+    def compile(self):
+        """Compiles the parameters of every patient into the linear
+        system dq/dt = A q + b Dose(t).
+
+        Returns:
+            A tuple (A, b) where A is the (N, n_states, n_states) array
+            of rate matrices and b is the dosing input vector of length
+            n_states, shared by all patients.
+        """
+        n = self.n_states
+        c = 0 if self.k_a is None else 1
+        p = numpy.arange(c + 1, n)
+        v_c = self.central_volume
+        v_p = self.peripheral_volumes
+        q_p = self.peripheral_rates
+        A = numpy.zeros((len(self), n, n))
+        A[:, c, c] = -(self.clearance + q_p.sum(axis=1)) / v_c
+        A[:, c, p] = q_p / v_p
+        A[:, p, c] = q_p / v_c[:, None]
+        A[:, p, p] = -q_p / v_p
+        if self.k_a is not None:
+            A[:, 0, 0] = -self.k_a
+            A[:, c, 0] = self.k_a
+        b = numpy.zeros(n)
+        b[0] = 1.0
+        return A, b
+
+    def solve(self, protocol, method='auto', t_eval=None):
+        """Solves the PK model of every patient together, using scipy's
+        solve_ivp function on the stacked system.
+
+        A shared protocol's dose_func is called once per step with the
+        (N, n_states) array of drug quantities, and must return either a
+        scalar or an array of shape (N,).
+
+        With a list of protocols, one per patient, each dose_func is
+        called with that patient's drug quantities, except in two cases.
+        Piecewise-linear DoseTables are stacked into one table and
+        evaluated together. A vectorized dose_func shared by k patients
+        is called once with their (k, n_states) drug quantities, and
+        must return a scalar or an array of shape (k,).
+
+        Piecewise-constant DoseTables are applied as infusions, and
+        discrete doses are applied exactly (see
+        :func:`pkmodel.model.integrate`). All protocols must have the
+        same time.
+
+        Args:
+            protocol: A Protocol shared by all patients, or a list of
+                one Protocol per patient.
+            method: The integration method passed to solve_ivp,
+                'auto' (the default) to choose it from the stiffest
+                patient, see :meth:`pkmodel.Model.solve`, or
+                'exponential' to step every patient over the t_eval
+                grid together, see :func:`pkmodel.propagator.propagate`.
+            t_eval: Optional times at which to store the solution, by
+                default 1000 points spanning the protocol time.
+
+        Returns:
+            A solution whose y attribute has shape (N, n_states,
+            len(t)), and whose method attribute is the method used.
+
+        Raises:
+            TypeError: If protocol is not a Protocol or list of
+                Protocols.
+            ValueError: If the protocols do not match the population.
+        """
+        protocols = self.check_protocols(protocol)
+        time = protocols[0].time
+        if t_eval is None:
+            t_eval = numpy.linspace(0, time, 1000)
+        if method == 'exponential':
+            return self._propagate(protocols, t_eval)
+        rhs, y0, options = self.system(protocols, method)
+        sol = pk.model.integrate(rhs, y0, time, t_eval, **options)
+        sol.y = sol.y.reshape(len(self), self.n_states, -1)
+        sol.method = options['method']
+        return sol
+
+    def metrics(self, protocol, threshold=None, compartment='q_c', auc='exact', method='auto'):
+        """Computes summary metrics of the concentration in a compartment
+        of every patient together, without storing the solution, see
+        :meth:`pkmodel.Model.metrics`.
+
+        Args:
+            protocol: A Protocol shared by all patients.
+            threshold: An optional concentration, for the time spent at
+                or above it, or an array of one per patient.
+            compartment: The state name of the compartment, 'q_c' or a
+                peripheral compartment.
+            auc: 'exact' or 'trapezoid'.
+            method: The solver method, see :meth:`solve`.
+
+        Returns:
+            An OptimizeResult as returned by
+            :meth:`pkmodel.Model.metrics`, with arrays of one value per
+            patient and troughs of shape (N, len(trough_times)).
+
+        Raises:
+            TypeError: If protocol is not a Protocol.
+            ValueError: If compartment is not a compartment with a
+                volume.
+        """
+        # Argument validation
+        if not isinstance(protocol, pk.Protocol):
+            raise TypeError('protocol must be type pk.Protocol.')
+        if compartment not in self.state_names or compartment == 'q_0':
+            raise ValueError('compartment must be q_c or a peripheral compartment.')
+        volume = self.central_volume if compartment == 'q_c' else self.peripheral_volumes[:, int(compartment[3:]) - 1]
+        rhs, y0, options = self.system([protocol], method)
+        solver_steps = pk.model.steps(rhs, y0, protocol.time, **options)
+        result = pk.metrics.summarize(
+            solver_steps, self.n_states, self.state_names.index(compartment), volume,
+            threshold, [d.time for d in protocol.doses], auc,
+        )
+        result.method = options['method']
+        return result
+
+    def system(self, protocols, method='auto'):
+        """Returns the stacked system of every patient, as solved by
+        :meth:`solve` with the solve_ivp methods.
+
+        Args:
+            protocols: A list of one Protocol shared by all patients, or
+                of one Protocol per patient, see :meth:`check_protocols`.
+            method: The solver method, or 'auto' to choose it.
+
+        Returns:
+            A tuple (rhs, y0, options) of the rhs of the raveled (N,
+            n_states) drug quantities, their initial values, and the
+            further arguments of :func:`pkmodel.model.integrate` and
+            :func:`pkmodel.model.steps`, including the method.
+        """
+        A, b = self.compile()
+        N, n = len(self), self.n_states
+        y0 = numpy.zeros((N, n))
+        y0[:, 0] = [p.initial_dose for p in protocols]
+        doses = _dose_func(protocols)
+
+        def rhs(t, y):
+            Y = y.reshape(N, n)
+            dY = numpy.einsum('kij,kj->ki', A, Y)
+            dY += numpy.multiply.outer(numpy.broadcast_to(doses(t, Y), (N,)), b)
+            return dY.ravel()
+
+        method, atol = pk.model.resolve_method(A, protocols, method)
+        boluses, infusions = self.events(protocols)
+        # The solver bounds the RMS error over all N * n states, so the
+        # tolerances are scaled by 1 / sqrt(N) to bound the RMS error of
+        # each patient's states as in Model.solve
+        scale = 1 / numpy.sqrt(N)
+        return rhs, y0.ravel(), dict(
+            method=method, jac=_jacobian(A, method), boluses=boluses, infusions=infusions,
+            breakpoints=numpy.concatenate([p.breakpoints for p in protocols]), atol=atol * scale,
+            rtol=RTOL * scale,
+        )
+
+    def check_protocols(self, protocol):
+        """Checks that a protocol can be solved for every patient.
+
+        Args:
+            protocol: A Protocol shared by all patients, or a list of
+                one Protocol per patient.
+
+        Returns:
+            A list of either the shared Protocol, or the N protocols.
+
+        Raises:
+            TypeError: If protocol is not a Protocol or list of
+                Protocols.
+            ValueError: If the number of protocols is not 1 or N, or
+                the protocols have different times.
+        """
+        protocols = protocol if type(protocol) is list else [protocol]
+        for p in protocols:
+            if not isinstance(p, pk.Protocol):
+                raise TypeError('protocol must be type pk.Protocol or a list of pk.Protocol.')
+        if len(protocols) not in [1, len(self)]:
+            raise ValueError('there must be one protocol per patient.')
+        if len({p.time for p in protocols}) != 1:
+            raise ValueError('all protocols must have the same time.')
+        return protocols
+
+    def _propagate(self, protocols, t_eval):
+        """Solves the stacked system with the exponential integrator,
+        see :func:`pkmodel.propagator.propagate`.
+        """
+        A, b = self.compile()
+        y0 = numpy.zeros((len(self), self.n_states))
+        y0[:, 0] = [p.initial_dose for p in protocols]
+        doses = _dose_func(protocols)
+        boluses, infusions = self.events(protocols)
+        sol = pk.propagator.propagate(
+            A, y0, protocols[0].time, t_eval, b, None if doses is pk.protocol.no_dose else doses,
+            boluses, infusions, numpy.concatenate([p.breakpoints for p in protocols]),
+        )
+        sol.method = 'exponential'
+        return sol
+
+
+def _jacobian(A, method):
+    """Returns the block-diagonal Jacobian of the stacked system for the
+    implicit methods, or None.
+    """
+    if method not in pk.model.IMPLICIT_METHODS:
+        return None
+    J = scipy.sparse.block_diag(A, format='csc')
+    if method == 'LSODA':
+        # LSODA only accepts a dense Jacobian
+        J = J.toarray()
+    return lambda t, y: J
+
+
+def _dose_func(protocols):
+    """Returns a function giving the dose rate of each patient from the
+    time and the (N, n_states) array of drug quantities.
+
+    With a list of protocols, single-patient DoseTables are stacked into
+    one table, and a vectorized dose_func shared by several protocols is
+    called once with the drug quantities of all of those patients, so
+    that only the remaining dose functions are called per patient.
+    """
+    dose_funcs = [p.continuous_dose_func for p in protocols]
+    if len(protocols) == 1:
+        return pk.protocol.no_dose if _is_patient_table(dose_funcs[0]) else dose_funcs[0]
+    batches, single = _dose_batches(protocols, dose_funcs)
+    if not batches and not single:
+        return pk.protocol.no_dose
+    if len(batches) == 1 and not single and len(batches[0][1]) == len(protocols):
+        return batches[0][0]
+
+    def doses(t, Y):
+        rates = numpy.zeros(len(Y))
+        for f, patients in batches:
+            rates[patients] = f(t, Y[patients])
+        for k in single:
+            rates[k] = dose_funcs[k](t, Y[k])
+        return rates
+    return doses
+
+
+def _dose_batches(protocols, dose_funcs):
+    """Groups the patients with a dose function into batches of
+    (dose_func, patients), each evaluated in one call, and a list of the
+    patients whose dose_func is called alone.
+    """
+    tables = []
+    shared = {}
+    single = []
+    for k, (p, f) in enumerate(zip(protocols, dose_funcs)):
+        if f is pk.protocol.no_dose:
+            continue
+        if isinstance(f, pk.DoseTable) and f.rates.ndim == 1 and f.kind == 'linear':
+            tables.append(k)
+        elif p.vectorized and not isinstance(f, pk.DoseTable):
+            shared.setdefault(id(f), (f, []))[1].append(k)
+        else:
+            single.append(k)
+    batches = [(f, numpy.array(patients)) for f, patients in shared.values()]
+    if tables:
+        batches.append((pk.DoseTable.stack([dose_funcs[k] for k in tables]), numpy.array(tables)))
+    return batches, single
+
+
+def _is_patient_table(table):
+    """Returns whether table is a piecewise-constant DoseTable with a
+    row of rates per patient.
+    """
+    return isinstance(table, pk.DoseTable) and table.kind == 'constant' and table.rates.ndim == 2
+
+
+def _column_names(columns):
+    """Returns the names of the columns of a table.
+    """
+    if isinstance(columns, numpy.ndarray) and columns.dtype.names is not None:
+        return list(columns.dtype.names)
+    if hasattr(columns, 'column_names'):
+        # A pyarrow Table
+        return list(columns.column_names)
+    if hasattr(columns, 'keys'):
+        return list(columns.keys())
+    raise TypeError('columns must be a mapping from column names to arrays.')
+
+
+def _as_array(value, name, ndim):
+    """Converts a parameter to a float array with ndim dimensions.
+    """
+    try:
+        value = numpy.array(value, dtype=float)
+    except (TypeError, ValueError):
+        raise TypeError('{0} must be numeric.'.format(name))
+    if value.ndim != ndim:
+        raise ValueError('{0} must have {1} dimension(s).'.format(name, ndim))
+    return value
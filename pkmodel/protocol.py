@@ -1,27 +1,228 @@
+import numpy
+
+
+def no_dose(t, q):
+    """The default dose function: no drug is administered after the
+    initial dose.
+    """
+    return 0
+
+
+def _check_dose_func(dose_func, vectorized):
+    """Raises a TypeError if dose_func is not a callable which, given two
+    numeric inputs, returns a numeric output.
+    """
+    if not callable(dose_func):
+        raise TypeError('dose_func must be a callable function.')
+    try:
+        # Test out dose_func to see if given two numeric inputs, it returns a numeric output
+        if vectorized:
+            numpy.asarray(dose_func(numpy.array([1.0, 2.0]), 2), dtype=float)
+        else:
+            float(dose_func(1, 2))
+    except Exception:
+        raise TypeError('dose_func must take in two numeric inputs and return a numeric output.')
+
+
+def check_keys(spec, keys, name):
+    """Checks that a spec, such as the JSON description of a protocol
+    (see :meth:`Protocol.from_spec`), is a dict with known keys.
+
+    Args:
+        spec: The spec.
+        keys: The allowed keys.
+        name: The name of the spec in error messages.
+
+    Raises:
+        TypeError: If spec is not a dict.
+        ValueError: If spec has keys other than keys.
+    """
+    if not isinstance(spec, dict):
+        raise TypeError('{0} must be a dict.'.format(name))
+    unknown = set(spec) - set(keys)
+    if unknown:
+        raise ValueError('unknown {0} keys: {1}.'.format(name, ', '.join(sorted(unknown))))
+
+
+class Dose:
+    """A single dosing event of a Protocol: either a bolus, given
+    instantaneously, or a zero-order infusion of the amount at a
+    constant rate over the duration.
+
+    Attributes:
+        time: A float indicating when the dose starts [h].
+        amount: A float indicating the amount of drug given [ng].
+        duration: A float indicating the infusion duration [h], or 0
+            for a bolus.
+        compartment: An optional state name of the model, such as
+            'q_c' (see :attr:`pkmodel.Model.state_names`), that the
+            dose is given into. By default the dose is given into the
+            same compartment as the initial_dose.
+    """
+
+    def __init__(self, time, amount, duration=0, compartment=None):
+        # Argument validation
+        try:
+            self.time = float(time)
+            self.amount = float(amount)
+            self.duration = float(duration)
+        except (TypeError, ValueError):
+            raise TypeError('time, amount and duration must be numeric.')
+        if self.time < 0 or self.amount < 0 or self.duration < 0:
+            raise ValueError('time, amount and duration must be greater than or equal to 0')
+        if compartment is not None and type(compartment) is not str:
+            raise TypeError('compartment must be the name of a state, e.g. q_c.')
+        self.compartment = compartment
+
+    @classmethod
+    def repeat(cls, amount, interval, count, start=0, duration=0, compartment=None):
+        """Creates a regimen of identical doses given at a fixed
+        interval, e.g. every 8 hours.
+
+        Args:
+            amount: The amount of each dose [ng].
+            interval: The time between the start of each dose [h].
+            count: The number of doses.
+            start: The time of the first dose [h].
+            duration: The infusion duration of each dose [h].
+            compartment: The state name each dose is given into.
+
+        Returns:
+            A list of Doses.
+        """
+        if type(count) is not int or count < 0:
+            raise TypeError('count must be an integer greater than or equal to 0')
+        if float(interval) <= 0:
+            raise ValueError('interval must be greater than 0')
+        return [cls(start + i * interval, amount, duration, compartment) for i in range(count)]
+
+    @property
+    def is_bolus(self) -> bool:
+        return self.duration == 0
+
+    @property
+    def rate(self) -> float:
+        """The infusion rate [ng/h] of a zero-order infusion.
+        """
+        return self.amount / self.duration
+
+    def __str__(self):
+        """Returns the name of the dose as a string.
+        """
+        return self.name
+
+    @property
+    def name(self) -> str:
+        return '[time={0}, amount={1}, duration={2}, compartment={3}]'.format(
+            self.time, self.amount, self.duration, self.compartment)
+
+
+class DoseTable:
+    """A dose function given by a precompiled table of dose rates, which
+    is evaluated with a binary search and is vectorized over time. The
+    rates may be given for a single patient, or one row per patient.
+
+    A DoseTable can be used as the dose_func of a Protocol. Because its
+    breakpoints are known, solvers can restart the integration at each
+    of them, and a piecewise-constant table can be solved analytically.
+
+    Attributes:
+        times: A strictly increasing array of times [h], starting at 0.
+        rates: An array of dose rates [ng/h] at each time, of shape
+            (len(times),) or (N, len(times)) for N patients.
+        kind: Either 'constant', where rates[i] is given from times[i]
+            until times[i + 1], or 'linear', where the rate is linearly
+            interpolated between times. After the last time, the last
+            rate is held.
+    """
+
+    def __init__(self, times, rates, kind='constant'):
+        # Argument validation
+        try:
+            self.times = numpy.array(times, dtype=float)
+            self.rates = numpy.array(rates, dtype=float)
+        except (TypeError, ValueError):
+            raise TypeError('times and rates must be numeric arrays.')
+        if self.times.ndim != 1 or len(self.times) == 0 or self.times[0] != 0:
+            raise ValueError('times must be a non-empty 1D array starting at 0.')
+        if numpy.any(numpy.diff(self.times) <= 0):
+            raise ValueError('times must be strictly increasing.')
+        if self.rates.ndim not in [1, 2] or self.rates.shape[-1] != len(self.times):
+            raise ValueError('rates must have shape (len(times),) or (N, len(times)).')
+        if numpy.any(self.rates < 0):
+            raise ValueError('rates must be greater than or equal to 0')
+        if kind not in ['constant', 'linear']:
+            raise ValueError("kind must be 'constant' or 'linear'.")
+        self.kind = kind
+
+    @classmethod
+    def stack(cls, tables):
+        """Combines single-patient tables of the same kind into one
+        table with a row per patient, evaluated at the union of their
+        times.
+
+        Args:
+            tables: A non-empty list of DoseTables with 1D rates.
+
+        Returns:
+            A DoseTable with rates of shape (len(tables), T).
+        """
+        if len({t.kind for t in tables}) != 1 or any(t.rates.ndim != 1 for t in tables):
+            raise ValueError('tables must all be single-patient tables of the same kind.')
+        times = numpy.unique(numpy.concatenate([t.times for t in tables]))
+        return cls(times, [t(times) for t in tables], tables[0].kind)
+
+    def __call__(self, t, q=None):
+        """Returns the dose rate at time t, which may be an array. The
+        result has shape numpy.shape(t) for a single patient, or
+        (N,) + numpy.shape(t) for N patients.
+        """
+        t = numpy.asarray(t, dtype=float)
+        i = numpy.searchsorted(self.times, t, side='right') - 1
+        if self.kind == 'constant' or len(self.times) == 1:
+            return self.rates[..., numpy.maximum(i, 0)]
+        i = numpy.clip(i, 0, len(self.times) - 2)
+        w = numpy.clip((t - self.times[i]) / (self.times[i + 1] - self.times[i]), 0, 1)
+        return self.rates[..., i] * (1 - w) + self.rates[..., i + 1] * w
+
+    def infusions(self, state=0):
+        """Returns a single-patient, piecewise-constant table as
+        constant-rate infusions, in the format of
+        :meth:`Protocol.events`.
+        """
+        if self.kind != 'constant' or self.rates.ndim != 1:
+            raise ValueError('only single-patient piecewise-constant tables are infusions.')
+        stops = numpy.append(self.times[1:], numpy.inf)
+        return [(start, stop, rate, state)
+                for start, stop, rate in zip(self.times, stops, self.rates) if rate > 0]
+
+
 class Protocol:
     """The Protocol class contains the dosing protocol for the PK
     model. The user can specify the initial dosage, timespan of the
-    dosage, and an optional dosage function.
+    dosage, an optional dosage function and an optional schedule of
+    discrete doses.
 
     Attributes:
         initial_dose: A float indicating initial dosage [ng].
-        transition_rate: A float indicating either the rate [mL/h]
-        between the central compartment and the peripheral
-        compartment, in the case of a peripheral compartment, or the
-        clearance/elimination rate, in the case of a central
-        compartment.
+        time: A float indicating the timespan of the protocol [h].
+        dose_func: A callable dose_func(t, q) giving the dosing rate
+            [ng/h] into the dosing compartment, such as a DoseTable.
+        vectorized: Whether dose_func accepts an array of times, see
+            :meth:`dose_rate`, and the drug quantities of several
+            patients at once, see :meth:`pkmodel.Population.solve`.
+            DoseTables are always vectorized.
+        cache_key: An optional string identifying dose_func, which
+            allows solutions with an arbitrary callable dose_func to be
+            cached (see :class:`pkmodel.SolutionCache`).
+        doses: A list of Doses, given in addition to the initial dose
+            and dose_func.
     """
 
-    def __init__(self, initial_dose, time, dose_func=lambda x, y: 0):
+    def __init__(self, initial_dose, time, dose_func=no_dose, doses=None, vectorized=False, cache_key=None):
         # Argument validation
-        if not callable(dose_func):
-            raise TypeError('dose_func must be a callable function.')
-        try:
-            # Test out dose_func to see if given two numeric inputs, it returns a numeric output
-            val = dose_func(1, 2)
-            float(val)
-        except Exception:
-            raise TypeError('dose_func must take in two numeric inputs and return a numeric output.')
+        self.vectorized = bool(vectorized) or isinstance(dose_func, DoseTable)
+        _check_dose_func(dose_func, self.vectorized)
         self.dose_func = dose_func
         try:
             self.initial_dose = float(initial_dose)
@@ -32,6 +233,143 @@ class Protocol:
             raise ValueError('initial_dose must be greater than or equal to 0')
         if self.time <= 0:
             raise ValueError('time must be greater than 0')
+        if doses is None:
+            doses = []
+        if type(doses) is not list or not all(isinstance(d, Dose) for d in doses):
+            raise TypeError('doses must be a list of pk.Dose.')
+        self.doses = sorted(doses, key=lambda d: d.time)
+        if cache_key is not None and type(cache_key) is not str:
+            raise TypeError('cache_key must be a string.')
+        self.cache_key = cache_key
+
+    @classmethod
+    def from_spec(cls, spec):
+        """Creates a protocol with discrete doses from a spec of plain
+        values, such as one parsed from JSON::
+
+            {
+                "initial_dose": 1.0, "time": 24.0,
+                "doses": [{"time": 8.0, "amount": 1.0, "duration": 0.5, "compartment": "q_c"}]
+            }
+
+        where the doses, and the duration and compartment of each dose,
+        are optional.
+
+        Args:
+            spec: A dict with the keys initial_dose, time and doses.
+
+        Returns:
+            A Protocol.
+
+        Raises:
+            TypeError: If the spec or a dose is not a dict, or a value
+                has the wrong type.
+            ValueError: If the spec has unknown or missing keys, or
+                invalid values.
+        """
+        check_keys(spec, ('initial_dose', 'time', 'doses'), 'protocol')
+        if 'initial_dose' not in spec or 'time' not in spec:
+            raise ValueError('protocol must have an initial_dose and time.')
+        doses = spec.get('doses', [])
+        if type(doses) is not list:
+            raise TypeError('doses must be a list.')
+        for d in doses:
+            check_keys(d, ('time', 'amount', 'duration', 'compartment'), 'dose')
+        return cls(spec['initial_dose'], spec['time'], doses=[Dose(**d) for d in doses])
+
+    @property
+    def continuous_dose_func(self):
+        """The dose function which solvers add to the rhs. This is
+        dose_func, unless it is a single-patient piecewise-constant
+        DoseTable, which :meth:`events` returns as infusions instead so
+        that the rate is exactly constant between its times.
+        """
+        if self._table_is_infusions():
+            return no_dose
+        return self.dose_func
+
+    def _table_is_infusions(self):
+        table = self.dose_func
+        return isinstance(table, DoseTable) and table.kind == 'constant' and table.rates.ndim == 1
+
+    @property
+    def breakpoints(self):
+        """The times at which dose_func may be discontinuous, where
+        solvers should restart the integration.
+        """
+        if isinstance(self.dose_func, DoseTable):
+            return self.dose_func.times
+        return numpy.zeros(0)
+
+    def dose_rate(self, t, q=None):
+        """Evaluates dose_func at each of an array of times, in a single
+        call if dose_func is vectorized.
+
+        Args:
+            t: An array of times.
+            q: The drug quantities passed to dose_func.
+
+        Returns:
+            An array of dose rates, of shape (..., len(t)).
+        """
+        t = numpy.asarray(t, dtype=float)
+        if self.vectorized:
+            return numpy.asarray(self.dose_func(t, q), dtype=float)
+        return numpy.array([self.dose_func(s, q) for s in t], dtype=float).T
+
+    def events(self, state_names):
+        """Returns the discrete doses as boluses and infusions into the
+        states of a model. A single-patient piecewise-constant DoseTable
+        is included as infusions into the first state.
+
+        Args:
+            state_names: The state names of the model, see
+                :attr:`pkmodel.Model.state_names`. Doses without a
+                compartment are given into the first state.
+
+        Returns:
+            A tuple (boluses, infusions) of lists of (time, amount,
+            state) and (start, stop, rate, state) tuples, where state
+            is an index into the state vector.
+
+        Raises:
+            ValueError: If a dose is given into a compartment that is
+                not in state_names.
+        """
+        boluses = []
+        infusions = []
+        for dose in self.doses:
+            if dose.compartment is None:
+                state = 0
+            elif dose.compartment in state_names:
+                state = state_names.index(dose.compartment)
+            else:
+                raise ValueError('dose compartment {0} must be one of {1}.'.format(
+                    dose.compartment, ', '.join(state_names)))
+            if dose.is_bolus:
+                boluses.append((dose.time, dose.amount, state))
+            else:
+                infusions.append((dose.time, dose.time + dose.duration, dose.rate, state))
+        if self._table_is_infusions():
+            infusions.extend(self.dose_func.infusions(0))
+        return boluses, infusions
+
+    def extend(self, time=None, doses=None):
+        """Returns a copy of the protocol with a later end time and
+        further doses, which can be solved from a checkpoint of this
+        protocol with :meth:`pkmodel.Model.resume`.
+
+        Args:
+            time: The new end time, by default the same.
+            doses: An optional list of Doses to add.
+
+        Returns:
+            A new Protocol.
+        """
+        return Protocol(
+            self.initial_dose, self.time if time is None else time, self.dose_func,
+            self.doses + (doses or []), self.vectorized, self.cache_key,
+        )
 
     def __str__(self):
         """Returns the name of the protocol as a string.
@@ -40,6 +378,9 @@ class Protocol:
 
     @property
     def name(self) -> str:
+        if self.doses:
+            return '[initial_dose={0}, time={1}, doses={2}]'.format(
+                self.initial_dose, self.time, len(self.doses))
         return '[initial_dose={0}, time={1}]'.format(self.initial_dose, self.time)
 
     # @property
@@ -0,0 +1,269 @@
+"""Global sensitivity analysis of the summary metrics of a model, such as
+its AUC or Cmax, with respect to its parameters and the dose.
+
+Parameters are varied uniformly and independently between bounds, given
+as a dict such as ``{'cl': (0.5, 2.0), 'k_a': (0.5, 4.0)}``, using the
+parameter names of :func:`pkmodel.fitting.parameter_names` and
+'dose_scale', a factor multiplying every dose of the protocol. Samples
+are solved in large batches with :meth:`pkmodel.Population.metrics`.
+"""
+import pkmodel as pk
+import operator
+import scipy.optimize
+import numpy
+
+
+# The name of the factor multiplying every dose of the protocol. The
+# drug quantities are linear in the doses, so it scales the solution.
+DOSE_SCALE = 'dose_scale'
+
+# Metrics of :meth:`pkmodel.Population.metrics` which may be analysed,
+# and those which are proportional to the dose
+METRICS = ('cmax', 'tmax', 'auc', 'time_above')
+_LINEAR = ('cmax', 'auc', 'troughs')
+
+# Samplers of the unit hypercube
+SAMPLERS = ('sobol', 'lhs', 'random')
+
+
+def sobol(model, protocol, bounds, metrics='auc', n=1024, threshold=None, sampler='sobol', n_bootstrap=100,
+          confidence=0.95, block_size=4096, seed=None, method='auto'):
+    """Computes the first-order and total Sobol indices of summary
+    metrics with respect to parameters of a model.
+
+    Samples follow the scheme of Saltelli: n base samples in each of two
+    matrices A and B, and for each of the d parameters the matrix AB_i
+    of A with the i-th column of B, giving n (d + 2) solves. First-order
+    indices are estimated as in Saltelli et al. (2010) and total indices
+    as in Jansen (1999).
+
+    The samples are generated and solved in blocks of about block_size
+    solves, of which only running sums are kept, so memory does not
+    grow with n. Confidence intervals are estimated by the Poisson
+    bootstrap, which weights each base sample by a Poisson(1) count in
+    each replicate, and so can be computed from running sums too.
+
+    Args:
+        model: The Model whose parameters are varied, which gives the
+            values of those which are not. It must not have flows.
+        protocol: The Protocol the model is solved with.
+        bounds: A dict mapping parameter names to (low, high) bounds,
+            see :mod:`pkmodel.sensitivity`.
+        metrics: A metric name, one of 'cmax', 'tmax', 'auc' and
+            'time_above', or a function of the result of
+            :meth:`pkmodel.Population.metrics` returning one value per
+            patient, or a list of these.
+        n: The number of base samples. For the 'sobol' sampler it should
+            be a power of 2.
+        threshold: The threshold concentration of 'time_above'.
+        sampler: 'sobol' for a scrambled Sobol sequence, 'lhs' for
+            Latin hypercube samples, or 'random'.
+        n_bootstrap: The number of bootstrap replicates.
+        confidence: The confidence level of the intervals.
+        block_size: The approximate number of solves per block.
+        seed: An optional seed of the random numbers.
+        method: The solver method, see :meth:`pkmodel.Population.solve`.
+
+    Returns:
+        An OptimizeResult with attributes names, the parameter names,
+        first and total, the indices of shape (d,), first_conf and
+        total_conf, their confidence intervals of shape (d, 2), and
+        nfev, the number of solves. With a list of metrics, the indices
+        have a leading axis of one row per metric.
+
+    Raises:
+        TypeError: If model or protocol are of the wrong type.
+        ValueError: If the bounds, metrics or sampler are invalid.
+    """
+    names, low, high = _bounds(model, protocol, bounds)
+    functions, single = _metrics(metrics, threshold)
+    if sampler not in SAMPLERS:
+        raise ValueError('sampler must be one of {0}.'.format(', '.join(SAMPLERS)))
+    d, k = len(names), len(functions)
+    rng = numpy.random.default_rng(seed)
+    draw = _sampler(2 * d, sampler, rng)
+    # Blocks of base samples are a power of 2, which keeps the balance of
+    # Sobol points
+    rows = 2 ** int(numpy.log2(max(1, block_size // (d + 2))))
+    count = numpy.zeros((n_bootstrap + 1, 1))
+    sums = numpy.zeros((n_bootstrap + 1, k))
+    squares = numpy.zeros((n_bootstrap + 1, k))
+    first = numpy.zeros((n_bootstrap + 1, k, d))
+    total = numpy.zeros((n_bootstrap + 1, k, d))
+    shift = None
+    for start in range(0, n, rows):
+        m = min(rows, n - start)
+        u = low + (high - low) * draw(m).reshape(m, 2, d)
+        A, B = u[:, 0], u[:, 1]
+        X = numpy.concatenate([A, B] + [numpy.where(numpy.arange(d) == i, B, A) for i in range(d)])
+        Y = _evaluate(model, protocol, names, X, functions, threshold, method, block_size).reshape(k, d + 2, m)
+        if shift is None:
+            # Shifting the outputs by about their mean avoids cancellation
+            # in the variance
+            shift = Y[:, 0].mean(axis=1)[:, None, None]
+        Y = Y - shift
+        f_A, f_B, f_AB = Y[:, 0], Y[:, 1], Y[:, 2:]
+        w = numpy.vstack([numpy.ones(m), rng.poisson(1.0, (n_bootstrap, m))])
+        count += w.sum(axis=1, keepdims=True)
+        sums += w @ (f_A + f_B).T
+        squares += w @ (f_A ** 2 + f_B ** 2).T
+        first += numpy.einsum('rm,kdm->rkd', w, f_B[:, None] * (f_AB - f_A[:, None]))
+        total += numpy.einsum('rm,kdm->rkd', w, (f_A[:, None] - f_AB) ** 2)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        variance = (squares / (2 * count) - (sums / (2 * count)) ** 2)[..., None]
+        first = first / count[..., None] / variance
+        total = total / (2 * count[..., None]) / variance
+    alpha = (1 - confidence) / 2
+    result = scipy.optimize.OptimizeResult(
+        names=names, first=first[0], total=total[0],
+        first_conf=numpy.moveaxis(numpy.quantile(first[1:], [alpha, 1 - alpha], axis=0), 0, -1),
+        total_conf=numpy.moveaxis(numpy.quantile(total[1:], [alpha, 1 - alpha], axis=0), 0, -1),
+        nfev=n * (d + 2),
+    )
+    if single:
+        for key in ['first', 'total', 'first_conf', 'total_conf']:
+            result[key] = result[key][0]
+    return result
+
+
+def morris(model, protocol, bounds, metrics='auc', trajectories=20, levels=4, threshold=None, seed=None,
+           block_size=4096, method='auto'):
+    """Screens the parameters of a model by the elementary effects
+    method of Morris (1991), which costs trajectories (d + 1) solves for
+    d parameters, far fewer than :func:`sobol`.
+
+    Each trajectory starts at a random point of a grid of levels values
+    per parameter, and changes one parameter at a time, in a random
+    order, by delta = levels / (2 (levels - 1)) of its range. The change
+    in a metric over each step, divided by delta, is an elementary
+    effect of that parameter.
+
+    Args:
+        model: The Model whose parameters are varied, see :func:`sobol`.
+        protocol: The Protocol the model is solved with.
+        bounds: A dict mapping parameter names to (low, high) bounds.
+        metrics: A metric or list of metrics, see :func:`sobol`.
+        trajectories: The number of trajectories.
+        levels: The even number of grid levels per parameter.
+        threshold: The threshold concentration of 'time_above'.
+        seed: An optional seed of the random numbers.
+        block_size: The maximum number of solves per batch.
+        method: The solver method, see :meth:`pkmodel.Population.solve`.
+
+    Returns:
+        An OptimizeResult with attributes names, the parameter names,
+        and mu_star, mu and sigma, the mean absolute value, mean and
+        standard deviation of the elementary effects of each parameter
+        per unit of its range, of shape (d,). With a list of metrics,
+        they have a leading axis of one row per metric.
+
+    Raises:
+        TypeError: If model or protocol are of the wrong type.
+        ValueError: If the bounds, metrics or levels are invalid.
+    """
+    names, low, high = _bounds(model, protocol, bounds)
+    functions, single = _metrics(metrics, threshold)
+    if type(levels) is not int or levels < 2 or levels % 2:
+        raise ValueError('levels must be an even integer greater than or equal to 2.')
+    d, r = len(names), trajectories
+    rng = numpy.random.default_rng(seed)
+    delta = levels / (2 * (levels - 1))
+    order = numpy.argsort(rng.random((r, d)), axis=1)
+    steps = numpy.zeros((r, d + 1, d))
+    steps[numpy.arange(r)[:, None], numpy.arange(1, d + 1), order] = delta
+    u = rng.integers(0, levels // 2, (r, 1, d)) / (levels - 1) + numpy.cumsum(steps, axis=1)
+    X = low + (high - low) * u.reshape(-1, d)
+    Y = _evaluate(model, protocol, names, X, functions, threshold, method, block_size).reshape(len(functions), r, d + 1)
+    # Step j of a trajectory changes the parameter order[j]
+    effects = numpy.empty((len(functions), r, d))
+    effects[:, numpy.arange(r)[:, None], order] = numpy.diff(Y, axis=2) / delta
+    result = scipy.optimize.OptimizeResult(
+        names=names, mu_star=numpy.abs(effects).mean(axis=1), mu=effects.mean(axis=1),
+        sigma=effects.std(axis=1, ddof=1) if r > 1 else numpy.zeros((len(functions), d)),
+        nfev=r * (d + 1),
+    )
+    if single:
+        for key in ['mu_star', 'mu', 'sigma']:
+            result[key] = result[key][0]
+    return result
+
+
+def _bounds(model, protocol, bounds):
+    """Validates the arguments of an analysis, returning the parameter
+    names and arrays of their lower and upper bounds.
+    """
+    # Argument validation
+    if not isinstance(model, pk.Model):
+        raise TypeError('model must be type pk.Model.')
+    if not isinstance(protocol, pk.Protocol):
+        raise TypeError('protocol must be type pk.Protocol.')
+    if model.flows:
+        raise ValueError('models with flows between compartments cannot be analysed.')
+    if not isinstance(bounds, dict) or not bounds:
+        raise TypeError('bounds must be a non-empty dict of (low, high) bounds.')
+    unknown = set(bounds) - set(pk.fitting.parameter_names(model) + [DOSE_SCALE])
+    if unknown:
+        raise ValueError('unknown parameters: {0}.'.format(', '.join(sorted(unknown))))
+    low, high = numpy.array(list(bounds.values()), dtype=float).reshape(-1, 2).T
+    if numpy.any(low < 0) or numpy.any(high <= low):
+        raise ValueError('bounds must satisfy 0 <= low < high.')
+    return list(bounds), low, high
+
+
+def _metrics(metrics, threshold):
+    """Returns a list of functions of the result of
+    :meth:`pkmodel.Population.metrics`, and whether a single metric was
+    given.
+    """
+    single = type(metrics) is str or callable(metrics)
+    functions = []
+    for metric in [metrics] if single else list(metrics):
+        if callable(metric):
+            functions.append(metric)
+        elif metric not in METRICS:
+            raise ValueError('metrics must be functions or one of {0}.'.format(', '.join(METRICS)))
+        elif metric == 'time_above' and threshold is None:
+            raise ValueError('time_above needs a threshold.')
+        else:
+            functions.append(operator.itemgetter(metric))
+    return functions, single
+
+
+def _sampler(d, sampler, rng):
+    """Returns a function drawing the next n points of the unit
+    hypercube of dimension d.
+    """
+    if sampler == 'random':
+        return lambda n: rng.random((n, d))
+    # Imported here, as scipy.stats is slow to import
+    import scipy.stats.qmc
+    if sampler == 'sobol':
+        return scipy.stats.qmc.Sobol(d, seed=rng).random
+    return scipy.stats.qmc.LatinHypercube(d, seed=rng).random
+
+
+def _evaluate(model, protocol, names, X, functions, threshold, method, block_size):
+    """Returns the metrics of the model with parameters X, an array of
+    shape (N, len(names)), as an array of shape (len(functions), N).
+    """
+    values = pk.fitting.get_parameters(model)
+    Y = numpy.empty((len(functions), len(X)))
+    for start in range(0, len(X), block_size):
+        block = X[start:start + block_size]
+        columns = {name: numpy.full(len(block), value) for name, value in values.items()}
+        scale = numpy.ones(len(block))
+        for name, x in zip(names, block.T):
+            if name == DOSE_SCALE:
+                scale = x
+            else:
+                columns[name] = x
+        population = pk.Population.from_columns(columns)
+        # The solution is proportional to the dose, so it is solved for
+        # the protocol's doses and scaled
+        with numpy.errstate(divide='ignore'):
+            result = population.metrics(protocol, None if threshold is None else threshold / scale, method=method)
+        for key in _LINEAR:
+            result[key] = result[key] * scale.reshape((-1,) + (1,) * (result[key].ndim - 1))
+        for i, f in enumerate(functions):
+            Y[i, start:start + block_size] = f(result)
+    return Y
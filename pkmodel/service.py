@@ -0,0 +1,372 @@
+"""An asyncio simulation service, which solves PK models described by
+JSON specs for many concurrent clients.
+
+Concurrent requests are coalesced into batches, and the requests of a
+batch which share the same compartments, protocol time and solver
+settings are solved together as a single :class:`pkmodel.Population`.
+Identical requests in flight at the same time are solved once. Batches
+are solved by a pool of workers, so the event loop is never blocked by
+a solve, and at most one batch per worker is solved at a time: while
+the workers are busy, new requests queue up and form the next batches.
+
+A request spec is a dict (parsed from JSON) such as::
+
+    {
+        "parameters": {"v_c": 1.0, "cl": 1.0, "v_p1": 2.0, "q_p1": 0.5, "k_a": 1.0},
+        "protocol": {
+            "initial_dose": 1.0, "time": 24.0,
+            "doses": [{"time": 8.0, "amount": 1.0, "duration": 0.5, "compartment": "q_0"}]
+        },
+        "t_eval": [0.0, 1.0, 2.0],
+        "method": "auto"
+    }
+
+with parameters named as in :func:`pkmodel.parameter_sweep.expand_grid`,
+and optional doses, t_eval and method. Serve specs over a loopback
+socket as newline-delimited JSON with::
+
+    python -m pkmodel.service --port 8765
+
+or solve them in-process::
+
+    async with pkmodel.service.SimulationService() as service:
+        sol = await service.submit(spec, timeout=1.0)
+"""
+import pkmodel as pk
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import json
+import os
+import sys
+import scipy.optimize
+import numpy
+
+
+# Keys of a request spec, whose protocol is given as for
+# :meth:`pkmodel.Protocol.from_spec`
+SPEC_KEYS = ('parameters', 'protocol', 't_eval', 'method')
+
+
+def parse(spec):
+    """Parses a request spec.
+
+    Args:
+        spec: A request spec dict, see :mod:`pkmodel.service`.
+
+    Returns:
+        A tuple (parameters, protocol, t_eval, method) of the dict of
+        parameters, the Protocol, a tuple of times or None, and the
+        solver method.
+
+    Raises:
+        TypeError: If the spec or a part of it has the wrong type.
+        ValueError: If the spec has unknown or missing keys, or invalid
+            values.
+    """
+    # Argument validation
+    pk.protocol.check_keys(spec, SPEC_KEYS, 'spec')
+    parameters = spec.get('parameters')
+    if not isinstance(parameters, dict):
+        raise TypeError('parameters must be a dict.')
+    try:
+        parameters = {name: float(value) for name, value in parameters.items()}
+    except (TypeError, ValueError):
+        raise TypeError('parameters must be numeric.')
+    population = pk.parameter_sweep.to_population([parameters])
+    protocol = pk.Protocol.from_spec(spec.get('protocol'))
+    protocol.events(population.state_names)
+    t_eval = spec.get('t_eval')
+    if t_eval is not None:
+        t_eval = tuple(numpy.asarray(t_eval, dtype=float).ravel().tolist())
+    method = spec.get('method', 'auto')
+    if method not in ('auto',) + pk.model.SOLVERS:
+        raise ValueError('method must be auto or one of {0}.'.format(', '.join(pk.model.SOLVERS)))
+    return parameters, protocol, t_eval, method
+
+
+class _Request:
+    """A request in flight, shared by every identical submission.
+    """
+    def __init__(self, key, parameters, protocol, t_eval, method):
+        self.key = key
+        self.parameters = parameters
+        self.state_names = pk.parameter_sweep.to_population([parameters]).state_names
+        self.protocol = protocol
+        self.t_eval = t_eval
+        self.method = method
+        # Requests in the same group are solved as one Population
+        self.group = (tuple(sorted(parameters)), protocol.time, t_eval, method)
+        self.future = asyncio.get_running_loop().create_future()
+        self.waiters = 0
+        self.dispatched = False
+        self.dropped = False
+
+
+class SimulationService:
+    """Solves request specs submitted concurrently from an event loop,
+    see :mod:`pkmodel.service`.
+
+    Use the service as an async context manager, which starts its
+    dispatcher and worker pool, and shuts them down on exit.
+
+    Args:
+        workers: The number of worker processes solving batches, by
+            default the number of CPUs. With 1 worker, batches are
+            solved in a thread of this process, avoiding the cost of
+            pickling the results.
+        max_batch: The maximum number of requests in a batch.
+        max_delay: The time [s] a batch waits for further requests once
+            a worker is free.
+        max_pending: The maximum number of distinct requests queued or
+            being solved. Further submissions wait for one to finish,
+            which pushes back on clients faster than the workers.
+
+    Attributes:
+        requests: The number of submitted requests.
+        duplicates: The number of requests which shared a request in
+            flight.
+        batches: The number of batches which have been solved.
+    """
+    def __init__(self, workers=None, max_batch=256, max_delay=0.001, max_pending=4096):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1 or max_batch < 1 or max_pending < 1:
+            raise ValueError('workers, max_batch and max_pending must be greater than 0.')
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.requests = 0
+        self.duplicates = 0
+        self.batches = 0
+        self._executor = None
+
+    async def __aenter__(self):
+        self._inflight = {}
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._free = asyncio.Semaphore(self.workers)
+        self._running = set()
+        if self.workers == 1:
+            self._executor = concurrent.futures.ThreadPoolExecutor(1)
+        else:
+            self._executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        self._dispatcher = asyncio.ensure_future(self._dispatch())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._dispatcher.cancel()
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(self._dispatcher, *self._running, return_exceptions=True)
+        for request in list(self._inflight.values()):
+            request.future.cancel()
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        self._executor = None
+
+    async def submit(self, spec, timeout=None):
+        """Solves a request spec.
+
+        Args:
+            spec: A request spec dict, see :mod:`pkmodel.service`.
+            timeout: An optional deadline [s] for the request, including
+                any time waiting to be queued. A request which expires
+                before its batch is solved is not solved.
+
+        Returns:
+            A solution with attributes t, y, of shape (n_states,
+            len(t)) and read-only, and state_names.
+
+        Raises:
+            TypeError: If the spec has the wrong types.
+            ValueError: If the spec is invalid.
+            TimeoutError: If the deadline passes first.
+            RuntimeError: If the service is not running, or the solve
+                failed.
+        """
+        if self._executor is None:
+            raise RuntimeError('the service must be started with async with.')
+        parameters, protocol, t_eval, method = parse(spec)
+        key = (tuple(sorted(parameters.items())), tuple(pk.cache.protocol_tokens(protocol)), t_eval, method)
+        self.requests += 1
+        return await asyncio.wait_for(self._submit(key, parameters, protocol, t_eval, method), timeout)
+
+    async def _submit(self, key, parameters, protocol, t_eval, method):
+        request = self._inflight.get(key)
+        if request is None:
+            await self._slots.acquire()
+            # An identical request may have been queued while waiting
+            request = self._inflight.get(key)
+            if request is None:
+                request = _Request(key, parameters, protocol, t_eval, method)
+                self._inflight[key] = request
+                self._queue.put_nowait(request)
+            else:
+                self._slots.release()
+                self.duplicates += 1
+        else:
+            self.duplicates += 1
+        request.waiters += 1
+        try:
+            return await asyncio.shield(request.future)
+        finally:
+            request.waiters -= 1
+            if not request.waiters and not request.dispatched and not request.future.done():
+                # Every submission of the request expired before it was solved
+                request.dropped = True
+                request.future.cancel()
+                self._finish(request)
+
+    def _finish(self, request):
+        if self._inflight.get(request.key) is request:
+            del self._inflight[request.key]
+            self._slots.release()
+
+    async def _dispatch(self):
+        """Collects queued requests into batches and solves each batch
+        as soon as a worker is free.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            await self._free.acquire()
+            end = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                if self._queue.empty():
+                    remaining = end - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(self._queue.get_nowait())
+            groups = collections.defaultdict(list)
+            for request in batch:
+                if not request.dropped:
+                    request.dispatched = True
+                    groups[request.group].append(request)
+            if not groups:
+                self._free.release()
+                continue
+            task = asyncio.ensure_future(self._solve(list(groups.values())))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _solve(self, groups):
+        try:
+            jobs = [(
+                [r.parameters for r in group], [r.protocol for r in group], group[0].t_eval, group[0].method,
+            ) for group in groups]
+            results = await asyncio.get_running_loop().run_in_executor(self._executor, _solve_jobs, jobs)
+        except Exception as e:
+            results = [e] * len(groups)
+        finally:
+            self._free.release()
+        self.batches += 1
+        for group, result in zip(groups, results):
+            for k, request in enumerate(group):
+                self._finish(request)
+                if request.future.done():
+                    continue
+                if not request.waiters:
+                    # Every submission expired while the batch was solved
+                    request.future.cancel()
+                    continue
+                if isinstance(result, Exception):
+                    request.future.set_exception(RuntimeError('the solve failed: {0}'.format(result)))
+                else:
+                    t, y = result
+                    y = y[k]
+                    y.flags.writeable = False
+                    request.future.set_result(scipy.optimize.OptimizeResult(
+                        t=t, y=y, state_names=request.state_names, success=True))
+
+
+def _solve_jobs(jobs):
+    """Solves each group of requests of a batch as one Population,
+    returning the times and drug quantities of each group, or the
+    exception raised by its solve.
+    """
+    results = []
+    for points, protocols, t_eval, method in jobs:
+        try:
+            results.append(pk.parameter_sweep.solve_parameter_sets(
+                points, protocols, method, None if t_eval is None else list(t_eval)))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+async def serve(service, host='127.0.0.1', port=0):
+    """Starts a server of newline-delimited JSON over TCP.
+
+    Each line sent by a client is a request spec, with optional keys
+    id, echoed in the response, and timeout, the deadline [s] of the
+    request. Requests on a connection are solved concurrently, and each
+    response is written as a line as soon as it is ready, holding id, t,
+    y and state_names, or id and error.
+
+    Args:
+        service: A running SimulationService.
+        host: The address to listen on, by default only the loopback
+            interface.
+        port: The port, by default any free port.
+
+    Returns:
+        An asyncio Server, whose sockets give the port.
+    """
+    return await asyncio.start_server(functools.partial(_handle, service), host, port)
+
+
+async def _handle(service, reader, writer):
+    tasks = set()
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        task = asyncio.ensure_future(_respond(service, line, writer))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    writer.close()
+
+
+async def _respond(service, line, writer):
+    response = {'id': None}
+    try:
+        spec = json.loads(line)
+        response['id'] = spec.pop('id', None) if isinstance(spec, dict) else None
+        timeout = spec.pop('timeout', None) if isinstance(spec, dict) else None
+        sol = await service.submit(spec, timeout)
+        response.update(t=sol.t.tolist(), y=sol.y.tolist(), state_names=sol.state_names)
+    except asyncio.TimeoutError:
+        response['error'] = 'TimeoutError: the request deadline passed.'
+    except Exception as e:
+        response['error'] = '{0}: {1}'.format(type(e).__name__, e)
+    writer.write(json.dumps(response).encode() + b'\n')
+    await writer.drain()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Serves PK model solves as newline-delimited JSON.')
+    parser.add_argument('--host', default='127.0.0.1', help='the address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='the port to listen on')
+    parser.add_argument('--workers', type=int, default=None, help='the number of worker processes')
+    args = parser.parse_args(args)
+
+    async def run():
+        async with SimulationService(args.workers) as service:
+            server = await serve(service, args.host, args.port)
+            async with server:
+                await server.serve_forever()
+    asyncio.run(run())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
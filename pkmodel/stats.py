@@ -0,0 +1,188 @@
+import contextlib
+import time
+import numpy
+
+
+# Phases of a solve which are timed
+PHASES = ('compile', 'dose', 'model', 'solver')
+
+# Collectors receiving the statistics of every solve, innermost last
+_collectors = []
+
+
+class SolveStats:
+    """Statistics of a single solve of a PK model, see the stats
+    argument of :meth:`pkmodel.Model.solve`.
+
+    The time of a solve is split into phases: 'compile', building the
+    rate matrix; 'dose', calls to the protocol's dose_func; 'model',
+    the rest of the rhs evaluations; and 'solver', everything else done
+    by the integrator (or by the analytic solution).
+
+    Attributes:
+        model: The name of the model which was solved.
+        protocol: The name of the protocol it was solved with.
+        method: The solver method.
+        success: Whether the solve succeeded.
+        nfev: The number of rhs evaluations.
+        njev: The number of Jacobian evaluations.
+        nlu: The number of LU decompositions.
+        step_sizes: An array of the size of each accepted step.
+        wall_time: A dict of the wall time [s] of each phase.
+        cpu_time: A dict of the CPU time [s] of each phase.
+    """
+    def __init__(self):
+        self.model = None
+        self.protocol = None
+        self.method = None
+        self.success = None
+        self.nfev = 0
+        self.njev = 0
+        self.nlu = 0
+        self.step_sizes = numpy.zeros(0)
+        self.wall_time = dict.fromkeys(PHASES, 0.0)
+        self.cpu_time = dict.fromkeys(PHASES, 0.0)
+
+    @property
+    def n_steps(self) -> int:
+        return len(self.step_sizes)
+
+    @property
+    def total_wall_time(self) -> float:
+        return sum(self.wall_time.values())
+
+    @property
+    def total_cpu_time(self) -> float:
+        return sum(self.cpu_time.values())
+
+    def __str__(self):
+        """Returns a one line summary of the statistics.
+        """
+        return '{0} [{1}] {2}: nfev={3}, njev={4}, steps={5}, wall={6:.3g}s ({7})'.format(
+            self.model, self.protocol, self.method, self.nfev, self.njev, self.n_steps,
+            self.total_wall_time,
+            ', '.join('{0}={1:.3g}s'.format(p, self.wall_time[p]) for p in PHASES),
+        )
+
+
+class StatsCollector:
+    """Aggregates the statistics of every solve made while it is active,
+    see :func:`collect_stats`.
+
+    Attributes:
+        solves: The list of SolveStats of each solve.
+    """
+    def __init__(self):
+        self.solves = []
+
+    def __len__(self):
+        return len(self.solves)
+
+    def add(self, stats):
+        self.solves.append(stats)
+
+    @property
+    def nfev(self) -> int:
+        return sum(s.nfev for s in self.solves)
+
+    @property
+    def wall_time(self) -> dict:
+        """The total wall time [s] of each phase over all solves.
+        """
+        return {p: sum(s.wall_time[p] for s in self.solves) for p in PHASES}
+
+    @property
+    def cpu_time(self) -> dict:
+        """The total CPU time [s] of each phase over all solves.
+        """
+        return {p: sum(s.cpu_time[p] for s in self.solves) for p in PHASES}
+
+    def slowest(self, n=10, key='wall_time'):
+        """Returns the n solves with the largest total wall time, or the
+        largest value of another SolveStats attribute such as 'nfev'.
+        """
+        def value(s):
+            return s.total_wall_time if key == 'wall_time' else getattr(s, key)
+        return sorted(self.solves, key=value, reverse=True)[:n]
+
+    def summary(self) -> str:
+        """Returns a multi-line summary of the collected statistics.
+        """
+        lines = ['{0} solves, nfev={1}'.format(len(self), self.nfev)]
+        wall, cpu = self.wall_time, self.cpu_time
+        for p in PHASES:
+            lines.append('  {0}: wall={1:.3g}s, cpu={2:.3g}s'.format(p, wall[p], cpu[p]))
+        return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def collect_stats():
+    """A context manager which collects the statistics of every
+    :meth:`pkmodel.Model.solve` made inside it::
+
+        with pk.collect_stats() as collector:
+            for model in models:
+                model.solve(protocol)
+        print(collector.summary())
+
+    Collectors may be nested, in which case each receives the
+    statistics. They are not shared between threads or processes.
+
+    Yields:
+        A StatsCollector.
+    """
+    collector = StatsCollector()
+    _collectors.append(collector)
+    try:
+        yield collector
+    finally:
+        _collectors.remove(collector)
+
+
+def active():
+    """Returns whether any collector is active.
+    """
+    return bool(_collectors)
+
+
+def publish(stats):
+    """Passes the statistics of a solve to every active collector.
+    """
+    for collector in _collectors:
+        collector.add(stats)
+
+
+class NullTimer:
+    """A PhaseTimer which does not time anything, used when no
+    statistics are requested.
+    """
+    @contextlib.contextmanager
+    def phase(self, name):
+        yield
+
+    def wrap(self, func, name):
+        return func
+
+
+class PhaseTimer:
+    """Accumulates wall and CPU time into the phases of a SolveStats.
+    """
+    def __init__(self, stats):
+        self.stats = stats
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.stats.wall_time[name] += time.perf_counter() - wall
+            self.stats.cpu_time[name] += time.process_time() - cpu
+
+    def wrap(self, func, name):
+        """Returns func, timing each call as the named phase.
+        """
+        def timed(*args):
+            with self.phase(name):
+                return func(*args)
+        return timed
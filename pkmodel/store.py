@@ -0,0 +1,221 @@
+import pkmodel as pk
+import json
+import os
+import tempfile
+import numpy
+
+
+class ResultStore:
+    """A columnar store of solutions on disk, with one row per patient
+    of the drug quantity in each compartment at each of a shared set of
+    times.
+
+    The drug quantities are appended in chunks to a raw binary file,
+    which is memory-mapped when read, so result sets larger than memory
+    can be written and read without loading them. Reading a patient, or
+    a compartment or time range of every patient, returns a view of the
+    file without copying it.
+
+    Create a store with :meth:`create`, and open an existing one with
+    ``ResultStore(directory)``.
+
+    Attributes:
+        directory: The directory holding the store.
+        state_names: The names of the stored compartments, see
+            :attr:`pkmodel.Model.state_names`.
+        t: The array of times of every solution.
+        dtype: The numpy dtype of the stored drug quantities.
+    """
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        self.directory = directory
+        self.state_names = meta['state_names']
+        self.dtype = numpy.dtype(meta['dtype'])
+        self.t = numpy.load(os.path.join(directory, 't.npy'))
+        self._count = meta['count']
+        self._y = None
+        self._ids = None
+        self._index = None
+
+    @classmethod
+    def create(cls, directory, state_names, t, dtype=float):
+        """Creates an empty store.
+
+        Args:
+            directory: A directory for the store, which is created if it
+                does not exist and must not hold another store.
+            state_names: The names of the compartments of the solutions.
+            t: The times of the solutions.
+            dtype: The dtype in which drug quantities are stored, e.g.
+                numpy.float32 to halve the size of the store.
+
+        Returns:
+            A ResultStore.
+
+        Raises:
+            TypeError: If state_names is not a list of strings.
+            ValueError: If the directory already holds a store.
+        """
+        if type(state_names) is not list or not all(type(name) is str for name in state_names):
+            raise TypeError('state_names must be a list of strings.')
+        t = numpy.asarray(t, dtype=float)
+        if t.ndim != 1:
+            raise ValueError('t must be 1 dimensional.')
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(os.path.join(directory, 'meta.json')):
+            raise ValueError('directory already holds a result store.')
+        numpy.save(os.path.join(directory, 't.npy'), t)
+        for name in ['y.bin', 'ids.bin']:
+            open(os.path.join(directory, name), 'wb').close()
+        _write_meta(directory, state_names, numpy.dtype(dtype).str, 0)
+        return cls(directory)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def n_states(self) -> int:
+        return len(self.state_names)
+
+    @property
+    def y(self):
+        """A read-only memory-mapped array of shape (N, n_states,
+        len(t)) of the stored drug quantities.
+        """
+        if self._y is None:
+            self._y = self._map('y.bin', self.dtype, (self._count, self.n_states, len(self.t)))
+        return self._y
+
+    @property
+    def ids(self):
+        """A read-only memory-mapped array of the patient ID of each
+        row.
+        """
+        if self._ids is None:
+            self._ids = self._map('ids.bin', numpy.int64, (self._count,))
+        return self._ids
+
+    def append(self, y, ids=None):
+        """Appends the solutions of one or more patients.
+
+        Args:
+            y: The drug quantities, of shape (n_states, len(t)) for one
+                patient or (N, n_states, len(t)), e.g. the y of a
+                :meth:`pkmodel.Model.solve` or
+                :meth:`pkmodel.Population.solve` solution.
+            ids: Optional integer patient IDs, by default numbering the
+                rows of the store.
+
+        Raises:
+            ValueError: If y has the wrong shape, or ids the wrong
+                length.
+        """
+        y = numpy.asarray(y, dtype=self.dtype)
+        if y.ndim == 2:
+            y = y[None]
+        if y.shape[1:] != (self.n_states, len(self.t)):
+            raise ValueError('y must have shape (N, {0}, {1}).'.format(self.n_states, len(self.t)))
+        if ids is None:
+            ids = numpy.arange(self._count, self._count + len(y))
+        ids = numpy.atleast_1d(numpy.asarray(ids, dtype=numpy.int64))
+        if ids.shape != (len(y),):
+            raise ValueError('there must be one id per patient.')
+        # The rows are written before the count is updated, so a store
+        # is never read with partially written rows
+        for name, array in [('y.bin', y), ('ids.bin', ids)]:
+            with open(os.path.join(self.directory, name), 'ab') as f:
+                f.write(numpy.ascontiguousarray(array).tobytes())
+        self._count += len(y)
+        _write_meta(self.directory, self.state_names, self.dtype.str, self._count)
+        self._y = self._ids = self._index = None
+
+    def solve(self, population, protocol, chunk_size=1000, ids=None, **options):
+        """Solves a population in chunks of patients, appending each
+        chunk to the store, so that only one chunk is held in memory.
+
+        Args:
+            population: The Population to solve.
+            protocol: A Protocol shared by all patients.
+            chunk_size: The number of patients solved together.
+            ids: Optional patient IDs, see :meth:`append`.
+            **options: Further options passed to
+                :meth:`pkmodel.Population.solve`.
+        """
+        if population.state_names != self.state_names:
+            raise ValueError('population must have the state names of the store.')
+        for start in range(0, len(population), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            sol = population[chunk].solve(protocol, t_eval=self.t, **options)
+            self.append(sol.y, None if ids is None else numpy.asarray(ids)[chunk])
+
+    def patient(self, id):
+        """Returns a view of the (n_states, len(t)) drug quantities of a
+        patient.
+
+        Raises:
+            KeyError: If there is no patient with that ID.
+        """
+        return self.y[self.rows([id])[0]]
+
+    def rows(self, ids):
+        """Returns the row of each of an array of patient IDs.
+
+        Raises:
+            KeyError: If there is no patient with one of the IDs.
+        """
+        if self._index is None:
+            order = numpy.argsort(self.ids, kind='stable')
+            self._index = order, numpy.asarray(self.ids)[order]
+        order, sorted_ids = self._index
+        ids = numpy.asarray(ids, dtype=numpy.int64)
+        i = numpy.minimum(numpy.searchsorted(sorted_ids, ids), max(len(sorted_ids) - 1, 0))
+        if not len(sorted_ids) or numpy.any(sorted_ids[i] != ids):
+            raise KeyError('no patient with that id.')
+        return order[i]
+
+    def select(self, patients=None, compartments=None, start=None, stop=None):
+        """Returns the drug quantities of some patients, compartments and
+        times. Selecting all patients, or a slice of rows, gives a view
+        of the file; selecting patients by ID copies their rows.
+
+        Args:
+            patients: Optional patient IDs, or a slice of rows.
+            compartments: An optional state name or list of state names.
+            start: An optional time from which to select.
+            stop: An optional time up to which (inclusive) to select.
+
+        Returns:
+            An array of shape (patients, compartments, times), without
+            the compartments axis if a single state name was given.
+        """
+        y = self.y
+        if isinstance(patients, slice):
+            y = y[patients]
+        elif patients is not None:
+            y = y[self.rows(numpy.atleast_1d(patients))]
+        if compartments is not None:
+            if type(compartments) is str:
+                compartments = self.state_names.index(compartments)
+            else:
+                compartments = [self.state_names.index(name) for name in compartments]
+                if compartments == list(range(compartments[0], compartments[-1] + 1)):
+                    compartments = slice(compartments[0], compartments[-1] + 1)
+            y = y[:, compartments]
+        first = 0 if start is None else numpy.searchsorted(self.t, start, side='left')
+        last = len(self.t) if stop is None else numpy.searchsorted(self.t, stop, side='right')
+        return y[..., first:last]
+
+    def _map(self, name, dtype, shape):
+        if 0 in shape:
+            return numpy.zeros(shape, dtype=dtype)
+        return numpy.memmap(os.path.join(self.directory, name), dtype=dtype, mode='r', shape=shape)
+
+
+def _write_meta(directory, state_names, dtype, count):
+    """Writes the metadata of a store atomically.
+    """
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'version': pk.VERSION, 'state_names': state_names, 'dtype': dtype, 'count': count}, f)
+    os.replace(tmp, os.path.join(directory, 'meta.json'))
@@ -0,0 +1,48 @@
+import unittest
+import contextlib
+import io
+import json
+import os
+import tempfile
+import pkmodel.benchmarks as benchmarks
+
+
+class BenchmarksTest(unittest.TestCase):
+    """
+    Tests the :mod:`pkmodel.benchmarks` module.
+    """
+    def test_benchmarks(self):
+        """
+        Tests the individual benchmarks.
+        """
+        result = benchmarks.benchmark_rhs(3, 1.0, repeat=1, number=10)
+        self.assertGreater(result['time_per_call'], 0)
+        result = benchmarks.benchmark_solve(3, None, 24.0, 'BDF', repeat=1)
+        self.assertEqual(set(result), {'wall_time', 'nfev', 'njev'})
+        self.assertGreater(result['nfev'], 0)
+        result = benchmarks.benchmark_population(5, 2, repeat=1)
+        self.assertEqual(set(result), {'time_per_patient', 'nfev'})
+
+    def test_compare(self):
+        """
+        Tests detection of regressions against a baseline.
+        """
+        baseline = {'results': {'a': {'wall_time': 1.0, 'nfev': 10}, 'b': {'wall_time': 1.0}}}
+        current = {'results': {'a': {'wall_time': 1.2, 'nfev': 10}, 'b': {'wall_time': 1.3}, 'c': {'nfev': 1}}}
+        self.assertEqual(benchmarks.compare(baseline, current), [('b', 'wall_time', 1.0, 1.3)])
+        current['results']['a']['nfev'] = 9
+        self.assertEqual(benchmarks.compare(baseline, current, tolerance=0.5), [('a', 'nfev', 10, 9)])
+
+    def test_main(self):
+        """
+        Tests running the quick suite and saving it as a baseline.
+        """
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'baseline.json')
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                self.assertEqual(benchmarks.main(['--quick', '--save', path]), 0)
+            with open(path) as f:
+                baseline = json.load(f)
+        self.assertEqual(set(baseline['results']), set(benchmarks.cases(quick=True)))
+        self.assertIn('rhs[iv, n_peripheral=1]', out.getvalue())
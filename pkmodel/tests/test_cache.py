@@ -0,0 +1,87 @@
+import unittest
+import tempfile
+import pkmodel as pk
+import numpy
+
+
+class SolutionCacheTest(unittest.TestCase):
+    """
+    Tests the :class:`SolutionCache` class.
+    """
+    def model(self, clearance=1.0):
+        return pk.Model(pk.Compartment(1.0, clearance), [pk.Compartment(2.0, 0.5)], k_a=1.5)
+
+    def test_create(self):
+        """
+        Tests SolutionCache creation.
+        """
+        with self.assertRaises(TypeError):
+            pk.SolutionCache(maxsize=1.5)
+        with self.assertRaises(TypeError):
+            pk.Protocol(1.0, 1.0, cache_key=1)
+        cache = pk.SolutionCache()
+        self.assertEqual(len(cache), 0)
+
+    def test_key(self):
+        """
+        Tests that keys change with every input of the solve.
+        """
+        cache = pk.SolutionCache()
+        protocol = pk.Protocol(1.0, 1.0)
+        key = cache.key(self.model(), protocol)
+        self.assertEqual(key, cache.key(self.model(), pk.Protocol(1.0, 1.0)))
+        others = [
+            cache.key(self.model(2.0), protocol),
+            cache.key(pk.Model(pk.Compartment(1.0, 1.0), [pk.Compartment(2.0, 0.5)]), protocol),
+            cache.key(self.model(), pk.Protocol(2.0, 1.0)),
+            cache.key(self.model(), pk.Protocol(1.0, 1.0, doses=[pk.Dose(0.5, 1.0)])),
+            cache.key(self.model(), pk.Protocol(1.0, 1.0, pk.DoseTable([0.0], [1.0]))),
+            cache.key(self.model(), pk.Protocol(1.0, 1.0, lambda t, y: 1.0, cache_key='one')),
+            cache.key(self.model(), protocol, method='BDF'),
+            cache.key(self.model(), protocol, t_eval=[0.0, 1.0]),
+        ]
+        self.assertEqual(len(set(others + [key])), len(others) + 1)
+        with self.assertRaises(ValueError):
+            cache.key(self.model(), pk.Protocol(1.0, 1.0, lambda t, y: 1.0))
+
+    def test_solve(self):
+        """
+        Tests that solutions are cached, and the least recently used is
+        evicted.
+        """
+        cache = pk.SolutionCache(maxsize=2)
+        protocol = pk.Protocol(1.0, 1.0)
+        sol = cache.solve(self.model(), protocol)
+        numpy.testing.assert_allclose(sol.y, self.model().solve(protocol).y)
+        self.assertIs(cache.solve(self.model(), protocol), sol)
+        self.assertFalse(sol.y.flags.writeable)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.solve(self.model(2.0), protocol)
+        cache.solve(self.model(), protocol)
+        cache.solve(self.model(3.0), protocol)
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.solve(self.model(), protocol), sol)
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+        # Protocols with an arbitrary dose_func are solved without the cache
+        protocol = pk.Protocol(1.0, 1.0, lambda t, y: 1.0)
+        self.assertIsNot(cache.solve(self.model(), protocol), cache.solve(self.model(), protocol))
+        self.assertEqual(cache.misses, 5)
+
+    def test_directory(self):
+        """
+        Tests that solutions persist on disk between caches.
+        """
+        protocol = pk.Protocol(1.0, 1.0)
+        t_eval = numpy.linspace(0, 1, 11)
+        with tempfile.TemporaryDirectory() as d:
+            sol = pk.SolutionCache(directory=d).solve(self.model(), protocol, t_eval=t_eval)
+            cache = pk.SolutionCache(maxsize=0, directory=d)
+            cached = cache.solve(self.model(), protocol, t_eval=t_eval)
+            self.assertEqual((cache.hits, cache.misses), (1, 0))
+            self.assertIsInstance(cached.y, numpy.memmap)
+            numpy.testing.assert_array_equal(cached.y, sol.y)
+            numpy.testing.assert_array_equal(cached.t, t_eval)
+            del cached
+            cache.clear(disk=True)
+            cache.solve(self.model(), protocol, t_eval=t_eval)
+            self.assertEqual(cache.misses, 1)
@@ -0,0 +1,93 @@
+import unittest
+import pkmodel as pk
+import numpy
+
+
+class CheckpointTest(unittest.TestCase):
+    """
+    Tests the :class:`Checkpoint` class and :meth:`Model.resume`.
+    """
+    def model(self):
+        return pk.Model(pk.Compartment(1.0, 1.0), [pk.Compartment(2.0, 0.5)], k_a=1.5)
+
+    def test_checkpoint(self):
+        """
+        Tests that solutions store a checkpoint of their final state.
+        """
+        model = self.model()
+        protocol = pk.Protocol(1.0, 2.0, doses=[pk.Dose(2.0, 1.0)])
+        sol = model.solve(protocol, method='RK45', t_eval=[0.0, 1.0])
+        checkpoint = sol.checkpoint
+        self.assertEqual(checkpoint.time, 2.0)
+        self.assertEqual(checkpoint.method, 'RK45')
+        self.assertGreater(checkpoint.step, 0.0)
+        # The state includes the bolus at the end time
+        expected = model.solve(protocol, method='analytic', t_eval=[2.0]).y[:, -1]
+        numpy.testing.assert_allclose(checkpoint.y, expected, atol=1e-3)
+        self.assertEqual(expected[0], model.solve(protocol, method='analytic').checkpoint.y[0])
+        self.assertIsNone(model.solve(protocol, method='analytic').checkpoint.step)
+        with self.assertRaises(ValueError):
+            checkpoint.y[0] = 1.0
+
+    def test_resume(self):
+        """
+        Tests continuing solutions with extended protocols.
+        """
+        model = self.model()
+        protocol = pk.Protocol(1.0, 8.0, doses=[pk.Dose(4.0, 1.0, duration=6.0), pk.Dose(8.0, 2.0)])
+        longer = protocol.extend(24.0, [pk.Dose(12.0, 3.0), pk.Dose(16.0, 1.0, compartment='q_c')])
+        self.assertEqual(len(longer.doses), 4)
+        t_eval = numpy.linspace(8.0, 24.0, 17)
+        for method in ['analytic', 'BDF', 'RK45']:
+            first = model.solve(protocol, method=method)
+            rest = model.resume(first.checkpoint, longer, t_eval=t_eval)
+            self.assertEqual(rest.method, method)
+            expected = model.solve(longer, method='analytic', t_eval=t_eval).y
+            numpy.testing.assert_allclose(rest.y, expected, atol=1e-10 if method == 'analytic' else 5e-3)
+            # Continuing again from the new checkpoint
+            again = model.resume(rest.checkpoint, longer.extend(30.0), t_eval=[30.0])
+            expected = model.solve(longer.extend(30.0), method='analytic', t_eval=[30.0]).y
+            numpy.testing.assert_allclose(again.y, expected, atol=1e-10 if method == 'analytic' else 5e-3)
+
+        # Only the new interval is solved
+        first = model.solve(protocol, method='RK45')
+        rest = model.resume(first.checkpoint, protocol.extend(9.0))
+        self.assertLess(rest.nfev, first.nfev)
+        numpy.testing.assert_array_equal(rest.t, numpy.linspace(8.0, 9.0, 1000))
+        # A protocol ending at the checkpoint gives the checkpoint state
+        for method in ['analytic', 'exponential', 'RK45']:
+            first = model.solve(protocol, method=method)
+            rest = model.resume(first.checkpoint, protocol, t_eval=[8.0])
+            numpy.testing.assert_allclose(rest.y, first.checkpoint.y[:, None])
+            numpy.testing.assert_allclose(rest.checkpoint.y, first.checkpoint.y)
+            self.assertEqual(rest.checkpoint.step, first.checkpoint.step)
+
+    def test_check(self):
+        """
+        Tests that protocols which change the solved interval are
+        rejected.
+        """
+        model = self.model()
+        protocol = pk.Protocol(1.0, 8.0, doses=[pk.Dose(4.0, 1.0)])
+        checkpoint = model.solve(protocol).checkpoint
+        with self.assertRaises(TypeError):
+            model.resume(1.0, protocol)
+        with self.assertRaises(TypeError):
+            model.resume(checkpoint, 1.0)
+        with self.assertRaises(ValueError):
+            model.resume(checkpoint, pk.Protocol(1.0, 4.0, doses=[pk.Dose(4.0, 1.0)]))
+        with self.assertRaises(ValueError):
+            model.resume(checkpoint, pk.Protocol(2.0, 10.0, doses=[pk.Dose(4.0, 1.0)]))
+        with self.assertRaises(ValueError):
+            model.resume(checkpoint, pk.Protocol(1.0, 10.0, doses=[pk.Dose(4.0, 2.0)]))
+        with self.assertRaises(ValueError):
+            model.resume(checkpoint, protocol.extend(10.0, [pk.Dose(8.0, 1.0)]))
+        with self.assertRaises(ValueError):
+            model.resume(checkpoint, protocol.extend(10.0, [pk.Dose(6.0, 1.0)]))
+        with self.assertRaises(ValueError):
+            pk.Model(pk.Compartment(1.0, 2.0), [pk.Compartment(2.0, 0.5)], k_a=1.5).resume(checkpoint, protocol)
+        model.resume(checkpoint, pk.Protocol(1.0, 10.0, doses=[pk.Dose(4.0, 1.0), pk.Dose(9.0, 1.0)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
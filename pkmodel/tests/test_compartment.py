@@ -24,3 +24,5 @@ class CompartmentTest(unittest.TestCase):
         self.assertEquals(comp.name, '[v_p=1.0, q_p=0.0]')
         comp = pk.Compartment(4.0, 5.0)
         self.assertEquals(comp.name, '[v_p=4.0, q_p=5.0]')
+        with self.assertRaises(AttributeError):
+            comp.colour = 'red'
@@ -0,0 +1,82 @@
+import unittest
+import pkmodel as pk
+import pkmodel.fitting
+import numpy
+
+
+class FitTest(unittest.TestCase):
+    """
+    Tests the :func:`fit` function.
+    """
+    def model(self, k_a=1.5):
+        return pk.Model(pk.Compartment(2.0, 1.0), [pk.Compartment(4.0, 0.5)], k_a=k_a)
+
+    def test_parameters(self):
+        """
+        Tests getting and setting model parameters by name.
+        """
+        model = self.model()
+        self.assertEqual(pkmodel.fitting.parameter_names(model), ['v_c', 'cl', 'v_p1', 'q_p1', 'k_a'])
+        self.assertEqual(
+            pkmodel.fitting.get_parameters(model), {'v_c': 2.0, 'cl': 1.0, 'v_p1': 4.0, 'q_p1': 0.5, 'k_a': 1.5})
+        changed = pkmodel.fitting.with_parameters(model, {'q_p1': 2.0, 'k_a': 3.0})
+        self.assertEqual(changed.name, 'v_c=2.0, cl=1.0, peripheral=[v_p=4.0, q_p=2.0], K_a=3.0')
+        self.assertEqual(model.k_a, 1.5)
+        with self.assertRaises(ValueError):
+            pkmodel.fitting.with_parameters(model, {'v_p2': 1.0})
+
+    def test_sensitivities(self):
+        """
+        Tests the forward sensitivities against finite differences.
+        """
+        protocol = pk.Protocol(1.0, 4.0, doses=[pk.Dose(1.0, 2.0), pk.Dose(2.0, 1.0, duration=1.0)])
+        t_eval = numpy.linspace(0, 4.0, 9)
+        for model in [self.model(), self.model(None)]:
+            names = pkmodel.fitting.parameter_names(model)
+            values = pkmodel.fitting.get_parameters(model)
+            for method in ['analytic', 'BDF']:
+                sol = pkmodel.fitting.sensitivities(model, protocol, method=method, t_eval=t_eval)
+                self.assertEqual(sol.sensitivities.shape, (len(names), model.n_states, 9))
+                for name, S in zip(names, sol.sensitivities):
+                    h = 1e-6 * values[name]
+                    up = pkmodel.fitting.with_parameters(model, {name: values[name] + h})
+                    down = pkmodel.fitting.with_parameters(model, {name: values[name] - h})
+                    y_up = up.solve(protocol, method='analytic', t_eval=t_eval).y
+                    y_down = down.solve(protocol, method='analytic', t_eval=t_eval).y
+                    expected = (y_up - y_down) / (2 * h)
+                    numpy.testing.assert_allclose(S, expected, atol=1e-2 if method == 'BDF' else 1e-6)
+        with self.assertRaises(ValueError):
+            pkmodel.fitting.sensitivities(self.model(), protocol, ['v_c', 'k_b'])
+
+    def test_fit(self):
+        """
+        Tests recovering the parameters of a model from its
+        concentrations.
+        """
+        protocol = pk.Protocol(0.0, 24.0, doses=pk.Dose.repeat(10.0, 8.0, 3))
+        times = numpy.linspace(0.5, 24.0, 40)
+        truth = self.model(None)
+        measured = truth.solve(protocol, method='analytic', t_eval=times).y[0] / 2.0
+        guess = pk.Model(pk.Compartment(1.0, 2.0), [pk.Compartment(2.0, 1.0)])
+        with self.assertRaises(ValueError):
+            pk.fit(guess, protocol, times, measured[1:])
+        with self.assertRaises(TypeError):
+            pk.fit(1.0, protocol, times, measured)
+        result = pk.fit(guess, protocol, times, measured, method='analytic')
+        self.assertTrue(result.success)
+        for name, value in pkmodel.fitting.get_parameters(truth).items():
+            self.assertAlmostEqual(result.parameters[name], value, places=4)
+        numpy.testing.assert_allclose(result.model.compile()[0], truth.compile()[0], rtol=1e-6)
+
+        # Fitting a subset of the parameters with a numerical solver
+        truth = self.model()
+        measured = truth.solve(protocol, method='analytic', t_eval=times).y[1] / 2.0
+        guess = pkmodel.fitting.with_parameters(truth, {'cl': 3.0, 'k_a': 0.5})
+        result = pk.fit(guess, protocol, times, measured, parameters=['cl', 'k_a'])
+        self.assertAlmostEqual(result.parameters['cl'], 1.0, places=2)
+        self.assertAlmostEqual(result.parameters['k_a'], 1.5, places=2)
+        self.assertEqual(result.model.volumes[0], 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
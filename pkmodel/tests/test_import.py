@@ -0,0 +1,32 @@
+import unittest
+import subprocess
+import sys
+
+# Time budget [s] for ``import pkmodel`` in a fresh interpreter
+IMPORT_BUDGET = 2.0
+
+
+class ImportTest(unittest.TestCase):
+    """
+    Tests the start-up cost of importing :mod:`pkmodel`.
+    """
+    def test_import(self):
+        """
+        Tests that importing pkmodel does not import matplotlib, and
+        stays within the time budget.
+        """
+        code = (
+            'import sys, time\n'
+            't = time.perf_counter()\n'
+            'import pkmodel\n'
+            't = time.perf_counter() - t\n'
+            'print("matplotlib" in sys.modules, t)\n'
+        )
+        # Take the fastest of a few runs, to reduce the effect of a busy machine
+        times = []
+        for _ in range(3):
+            out = subprocess.run([sys.executable, '-c', code], capture_output=True, check=True, text=True)
+            imported, t = out.stdout.split()
+            self.assertEqual(imported, 'False')
+            times.append(float(t))
+        self.assertLess(min(times), IMPORT_BUDGET)
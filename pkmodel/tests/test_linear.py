@@ -0,0 +1,98 @@
+import unittest
+import pkmodel as pk
+import numpy
+import scipy.integrate
+
+
+class LinearSystemTest(unittest.TestCase):
+    """
+    Tests the :class:`LinearSystem` class.
+    """
+    def reference(self, A, t, y0, infusions=()):
+        """
+        Integrates the system numerically with tight tolerances.
+        """
+        def fun(s, y):
+            rate = numpy.zeros(len(y))
+            for start, stop, r, state in infusions:
+                if start <= s < stop:
+                    rate[state] += r
+            return A @ y + rate
+        sol = scipy.integrate.solve_ivp(
+            fun, [0, t[-1]], y0, t_eval=t, method='Radau', rtol=1e-10, atol=1e-12,
+            max_step=0.05,
+        )
+        return sol.y
+
+    def test_create(self):
+        """
+        Tests LinearSystem creation.
+        """
+        with self.assertRaises(ValueError):
+            pk.LinearSystem(numpy.zeros(3))
+        with self.assertRaises(ValueError):
+            pk.LinearSystem(numpy.zeros((2, 3)))
+        system = pk.LinearSystem([[-1.0, 0.0], [1.0, -2.0]])
+        self.assertEqual(system.n_states, 2)
+        self.assertFalse(system.defective)
+
+    def test_bolus(self):
+        """
+        Tests the response to an initial state and a later bolus.
+        """
+        model = pk.Model(pk.Compartment(2.0, 1.0), [pk.Compartment(1.0, 2.0)])
+        A, _ = model.compile()
+        system = pk.LinearSystem(A)
+        t = numpy.linspace(0, 4, 41)
+        y = system.solve(t, [1.0, 0.0])
+        numpy.testing.assert_allclose(y, self.reference(A, t, [1.0, 0.0]), atol=1e-8)
+        # A bolus at t=2 is the t=0 response shifted in time
+        y = system.solve(t, boluses=[(2.0, 1.0, 0)])
+        numpy.testing.assert_allclose(y[:, :20], 0.0)
+        numpy.testing.assert_allclose(y[:, 20:], system.solve(t[:21], [1.0, 0.0]), atol=1e-12)
+        with self.assertRaises(ValueError):
+            system.solve([-1.0])
+
+    def test_infusion(self):
+        """
+        Tests the response to constant-rate infusions.
+        """
+        model = pk.Model(pk.Compartment(1.0, 0.5), [pk.Compartment(3.0, 1.0)], k_a=2.0)
+        A, _ = model.compile()
+        system = pk.LinearSystem(A)
+        t = numpy.linspace(0, 5, 51)
+        infusions = [(0.5, 1.5, 2.0, 0), (1.0, 3.0, 1.0, 1)]
+        y = system.solve(t, [1.0, 0.0, 0.0], infusions=infusions)
+        expected = self.reference(A, t, [1.0, 0.0, 0.0], infusions)
+        numpy.testing.assert_allclose(y, expected, atol=1e-8)
+        # A late infusion into a fast compartment is zero before it starts
+        model = pk.Model(pk.Compartment(1.0, 10.0), [])
+        protocol = pk.Protocol(0.0, 102.0, doses=[pk.Dose(100.0, 5.0, duration=1.0)])
+        sol = model.solve(protocol, method='analytic', t_eval=[0.0, 50.0, 100.5, 102.0])
+        self.assertTrue(numpy.all(numpy.isfinite(sol.y)))
+        numpy.testing.assert_allclose(sol.y[0, :2], 0.0)
+        numpy.testing.assert_allclose(sol.y[0, 2], 0.5 * (1 - numpy.exp(-5.0)), rtol=1e-10)
+        table = pk.DoseTable([0.0, 100.0, 101.0], [0.0, 5.0, 0.0], kind='constant')
+        sol = model.solve(pk.Protocol(0.0, 102.0, table), method='analytic', t_eval=[0.0, 100.5])
+        numpy.testing.assert_allclose(sol.y[0], [0.0, 0.5 * (1 - numpy.exp(-5.0))], rtol=1e-10)
+
+    def test_defective(self):
+        """
+        Tests a rate matrix without a full set of eigenvectors, where
+        k_a equals the elimination rate.
+        """
+        model = pk.Model(pk.Compartment(1.0, 1.0), [], k_a=1.0)
+        A, _ = model.compile()
+        system = pk.LinearSystem(A)
+        self.assertTrue(system.defective)
+        t = numpy.linspace(0, 3, 31)
+        y = system.solve(t, [1.0, 0.0], boluses=[(1.05, 1.0, 0)], infusions=[(2.0, 2.5, 1.0, 1)])
+        expected = self.reference(A, t[:11], [1.0, 0.0])
+        numpy.testing.assert_allclose(y[:, :11], expected, atol=1e-8)
+        # q_c = t exp(-t) for a unit dose into the absorption compartment
+        numpy.testing.assert_allclose(y[1, :11], t[:11] * numpy.exp(-t[:11]), atol=1e-12)
+        # After the bolus at t=1.05, superpose a unit dose shifted in time
+        shifted = numpy.maximum(t - 1.05, 0)
+        bolus = system.solve(shifted, [1.0, 0.0]) * (t >= 1.05)
+        expected = self.reference(A, t, [1.0, 0.0], [(2.0, 2.5, 1.0, 1)]) + bolus
+        numpy.testing.assert_allclose(y, expected, atol=1e-8)
@@ -0,0 +1,88 @@
+import unittest
+import pkmodel as pk
+import numpy
+
+
+class MetricsTest(unittest.TestCase):
+    """
+    Tests :meth:`Model.metrics` and :meth:`Population.metrics`.
+    """
+    def setUp(self):
+        self.model = pk.Model(pk.Compartment(2.0, 1.0), [pk.Compartment(3.0, 0.5)], k_a=2.0)
+        self.protocol = pk.Protocol(1.0, 24.0, doses=[
+            pk.Dose(8.0, 1.0), pk.Dose(16.0, 2.0, duration=4.0)])
+
+    def dense(self, model, threshold):
+        """Returns the metrics of a dense analytic solution.
+        """
+        t = numpy.linspace(0, 24.0, 240001)
+        c = model.solve(self.protocol, method='analytic', t_eval=t).y[1] / model.volumes[0]
+        i = numpy.argmax(c)
+        auc = numpy.sum((c[1:] + c[:-1]) / 2) * (t[1] - t[0])
+        above = numpy.mean(c >= threshold) * 24.0
+        return c[i], t[i], auc, above
+
+    def test_model(self):
+        """
+        Tests the metrics of a single model against a dense solution.
+        """
+        threshold = 0.15
+        cmax, tmax, auc, above = self.dense(self.model, threshold)
+        result = self.model.metrics(self.protocol, threshold)
+        self.assertEqual(result.method, 'RK45')
+        self.assertAlmostEqual(result.cmax, cmax, places=4)
+        self.assertAlmostEqual(result.tmax, tmax, places=2)
+        self.assertAlmostEqual(result.auc, auc, places=4)
+        self.assertAlmostEqual(result.time_above, above, places=2)
+        numpy.testing.assert_array_equal(result.trough_times, [8.0, 16.0])
+        expected = self.model.solve(self.protocol, method='analytic', t_eval=[8.0, 16.0]).y[1] / 2.0
+        # The analytic solution at a dose time includes the bolus, which
+        # enters the dosing compartment, not the central compartment
+        numpy.testing.assert_allclose(result.troughs, expected, atol=1e-5)
+        trapezoid = self.model.metrics(self.protocol, auc='trapezoid')
+        self.assertNotIn('time_above', trapezoid)
+        self.assertAlmostEqual(trapezoid.auc, auc, places=1)
+        peripheral = self.model.metrics(self.protocol, compartment='q_p1')
+        self.assertLess(peripheral.cmax, cmax)
+        with self.assertRaises(TypeError):
+            self.model.metrics('protocol')
+        with self.assertRaises(ValueError):
+            self.model.metrics(self.protocol, compartment='q_0')
+        with self.assertRaises(ValueError):
+            self.model.metrics(self.protocol, auc='simpson')
+
+    def test_population(self):
+        """
+        Tests that population metrics match those of each model.
+        """
+        models = [
+            self.model,
+            pk.Model(pk.Compartment(1.0, 2.0), [pk.Compartment(1.0, 1.0)], k_a=1.0),
+            pk.Model(pk.Compartment(4.0, 0.5), [pk.Compartment(2.0, 2.0)], k_a=3.0),
+        ]
+        population = pk.Population.from_models(models)
+        result = population.metrics(self.protocol, 0.1)
+        self.assertEqual(result.troughs.shape, (3, 2))
+        # A threshold per patient
+        thresholds = population.metrics(self.protocol, [0.1, 0.1, 1e3])
+        numpy.testing.assert_array_equal(thresholds.time_above, [result.time_above[0], result.time_above[1], 0.0])
+        for i, model in enumerate(models):
+            single = model.metrics(self.protocol, 0.1)
+            self.assertAlmostEqual(result.cmax[i], single.cmax, places=4)
+            self.assertAlmostEqual(result.tmax[i], single.tmax, places=2)
+            self.assertAlmostEqual(result.auc[i], single.auc, places=3)
+            self.assertAlmostEqual(result.time_above[i], single.time_above, places=2)
+
+    def test_pointwise(self):
+        """
+        Tests that each patient's concentration is recovered exactly
+        from the step's interpolant, for every solver method.
+        """
+        population = pk.Population.from_models([self.model] * 5)
+        for method in pk.model.SOLVERS:
+            rhs, y0, options = population.system([self.protocol], method)
+            t_old, t, interpolant, _ = next(pk.model.steps(rhs, y0, self.protocol.time, **options))
+            pointwise = pk.metrics._Pointwise(lambda s: interpolant(s).reshape(5, 3, -1)[:, 1], t_old, t)
+            s = numpy.linspace(t_old, t, 5)
+            expected = numpy.diag(interpolant(s).reshape(5, 3, -1)[:, 1])
+            numpy.testing.assert_allclose(pointwise(numpy.arange(5), s), expected, rtol=1e-10, atol=1e-15)
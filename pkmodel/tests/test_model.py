@@ -1,6 +1,8 @@
 import unittest
+import tracemalloc
 import pkmodel as pk
 import scipy.integrate
+import numpy
 import pytest
 
 
@@ -58,6 +60,192 @@ class ModelTest(unittest.TestCase):
         model.remove_compartment(comp2)
         self.assertEqual(model.name, 'v_c=1.0, cl=1.0, peripheral=[v_p=2.0, q_p=5.0], K_a=None')
 
+    def test_set_compartment(self):
+        """
+        Tests updating compartments in place, and that the compiled
+        system is cached until the model changes.
+        """
+        comp1 = pk.Compartment(1.0, 1.0)
+        model = pk.Model(comp1, [pk.Compartment(1.0, 2.0)])
+        numpy.testing.assert_array_equal(model.volumes, [1.0, 1.0])
+        numpy.testing.assert_array_equal(model.transition_rates, [1.0, 2.0])
+        with self.assertRaises(ValueError):
+            model.volumes[0] = 2.0
+        A, b = model.compile()
+        self.assertIs(model.compile()[0], A)
+        with self.assertRaises(ValueError):
+            A[0, 0] = 1.0
+
+        # The model holds a copy of the compartment parameters
+        comp1.volume = 4.0
+        self.assertEqual(model.central_compartment.volume, 1.0)
+        with self.assertRaises(TypeError):
+            model.set_compartment(0, 4.0)
+        with self.assertRaises(IndexError):
+            model.set_compartment(2, comp1)
+        model.set_compartment(0, comp1)
+        model.set_compartment(1, pk.Compartment(2.0, 5.0))
+        self.assertEqual(model.name, 'v_c=4.0, cl=1.0, peripheral=[v_p=2.0, q_p=5.0], K_a=None')
+        self.assertIsNot(model.compile()[0], A)
+        numpy.testing.assert_allclose(
+            model.compile()[0], pk.Model(comp1, [pk.Compartment(2.0, 5.0)]).compile()[0])
+
+        A, b = model.compile()
+        model.k_a = 2.0
+        self.assertEqual(model.compile()[0].shape, (3, 3))
+        with self.assertRaises(TypeError):
+            model.k_a = 'fast'
+        with self.assertRaises(AttributeError):
+            model.colour = 'red'
+
+    def test_memory(self):
+        """
+        Tests the memory held by each model, which models without flows
+        keep small by sharing their empty flow arrays.
+        """
+        central, peripheral = pk.Compartment(1.0, 1.0), [pk.Compartment(2.0, 0.5)]
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            models = [pk.Model(central, peripheral, 1.0) for _ in range(2000)]
+            per_model = (tracemalloc.get_traced_memory()[0] - before) / len(models)
+        finally:
+            tracemalloc.stop()
+        self.assertLess(per_model, 400)
+        # Adding a flow to one model leaves the others without flows
+        models[0].add_flow(1, None, 0.5)
+        self.assertEqual(models[0].flows, [(1, None, 0.5)])
+        self.assertEqual(models[1].flows, [])
+
+    def test_compile(self):
+        """
+        Tests the compilation of the model into a rate matrix and
+        dosing vector.
+        """
+        central = pk.Compartment(2.0, 1.0)
+        comp2 = pk.Compartment(1.0, 2.0)
+        comp3 = pk.Compartment(4.0, 0.5)
+        model = pk.Model(central, [comp2, comp3])
+        A, b = model.compile()
+        numpy.testing.assert_allclose(A, [
+            [-(1.0 + 2.0 + 0.5) / 2.0, 2.0, 0.125],
+            [1.0, -2.0, 0.0],
+            [0.25, 0.0, -0.125],
+        ])
+        numpy.testing.assert_allclose(b, [1.0, 0.0, 0.0])
+        model = pk.Model(central, [comp2], k_a=3.0)
+        self.assertEqual(model.n_states, 3)
+        A, b = model.compile()
+        numpy.testing.assert_allclose(A, [
+            [-3.0, 0.0, 0.0],
+            [3.0, -1.5, 2.0],
+            [0.0, 1.0, -2.0],
+        ])
+        numpy.testing.assert_allclose(b, [1.0, 0.0, 0.0])
+
+    def test_flows(self):
+        """
+        Tests models with flows between compartments.
+        """
+        central = pk.Compartment(2.0, 1.0)
+        liver = pk.Compartment(1.0, 0.0)
+        gut = pk.Compartment(4.0, 0.5)
+        with self.assertRaises(TypeError):
+            pk.Model(central, [liver, gut], flows=(0, 1, 1.0))
+        with self.assertRaises(TypeError):
+            pk.Model(central, [liver, gut], flows=[(0, 1)])
+        with self.assertRaises(TypeError):
+            pk.Model(central, [liver, gut], flows=[(0, 1, -1.0)])
+        with self.assertRaises(ValueError):
+            pk.Model(central, [liver, gut], flows=[(0, 3, 1.0)])
+        with self.assertRaises(ValueError):
+            pk.Model(central, [liver, gut], flows=[(1, 1, 1.0)])
+
+        # Central -> liver -> gut, and elimination from the liver
+        model = pk.Model(central, [liver, gut], flows=[(0, 1, 2.0), (1, 2, 1.0), (1, None, 0.5)])
+        self.assertEqual(model.flows, [(0, 1, 2.0), (1, 2, 1.0), (1, None, 0.5)])
+        self.assertTrue(model.name.endswith('flows=3'))
+        A, b = model.compile()
+        numpy.testing.assert_allclose(A, [
+            [-(1.0 + 0.5 + 2.0) / 2.0, 0.0, 0.125],
+            [1.0, -1.5, 0.0],
+            [0.25, 1.0, -0.125],
+        ])
+        S = model.compile(sparse=True)[0]
+        self.assertTrue(scipy.sparse.issparse(S))
+        numpy.testing.assert_array_equal(S.toarray(), A)
+        numpy.testing.assert_array_equal(model.sparsity().toarray(), A != 0)
+
+        # Removing a compartment removes its flows and renumbers the rest
+        model.remove_compartment(liver)
+        self.assertEqual(model.flows, [])
+        model = pk.Model(central, [liver, gut], k_a=1.0, flows=[(2, 0, 1.0)])
+        model.remove_compartment(liver)
+        self.assertEqual(model.flows, [(1, 0, 1.0)])
+        self.assertEqual(model.compile()[0][1, 2], 0.5 / 4.0 + 1.0 / 4.0)
+        with self.assertRaises(ValueError):
+            pk.Population.from_models([model])
+
+    def test_solve_sparse(self):
+        """
+        Tests that a large network is solved with a sparse Jacobian, in
+        agreement with the analytic solution.
+        """
+        n = pk.model.SPARSE_STATES
+        # A chain of organs fed from the central compartment
+        organs = [pk.Compartment(1.0 + i % 3, 0.0) for i in range(n)]
+        flows = [(0, 1, 1.0)] + [(i, i + 1, 1.0) for i in range(1, n)] + [(n, 0, 1.0)]
+        model = pk.Model(pk.Compartment(1.0, 0.2), organs, flows=flows)
+        self.assertEqual(model.sparsity().nnz, 2 * (n + 1))
+        protocol = pk.Protocol(1.0, 10.0)
+        t_eval = numpy.linspace(0, 10.0, 11)
+        expected = model.solve(protocol, method='analytic', t_eval=t_eval).y
+        for method in ['BDF', 'Radau', 'LSODA']:
+            sol = model.solve(protocol, method=method, t_eval=t_eval)
+            numpy.testing.assert_allclose(sol.y, expected, atol=5e-3)
+
+    def test_choose_method(self):
+        """
+        Tests the automatic choice of solver from the stiffness of the
+        model.
+        """
+        mild = pk.Model(pk.Compartment(1.0, 1.0), [pk.Compartment(2.0, 0.5)], k_a=1.5)
+        fast_k_a = pk.Model(pk.Compartment(1.0, 1.0), [pk.Compartment(100.0, 0.01)], k_a=1000.0)
+        small_volume = pk.Model(pk.Compartment(0.001, 1.0), [pk.Compartment(1.0, 0.5)])
+        span, ratio = pk.model.stiffness(fast_k_a.compile()[0], 24.0)
+        self.assertAlmostEqual(span, 24000.0)
+        self.assertGreater(ratio, pk.model.STIFF_RATIO)
+        self.assertEqual(pk.model.stiffness(numpy.zeros((2, 2)), 1.0), (0.0, 1.0))
+        self.assertEqual(pk.model.choose_method(mild.compile()[0], 24.0), 'RK45')
+        self.assertEqual(pk.model.choose_method(mild.compile()[0], 720.0), 'LSODA')
+        self.assertEqual(pk.model.choose_method(fast_k_a.compile()[0], 24.0), 'Radau')
+        self.assertEqual(pk.model.choose_method(fast_k_a.compile(sparse=True)[0], 24.0), 'BDF')
+        self.assertEqual(pk.model.choose_method(small_volume.compile()[0], 24.0), 'LSODA')
+        # Patients which are not stiff on their own are not stiff together
+        patients = pk.Population([1.0, 1.0], [1000.0, 0.01])
+        self.assertEqual(pk.model.stiffness(patients.compile()[0], 24.0), (24000.0, 1.0))
+        self.assertEqual(patients.solve(pk.Protocol(1.0, 24.0)).method, 'BDF')
+        # Batches are never solved with LSODA's dense Jacobian
+        batch = numpy.stack([mild.compile()[0]] * 3)
+        self.assertEqual(pk.model.choose_method(batch, 720.0), 'BDF')
+        self.assertEqual(pk.model.choose_method(numpy.stack([fast_k_a.compile()[0]] * 3), 24.0), 'Radau')
+
+        # The solution reports the method used, and can be overridden
+        protocol = pk.Protocol(100.0, 24.0)
+        expected = fast_k_a.solve(protocol, method='analytic')
+        sol = fast_k_a.solve(protocol)
+        self.assertEqual(sol.method, 'Radau')
+        self.assertLess(sol.nfev, 1000)
+        numpy.testing.assert_allclose(sol.y, expected.y, atol=0.05)
+        self.assertEqual(expected.method, 'analytic')
+        self.assertEqual(fast_k_a.solve(protocol, method='BDF').method, 'BDF')
+        self.assertEqual(mild.solve(protocol).method, 'RK45')
+        stats = pk.SolveStats()
+        small_volume.solve(protocol, stats=stats)
+        self.assertEqual(stats.method, 'LSODA')
+        population = pk.Population.from_models([mild, fast_k_a])
+        self.assertEqual(population.solve(protocol, method='auto').method, 'Radau')
+
     def test_rhs(self):
         """
         Tests the function that generates the rhs of the PK modelling
@@ -67,22 +255,164 @@ class ModelTest(unittest.TestCase):
         comp2 = pk.Compartment(1.0, 2.0)
         model = pk.Model(comp1, [comp2])
         protocol = pk.Protocol(1.0, 1.0)
-        self.assertEqual(model.rhs(1, 1, protocol), [0.0, -1.0])
+        numpy.testing.assert_allclose(model.rhs(1, [1.0, 1.0], protocol), [-1.0, 0.0])
         protocol = pk.Protocol(2.0, 1.0, lambda t, y: 3 / (t + 1 / 4))
-        self.assertEqual(model.rhs(1, 1, protocol), [0.0, 1.4])
+        numpy.testing.assert_allclose(model.rhs(1, [1.0, 1.0], protocol), [1.4, 0.0])
+        numpy.testing.assert_allclose(model.rhs(1, [1.0, 0.0], protocol), [-0.6, 2.0])
+        model = pk.Model(comp1, [comp2], k_a=2.0)
+        numpy.testing.assert_allclose(model.rhs(1, [1.0, 1.0, 1.0], protocol), [0.4, 1.0, 0.0])
+        numpy.testing.assert_allclose(model.jac(1, [1.0, 1.0, 1.0], protocol), model.compile()[0])
 
     def test_solve(self):
         """
         Tests the function that solves system of ODEs, determining
         how much of the drug in question is in each compartment at
         each timestep.
-        IMPORTANT: This function is not working for me. No matter what
-        inputs I use, scipy.integrate.solve_ivp gives raises a
-        ValueError.
         """
         comp1 = pk.Compartment(1.0, 1.0)
         comp2 = pk.Compartment(1.0, 2.0)
         model = pk.Model(comp1, [comp2])
         protocol = pk.Protocol(1.0, 1.0)
+        with self.assertRaises(TypeError):
+            model.solve(1.0)
+        sol = model.solve(protocol)
+        self.assertEqual(sol.y.shape, (2, 1000))
+        self.assertAlmostEqual(sol.y[0, 0], 1.0)
+        # Without clearance, the total drug quantity is conserved
+        model = pk.Model(pk.Compartment(1.0, 0.0), [comp2], k_a=2.0)
+        for method in ['RK45', 'BDF', 'Radau', 'LSODA']:
+            sol = model.solve(protocol, method=method)
+            self.assertEqual(sol.y.shape, (3, 1000))
+            numpy.testing.assert_allclose(sol.y.sum(axis=0), 1.0, rtol=1e-6)
+
+    def test_solve_analytic(self):
+        """
+        Tests the exact solution of the PK model.
+        """
+        model = pk.Model(pk.Compartment(1.0, 1.0), [pk.Compartment(2.0, 0.5)], k_a=3.0)
+        protocol = pk.Protocol(1.0, 2.0)
+        exact = model.solve(protocol, method='analytic')
+        self.assertEqual(exact.y.shape, (3, 1000))
+        numerical = model.solve(protocol, method='Radau', t_eval=exact.t)
+        numpy.testing.assert_allclose(exact.y, numerical.y, atol=1e-3)
+        exact = model.solve(protocol, method='analytic', t_eval=[0.0, 1.0])
+        numpy.testing.assert_allclose(exact.y[:, 0], [1.0, 0.0, 0.0], atol=1e-12)
+        numpy.testing.assert_allclose(exact.y[0, 1], numpy.exp(-3.0))
+        protocol = pk.Protocol(1.0, 2.0, lambda t, y: 1.0)
+        with self.assertRaises(ValueError):
+            model.solve(protocol, method='analytic')
+
+    def test_solve_doses(self):
+        """
+        Tests solving the PK model with discrete bolus and infusion
+        doses, numerically and analytically.
+        """
+        model = pk.Model(pk.Compartment(1.0, 1.0), [pk.Compartment(2.0, 0.5)], k_a=3.0)
+        doses = pk.Dose.repeat(1.0, 8.0, 90) + [
+            pk.Dose(2.0, 2.0, duration=4.0),
+            pk.Dose(5.0, 1.0, compartment='q_c'),
+        ]
+        protocol = pk.Protocol(0.0, 30 * 24.0, doses=doses)
+        t_eval = numpy.linspace(0, 30 * 24.0, 2001)
+        exact = model.solve(protocol, method='analytic', t_eval=t_eval)
+        for method in ['RK45', 'BDF']:
+            sol = model.solve(protocol, method=method, t_eval=t_eval)
+            self.assertTrue(sol.success)
+            numpy.testing.assert_allclose(sol.y, exact.y, atol=5e-3)
+        # The solution is right-continuous at each bolus
+        sol = model.solve(protocol, t_eval=[0.0, 8.0, 720.0])
+        self.assertAlmostEqual(sol.y[0, 0], 1.0)
+        self.assertGreater(sol.y[0, 1], 1.0)
+        protocol = pk.Protocol(0.0, 1.0, doses=[pk.Dose(0.5, 1.0, compartment='q_p2')])
         with self.assertRaises(ValueError):
             model.solve(protocol)
+        with self.assertRaises(ValueError):
+            model.solve(pk.Protocol(1.0, 1.0), t_eval=[0.0, 2.0])
+
+    def test_solve_dose_table(self):
+        """
+        Tests solving the PK model with a table-driven dose function.
+        """
+        model = pk.Model(pk.Compartment(1.0, 1.0), [pk.Compartment(2.0, 0.5)])
+        table = pk.DoseTable([0.0, 1.0, 2.5, 4.0], [0.0, 2.0, 0.5, 0.0])
+        protocol = pk.Protocol(1.0, 5.0, table)
+        t_eval = numpy.linspace(0, 5, 51)
+        exact = model.solve(protocol, method='analytic', t_eval=t_eval)
+        numerical = model.solve(protocol, method='BDF', t_eval=t_eval)
+        numpy.testing.assert_allclose(numerical.y, exact.y, atol=5e-3)
+        protocol = pk.Protocol(1.0, 5.0, pk.DoseTable([0.0, 1.0], [0.0, 2.0], kind='linear'))
+        with self.assertRaises(ValueError):
+            model.solve(protocol, method='analytic')
+
+    def test_iter_solve(self):
+        """
+        Tests solving the PK model incrementally, in chunks.
+        """
+        model = pk.Model(pk.Compartment(1.0, 1.0), [pk.Compartment(2.0, 0.5)], k_a=3.0)
+        doses = pk.Dose.repeat(1.0, 2.0, 5, start=1.0) + [pk.Dose(2.5, 2.0, duration=1.0, compartment='q_c')]
+        protocol = pk.Protocol(1.0, 10.0, doses=doses)
+        with self.assertRaises(TypeError):
+            next(model.iter_solve(1.0))
+        with self.assertRaises(TypeError):
+            next(model.iter_solve(protocol, chunk_size=0))
+        with self.assertRaises(ValueError):
+            list(model.iter_solve(protocol, t_eval=[1.0, 0.5]))
+        with self.assertRaises(ValueError):
+            list(model.iter_solve(protocol, t_eval=[11.0]))
+        with self.assertRaises(ValueError):
+            next(model.iter_solve(protocol, method='analytic', dense_output=True))
+        # Unsupported methods are rejected before the first chunk
+        with self.assertRaises(ValueError):
+            model.iter_solve(protocol, method='exponential')
+        t_eval = numpy.linspace(0, 10, 101)
+        exact = model.solve(protocol, method='analytic', t_eval=t_eval)
+        for method in ['analytic', 'RK45', 'BDF']:
+            chunks = list(model.iter_solve(protocol, t_eval=iter(t_eval), chunk_size=30, method=method))
+            self.assertEqual([len(t) for t, _ in chunks], [30, 30, 30, 11])
+            numpy.testing.assert_allclose(numpy.concatenate([t for t, _ in chunks]), t_eval)
+            y = numpy.concatenate([y for _, y in chunks], axis=1)
+            numpy.testing.assert_allclose(y, exact.y, atol=5e-3)
+        # Dense output covers the whole protocol time
+        chunks = list(model.iter_solve(protocol, chunk_size=10, dense_output=True))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(chunks[0].t_min, 0.0)
+        self.assertEqual(chunks[-1].t_max, 10.0)
+        for a, b in zip(chunks[:-1], chunks[1:]):
+            self.assertEqual(a.t_max, b.t_min)
+        numpy.testing.assert_allclose(chunks[-1](10.0), exact.y[:, -1], atol=5e-3)
+
+    def test_steady_state(self):
+        """
+        Tests the periodic steady state of a repeated regimen.
+        """
+        # One compartment, where the accumulation ratio is known
+        model = pk.Model(pk.Compartment(2.0, 1.0), [])
+        result = model.steady_state([pk.Dose(0.0, 10.0)], 4.0)
+        decay = numpy.exp(-0.5 * 4.0)
+        self.assertAlmostEqual(result.trough[0], 10.0 * decay / (1 - decay))
+        self.assertAlmostEqual(result.accumulation, 1 / (1 - decay))
+        self.assertAlmostEqual(result.auc, 10.0)
+        self.assertAlmostEqual(result.cavg, 2.5)
+        self.assertEqual(result.cycles, 2)
+        # The last cycle of a long regimen
+        model = pk.Model(pk.Compartment(1.0, 0.1), [pk.Compartment(5.0, 0.5)], k_a=1.0)
+        cycle = [pk.Dose(0.0, 3.0), pk.Dose(1.0, 5.0, duration=2.0, compartment='q_c')]
+        t = numpy.linspace(0, 12, 13)
+        result = model.steady_state(cycle, 12.0, t_eval=t)
+        doses = [pk.Dose(12.0 * k + d.time, d.amount, d.duration, d.compartment) for k in range(80) for d in cycle]
+        protocol = pk.Protocol(0.0, 80 * 12.0, doses=doses)
+        sol = model.solve(protocol, method='analytic', t_eval=79 * 12.0 + t)
+        numpy.testing.assert_allclose(result.y, sol.y, rtol=1e-5)
+        # The cycles to steady state, from the concentration just before each dose
+        sol = model.solve(protocol, method='exponential', t_eval=numpy.arange(1, 80) * 12.0 - 1e-9)
+        reached = sol.y[1] >= 0.9 * result.trough[1]
+        self.assertEqual(result.cycles, numpy.nonzero(~reached)[0][-1] + 2)
+        self.assertEqual(result.time_to_steady_state, 12.0 * result.cycles)
+        with self.assertRaises(ValueError):
+            model.steady_state([pk.Dose(11.0, 1.0, duration=2.0)], 12.0)
+        with self.assertRaises(ValueError):
+            model.steady_state([], 12.0)
+        with self.assertRaises(ValueError):
+            model.steady_state(cycle, 12.0, compartment='q_0')
+        with self.assertRaises(ValueError):
+            pk.Model(pk.Compartment(1.0, 0.0), []).steady_state(cycle[:1], 12.0)
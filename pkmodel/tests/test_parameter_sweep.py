@@ -0,0 +1,73 @@
+import unittest
+import pkmodel as pk
+import pkmodel.parameter_sweep
+import numpy
+
+
+class SweepTest(unittest.TestCase):
+    """
+    Tests the :func:`sweep` function.
+    """
+    def test_expand_grid(self):
+        """
+        Tests expansion of Cartesian and explicit parameter grids.
+        """
+        expand_grid = pkmodel.parameter_sweep.expand_grid
+        with self.assertRaises(TypeError):
+            expand_grid(1.0)
+        with self.assertRaises(TypeError):
+            expand_grid([1.0])
+        points = expand_grid({'v_c': [1.0, 2.0], 'cl': [1.0], 'k_a': [0.5, 1.0, 2.0]})
+        self.assertEqual(len(points), 6)
+        self.assertEqual(points[0], {'v_c': 1.0, 'cl': 1.0, 'k_a': 0.5})
+        self.assertEqual(points[-1], {'v_c': 2.0, 'cl': 1.0, 'k_a': 2.0})
+        points = [{'v_c': 1.0, 'cl': 1.0}, {'v_c': 2.0, 'cl': 3.0}]
+        self.assertEqual(expand_grid(points), points)
+
+    def test_to_population(self):
+        """
+        Tests conversion of parameter sets to a Population.
+        """
+        to_population = pkmodel.parameter_sweep.to_population
+        with self.assertRaises(ValueError):
+            to_population([{'v_c': 1.0, 'cl': 1.0}, {'v_c': 1.0}])
+        with self.assertRaises(ValueError):
+            to_population([{'v_c': 1.0, 'cl': 1.0, 'v_p1': 1.0}])
+        with self.assertRaises(ValueError):
+            to_population([{'v_c': 1.0, 'cl': 1.0, 'v_p2': 1.0, 'q_p2': 1.0}])
+        population = to_population([
+            {'v_c': 1.0, 'cl': 2.0, 'v_p1': 3.0, 'q_p1': 4.0, 'v_p2': 5.0, 'q_p2': 6.0},
+        ])
+        numpy.testing.assert_allclose(population.peripheral_volumes, [[3.0, 5.0]])
+        numpy.testing.assert_allclose(population.peripheral_rates, [[4.0, 6.0]])
+        self.assertIsNone(population.k_a)
+
+    def test_sweep(self):
+        """
+        Tests that a sweep matches solving each model, in grid order,
+        with and without worker processes.
+        """
+        protocol = pk.Protocol(1.0, 1.0)
+        grid = {'v_c': [1.0, 2.0], 'cl': [1.0], 'v_p1': [1.0], 'q_p1': [1.0, 2.0, 3.0], 'k_a': [2.0]}
+        with self.assertRaises(TypeError):
+            list(pk.sweep(grid, 1.0))
+        with self.assertRaises(ValueError):
+            list(pk.sweep(grid, protocol, workers=0))
+        t_eval = numpy.linspace(0, 1, 11)
+        for workers in [1, 2]:
+            calls = []
+            results = list(pk.sweep(
+                grid, protocol, workers=workers, chunksize=2, method='Radau', t_eval=t_eval,
+                progress=lambda done, total: calls.append((done, total)),
+            ))
+            self.assertEqual(calls, [(2, 6), (4, 6), (6, 6)])
+            self.assertEqual([p for p, _ in results], pkmodel.parameter_sweep.expand_grid(grid))
+            for parameters, sol in results:
+                model = pk.Model(
+                    pk.Compartment(parameters['v_c'], parameters['cl']),
+                    [pk.Compartment(parameters['v_p1'], parameters['q_p1'])],
+                    parameters['k_a'],
+                )
+                expected = model.solve(protocol, method='Radau', t_eval=t_eval)
+                numpy.testing.assert_allclose(sol.t, t_eval)
+                numpy.testing.assert_allclose(sol.y, expected.y, atol=5e-3)
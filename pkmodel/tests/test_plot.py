@@ -0,0 +1,77 @@
+import unittest
+import unittest.mock
+import os
+import tempfile
+import matplotlib
+import pkmodel as pk
+import pkmodel.plot
+import numpy
+
+matplotlib.use('Agg')
+
+
+class PlotTest(unittest.TestCase):
+    """
+    Tests the :mod:`pkmodel.plot` module.
+    """
+    def test_plot_solution(self):
+        """
+        Tests plotting a solution to a file.
+        """
+        model = pk.Model(pk.Compartment(1.0, 1.0), [pk.Compartment(1.0, 2.0)], k_a=1.0)
+        sol = model.solve(pk.Protocol(1.0, 1.0))
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, 'sol.png')
+            fig = pkmodel.plot.plot_solution(sol, model, filename=filename)
+            self.assertTrue(os.path.isfile(filename))
+        labels = [line.get_label() for line in fig.axes[0].get_lines()]
+        self.assertEqual(labels, [model.name + '- ' + name for name in ['q_0', 'q_c', 'q_p1']])
+        fig = pkmodel.plot.plot_solution(sol, ax=fig.axes[0])
+        self.assertEqual(len(fig.axes[0].get_lines()), 6)
+        matplotlib.pyplot.close('all')
+
+    def test_lttb(self):
+        """
+        Tests downsampling traces.
+        """
+        t = numpy.linspace(0, 1, 1001)
+        y = numpy.array([numpy.sin(10 * t), numpy.cos(3 * t)])
+        y[0, 437] = 5.0
+        t_out, y_out = pkmodel.plot.lttb(t, y, 50)
+        self.assertEqual(t_out.shape, (2, 50))
+        self.assertEqual(y_out.shape, (2, 50))
+        # The ends and the spike are kept
+        numpy.testing.assert_array_equal(t_out[:, [0, -1]], [[0, 1], [0, 1]])
+        self.assertIn(5.0, y_out[0])
+        self.assertTrue(numpy.all(numpy.diff(t_out, axis=1) > 0))
+        # Traces are downsampled independently
+        t_1, y_1 = pkmodel.plot.lttb(t, y[1], 50)
+        numpy.testing.assert_array_equal(t_1, t_out[1])
+        numpy.testing.assert_array_equal(y_1, y_out[1])
+        self.assertIs(pkmodel.plot.lttb(t, y, 2000)[1], y)
+        with self.assertRaises(ValueError):
+            pkmodel.plot.lttb(t, y, 2)
+
+    def test_plot_population(self):
+        """
+        Tests plotting percentile bands of a population.
+        """
+        population = pk.Population(numpy.linspace(1.0, 2.0, 200), numpy.linspace(0.5, 1.5, 200))
+        protocol = pk.Protocol(1.0, 24.0, doses=pk.Dose.repeat(1.0, 6.0, 4))
+        sol = population.solve(protocol, t_eval=numpy.linspace(0, 24.0, 5000))
+        bands = pkmodel.plot.percentiles(sol.y[:, 0], [5, 50, 95])
+        numpy.testing.assert_allclose(bands, numpy.percentile(sol.y[:, 0], [5, 50, 95], axis=0))
+        with unittest.mock.patch.object(pkmodel.plot, 'PERCENTILE_CHUNK', 1000):
+            numpy.testing.assert_array_equal(pkmodel.plot.percentiles(sol.y[:, 0], [5, 50, 95]), bands)
+        fig = pkmodel.plot.plot_population(sol.t, sol.y[:, 0], traces=5, width=300)
+        lines = fig.axes[0].get_lines()
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(all(len(line.get_xdata()) == 300 for line in lines))
+        # The band is drawn at its full height
+        band = fig.axes[0].collections[0].get_paths()[0].vertices
+        self.assertAlmostEqual(band[:, 1].max(), bands[2].max())
+        with tempfile.TemporaryDirectory() as d:
+            filenames = pkmodel.plot.save_population_plots(sol.t, sol.y, population.state_names, d, width=200)
+            self.assertEqual(filenames, [os.path.join(d, 'q_c.png')])
+            self.assertTrue(os.path.isfile(filenames[0]))
+        matplotlib.pyplot.close('all')
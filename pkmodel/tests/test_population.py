@@ -0,0 +1,252 @@
+import unittest
+import os
+import tempfile
+import pkmodel as pk
+import pkmodel.population
+import numpy
+
+
+class PopulationTest(unittest.TestCase):
+    """
+    Tests the :class:`Population` class.
+    """
+    def models(self, k_a=None):
+        """
+        Returns a list of models with the same structure.
+        """
+        return [
+            pk.Model(pk.Compartment(1.0, 1.0), [pk.Compartment(1.0, 2.0)], k_a),
+            pk.Model(pk.Compartment(2.0, 0.5), [pk.Compartment(3.0, 1.0)], k_a),
+            pk.Model(pk.Compartment(0.5, 2.0), [pk.Compartment(1.5, 0.0)], k_a),
+        ]
+
+    def test_create(self):
+        """
+        Tests Population creation.
+        """
+        with self.assertRaises(TypeError):
+            pk.Population(['a'], [1.0])
+        with self.assertRaises(ValueError):
+            pk.Population(1.0, 1.0)
+        with self.assertRaises(ValueError):
+            pk.Population([1.0, 2.0], [1.0])
+        with self.assertRaises(ValueError):
+            pk.Population([1.0], [1.0], [[1.0, 2.0]], [[1.0]])
+        with self.assertRaises(ValueError):
+            pk.Population([0.0], [1.0])
+        with self.assertRaises(ValueError):
+            pk.Population([1.0], [-1.0])
+        with self.assertRaises(ValueError):
+            pk.Population([1.0], [1.0], k_a=[1.0, 2.0])
+        population = pk.Population([1.0, 2.0], [1.0, 1.0], [[1.0], [2.0]], [[1.0], [2.0]])
+        self.assertEqual(len(population), 2)
+        self.assertEqual(population.n_states, 2)
+        population = pk.Population([1.0, 2.0], [1.0, 1.0], k_a=[1.0, 2.0])
+        self.assertEqual(population.n_states, 2)
+
+    def test_from_models(self):
+        """
+        Tests Population creation from a list of models.
+        """
+        with self.assertRaises(TypeError):
+            pk.Population.from_models([])
+        with self.assertRaises(TypeError):
+            pk.Population.from_models([1.0])
+        models = self.models()
+        with self.assertRaises(ValueError):
+            pk.Population.from_models(models + self.models(1.0))
+        for k_a in [None, 2.0]:
+            models = self.models(k_a)
+            A, b = pk.Population.from_models(models).compile()
+            for model, A_k in zip(models, A):
+                numpy.testing.assert_allclose(A_k, model.compile()[0])
+                numpy.testing.assert_allclose(b, model.compile()[1])
+            population = pk.Population.from_models(models)
+            numpy.testing.assert_allclose(population[1:].compile()[0], A[1:])
+            numpy.testing.assert_allclose(population[0].compile()[0], A[:1])
+            self.assertEqual(len(population[[0, 0, 1]]), 3)
+
+    def test_from_columns(self):
+        """
+        Tests Population creation from columns of parameters.
+        """
+        columns = {
+            'id': [7, 8, 9], 'v_c': [1.0, 2.0, 0.5], 'cl': [1.0, 0.5, 2.0],
+            'v_p1': [1.0, 3.0, 1.5], 'q_p1': [2.0, 1.0, 0.0], 'k_a': [1.0, 1.0, 1.0],
+        }
+        A = pk.Population.from_columns(columns).compile()[0]
+        numpy.testing.assert_allclose(A, pk.Population.from_models(self.models(1.0)).compile()[0])
+        # A structured array, without k_a
+        table = numpy.zeros(3, dtype=[(name, float) for name in ['v_c', 'cl', 'v_p1', 'q_p1']])
+        for name in table.dtype.names:
+            table[name] = columns[name]
+        population = pk.Population.from_columns(table)
+        self.assertIsNone(population.k_a)
+        numpy.testing.assert_allclose(population.compile()[0], pk.Population.from_models(self.models()).compile()[0])
+        with self.assertRaises(TypeError):
+            pk.Population.from_columns([1.0, 2.0])
+        with self.assertRaises(TypeError):
+            pk.Population.from_columns(dict(columns, cl=['a', 'b', 'c']))
+        with self.assertRaises(ValueError):
+            pk.Population.from_columns(dict(columns, q_p2=[1.0, 1.0, 1.0]))
+        with self.assertRaises(ValueError):
+            pk.Population.from_columns(dict(columns, cl=[1.0, 1.0]))
+        for name, value in [('v_p1', 0.0), ('q_p1', -1.0), ('k_a', numpy.nan)]:
+            with self.assertRaisesRegex(ValueError, 'row 1'):
+                pk.Population.from_columns(dict(columns, **{name: [1.0, value, 1.0]}))
+
+    def test_read_csv(self):
+        """
+        Tests Population creation from a CSV file.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'patients.csv')
+            with open(path, 'w') as f:
+                f.write('id,name,v_c,cl,v_p1,q_p1,k_a\n')
+                for i, m in enumerate(self.models(1.0)):
+                    (v_c, v_p1), (cl, q_p1) = m.volumes, m.transition_rates
+                    f.write('{0},patient {0},{1},{2},{3},{4},{5}\n'.format(i, v_c, cl, v_p1, q_p1, m.k_a))
+            population = pk.Population.read_csv(path)
+            self.assertEqual(len(population), 3)
+            numpy.testing.assert_allclose(
+                population.compile()[0], pk.Population.from_models(self.models(1.0)).compile()[0])
+            with open(path, 'w') as f:
+                f.write('id,weight\n1,70\n')
+            with self.assertRaises(ValueError):
+                pk.Population.read_csv(path)
+
+    def test_solve(self):
+        """
+        Tests that solving a population matches solving each model.
+        """
+        with self.assertRaises(TypeError):
+            pk.Population.from_models(self.models()).solve(1.0)
+        with self.assertRaises(ValueError):
+            pk.Population.from_models(self.models()).solve([pk.Protocol(1.0, 1.0)] * 2)
+        with self.assertRaises(ValueError):
+            protocols = [pk.Protocol(1.0, 1.0), pk.Protocol(1.0, 1.0), pk.Protocol(1.0, 2.0)]
+            pk.Population.from_models(self.models()).solve(protocols)
+        protocol = pk.Protocol(1.0, 1.0, lambda t, y: 1.0)
+        t_eval = numpy.linspace(0, 1, 11)
+        for k_a in [None, 2.0]:
+            models = self.models(k_a)
+            for method in ['RK45', 'BDF', 'LSODA']:
+                sol = pk.Model.solve_batch(models, protocol, method=method, t_eval=t_eval)
+                self.assertEqual(sol.y.shape, (3, models[0].n_states, 11))
+                for model, y in zip(models, sol.y):
+                    expected = model.solve(protocol, method='Radau', t_eval=t_eval).y
+                    numpy.testing.assert_allclose(y, expected, atol=5e-3)
+
+    def test_solve_protocols(self):
+        """
+        Tests solving a population with one protocol per patient.
+        """
+        models = self.models()
+        protocols = [
+            pk.Protocol(1.0, 1.0),
+            pk.Protocol(0.0, 1.0, lambda t, y: 2.0),
+            pk.Protocol(2.0, 1.0, lambda t, y: t),
+        ]
+        t_eval = numpy.linspace(0, 1, 11)
+        sol = pk.Population.from_models(models).solve(protocols, t_eval=t_eval)
+        for model, protocol, y in zip(models, protocols, sol.y):
+            expected = model.solve(protocol, method='Radau', t_eval=t_eval).y
+            numpy.testing.assert_allclose(y, expected, atol=5e-3)
+
+    def test_solve_tolerance(self):
+        """
+        Tests that an outlier patient of a large population is solved as
+        accurately as on its own.
+        """
+        clearance = numpy.full(1000, 0.05)
+        clearance[0] = 3.0
+        population = pk.Population(numpy.ones(1000), clearance, numpy.full((1000, 1), 2.0), numpy.full((1000, 1), 0.5))
+        protocol = pk.Protocol(1.0, 24.0)
+        t_eval = numpy.linspace(0, 24, 49)
+        sol = population.solve(protocol, method='RK45', t_eval=t_eval)
+        model = pk.Model(pk.Compartment(1.0, 3.0), [pk.Compartment(2.0, 0.5)])
+        exact = model.solve(protocol, method='analytic', t_eval=t_eval).y
+        alone = numpy.abs(model.solve(protocol, method='RK45', t_eval=t_eval).y - exact).max()
+        self.assertLess(numpy.abs(sol.y[0] - exact).max(), 2 * alone)
+
+    def test_solve_vectorized(self):
+        """
+        Tests that a vectorized dose_func shared by several protocols is
+        called once for all of their patients.
+        """
+        models = self.models()
+        calls = []
+
+        def dose_func(t, y):
+            calls.append(numpy.shape(y))
+            return numpy.exp(-numpy.asarray(t))
+
+        protocols = [
+            pk.Protocol(1.0, 2.0, dose_func, vectorized=True),
+            pk.Protocol(0.0, 2.0, pk.DoseTable([0.0, 1.0], [1.0, 0.0], kind='linear')),
+            pk.Protocol(2.0, 2.0, dose_func, vectorized=True),
+        ]
+        t_eval = numpy.linspace(0, 2, 11)
+        population = pk.Population.from_models(models)
+        for method in ['RK45', 'exponential']:
+            calls.clear()
+            sol = population.solve(protocols, method=method, t_eval=t_eval)
+            self.assertEqual(len(calls), sol.nfev)
+            self.assertEqual(set(calls), {(2, 2)})
+            for model, protocol, y in zip(models, protocols, sol.y):
+                expected = model.solve(protocol, method='Radau', t_eval=t_eval).y
+                numpy.testing.assert_allclose(y, expected, atol=5e-3)
+
+    def test_solve_doses(self):
+        """
+        Tests solving a population with discrete doses.
+        """
+        models = self.models(2.0)
+        shared = pk.Protocol(1.0, 10.0, doses=pk.Dose.repeat(1.0, 2.0, 5, duration=0.5))
+        protocols = [
+            shared,
+            pk.Protocol(0.0, 10.0, doses=[pk.Dose(3.0, 1.0, compartment='q_c')]),
+            pk.Protocol(1.0, 10.0),
+        ]
+        t_eval = numpy.linspace(0, 10, 21)
+        for protocol in [shared, protocols]:
+            sol = pk.Population.from_models(models).solve(protocol, method='BDF', t_eval=t_eval)
+            for k, (model, y) in enumerate(zip(models, sol.y)):
+                p = protocol[k] if type(protocol) is list else protocol
+                expected = model.solve(p, method='analytic', t_eval=t_eval).y
+                numpy.testing.assert_allclose(y, expected, atol=5e-3)
+
+    def test_solve_dose_tables(self):
+        """
+        Tests solving a population with per-patient dose tables, which
+        are evaluated together.
+        """
+        models = self.models()
+        protocols = [
+            pk.Protocol(1.0, 4.0, pk.DoseTable([0.0, 1.0], [0.0, 1.0])),
+            pk.Protocol(0.0, 4.0, pk.DoseTable([0.0, 2.0, 3.0], [2.0, 1.0, 0.0])),
+            pk.Protocol(1.0, 4.0),
+        ]
+        t_eval = numpy.linspace(0, 4, 21)
+        sol = pk.Population.from_models(models).solve(protocols, t_eval=t_eval)
+        for model, protocol, y in zip(models, protocols, sol.y):
+            expected = model.solve(protocol, method='analytic', t_eval=t_eval).y
+            numpy.testing.assert_allclose(y, expected, atol=5e-3)
+        # Piecewise-linear tables are stacked and evaluated together
+        protocols = [
+            pk.Protocol(1.0, 4.0, pk.DoseTable([0.0, 1.0], [0.0, 1.0], kind='linear')),
+            pk.Protocol(0.0, 4.0, pk.DoseTable([0.0, 2.0, 3.0], [2.0, 1.0, 0.0], kind='linear')),
+            pk.Protocol(1.0, 4.0, pk.DoseTable([0.0], [0.5], kind='linear')),
+        ]
+        self.assertIsInstance(pkmodel.population._dose_func(protocols), pk.DoseTable)
+        sol = pk.Population.from_models(models).solve(protocols, t_eval=t_eval)
+        for model, protocol, y in zip(models, protocols, sol.y):
+            expected = model.solve(protocol, method='Radau', t_eval=t_eval).y
+            numpy.testing.assert_allclose(y, expected, atol=5e-3)
+        # A shared table may give a rate for each patient
+        table = pk.DoseTable([0.0, 1.0], [[0.0, 1.0], [1.0, 0.0], [2.0, 2.0]])
+        sol = pk.Population.from_models(models).solve(pk.Protocol(1.0, 4.0, table), t_eval=t_eval)
+        for k, (model, y) in enumerate(zip(models, sol.y)):
+            protocol = pk.Protocol(1.0, 4.0, pk.DoseTable([0.0, 1.0], table.rates[k]))
+            expected = model.solve(protocol, method='analytic', t_eval=t_eval).y
+            numpy.testing.assert_allclose(y, expected, atol=5e-3)
@@ -0,0 +1,89 @@
+import unittest
+import pkmodel as pk
+import numpy
+
+
+class PropagatorTest(unittest.TestCase):
+    """
+    Tests the :mod:`pkmodel.propagator` module.
+    """
+    def population(self, N=20):
+        """
+        Returns a random population with subcutaneous dosing.
+        """
+        rng = numpy.random.default_rng(1)
+        return pk.Population(
+            rng.uniform(0.5, 2.0, N), rng.uniform(0.5, 2.0, N), rng.uniform(1.0, 3.0, (N, 1)),
+            rng.uniform(0.2, 1.0, (N, 1)), k_a=rng.uniform(0.5, 2.0, N),
+        )
+
+    def test_propagators(self):
+        """
+        Tests the propagators, including of a singular rate matrix.
+        """
+        A = numpy.array([[[-1.0, 0.0], [1.0, 0.0]]])
+        Phi, Gamma = pk.propagator.propagators(A, [0.5, 2.0])
+        self.assertEqual(Phi.shape, (2, 1, 2, 2))
+        for k, h in enumerate([0.5, 2.0]):
+            e = numpy.exp(-h)
+            numpy.testing.assert_allclose(Phi[k, 0], [[e, 0.0], [1 - e, 1.0]], atol=1e-12)
+            numpy.testing.assert_allclose(Gamma[k, 0], [[1 - e, 0.0], [h - 1 + e, h]], atol=1e-12)
+
+    def test_exact_doses(self):
+        """
+        Tests that discrete doses off the grid are solved exactly.
+        """
+        population = self.population()
+        protocol = pk.Protocol(1.0, 24.0, doses=[pk.Dose(7.3, 2.0), pk.Dose(12.1, 1.0, duration=1.7)])
+        t = numpy.linspace(0, 24, 25)
+        sol = population.solve(protocol, method='exponential', t_eval=t)
+        self.assertEqual(sol.method, 'exponential')
+        self.assertEqual(sol.y.shape, (20, 3, 25))
+        self.assertEqual(sol.nfev, 0)
+        for k in [0, 7]:
+            v_c, cl = float(population.central_volume[k]), float(population.clearance[k])
+            v_p, q_p = float(population.peripheral_volumes[k, 0]), float(population.peripheral_rates[k, 0])
+            model = pk.Model(pk.Compartment(v_c, cl), [pk.Compartment(v_p, q_p)], float(population.k_a[k]))
+            exact = model.solve(protocol, method='analytic', t_eval=t)
+            numpy.testing.assert_allclose(sol.y[k], exact.y, atol=1e-10)
+        self.assertLess(pk.propagator.estimate_error(population, protocol, t), 1e-6)
+        with self.assertRaises(ValueError):
+            population.solve(protocol, method='exponential', t_eval=[25.0])
+        # Boluses at the start are added to every patient
+        protocol = pk.Protocol(1.0, 24.0, doses=[pk.Dose(0.0, 5.0), pk.Dose(0.0, 2.0, compartment='q_c')])
+        sol = population.solve(protocol, method='exponential', t_eval=t)
+        numpy.testing.assert_allclose(sol.y[:, :2, 0], numpy.tile([6.0, 2.0], (20, 1)))
+        self.assertLess(pk.propagator.estimate_error(population, protocol, t), 1e-6)
+
+    def test_dose_func(self):
+        """
+        Tests that a dose_func is integrated to second order.
+        """
+        model = pk.Model(pk.Compartment(1.0, 1.0), [pk.Compartment(2.0, 0.5)], 1.0)
+        protocol = pk.Protocol(1.0, 24.0, lambda t, q: numpy.sin(t) ** 2)
+        population = pk.Population.from_models([model])
+        errors = [
+            pk.propagator.estimate_error(population, protocol, numpy.linspace(0, 24, k)) for k in [49, 97]
+        ]
+        self.assertAlmostEqual(errors[0] / errors[1], 4.0, delta=0.2)
+        sol = model.solve(protocol, method='exponential', t_eval=numpy.linspace(0, 24, 97))
+        self.assertEqual(sol.y.shape, (3, 97))
+        self.assertEqual(sol.nfev, 96)
+        numpy.testing.assert_allclose(sol.y, population.solve(protocol, 'exponential', sol.t).y[0])
+
+    def test_resume(self):
+        """
+        Tests resuming an exponential solution from its checkpoint.
+        """
+        model = pk.Model(pk.Compartment(1.0, 1.0), [pk.Compartment(2.0, 0.5)])
+        protocol = pk.Protocol(1.0, 12.0, doses=[pk.Dose(4.0, 1.0)])
+        longer = protocol.extend(24.0, [pk.Dose(14.0, 2.0)])
+        sol = model.solve(protocol, method='exponential', t_eval=numpy.linspace(0, 12, 13))
+        rest = model.resume(sol.checkpoint, longer, t_eval=numpy.linspace(12, 24, 13))
+        self.assertEqual(rest.method, 'exponential')
+        exact = model.solve(longer, method='analytic', t_eval=rest.t)
+        numpy.testing.assert_allclose(rest.y, exact.y, atol=1e-10)
+
+
+if __name__ == '__main__':
+    unittest.main()
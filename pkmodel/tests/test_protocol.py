@@ -1,6 +1,7 @@
 import unittest
 import pkmodel as pk
 import pytest
+import numpy
 
 
 class ProtocolTest(unittest.TestCase):
@@ -35,3 +36,165 @@ class ProtocolTest(unittest.TestCase):
             protocol = pk.Protocol(1, 1, lambda x: "hi")
         protocol = pk.Protocol(100, 10, lambda t, y: 1 / (t + 2))
         self.assertEquals(protocol.name, '[initial_dose=100.0, time=10.0]')
+
+    def test_doses(self):
+        """
+        Tests Protocol creation with discrete doses.
+        """
+        with self.assertRaises(TypeError):
+            pk.Protocol(1, 1, doses=1.0)
+        with self.assertRaises(TypeError):
+            pk.Protocol(1, 1, doses=[1.0])
+        doses = [pk.Dose(2.0, 1.0), pk.Dose(1.0, 3.0, duration=0.5, compartment='q_c')]
+        protocol = pk.Protocol(1, 10, doses=doses)
+        self.assertEqual([d.time for d in protocol.doses], [1.0, 2.0])
+        self.assertEqual(protocol.name, '[initial_dose=1.0, time=10.0, doses=2]')
+        boluses, infusions = protocol.events(['q_0', 'q_c'])
+        self.assertEqual(boluses, [(2.0, 1.0, 0)])
+        self.assertEqual(infusions, [(1.0, 1.5, 6.0, 1)])
+        with self.assertRaises(ValueError):
+            protocol.events(['q_c', 'q_p1'][1:])
+
+    def test_from_spec(self):
+        """
+        Tests Protocol creation from a spec.
+        """
+        protocol = pk.Protocol.from_spec({'initial_dose': 1, 'time': 10, 'doses': [
+            {'time': 2.0, 'amount': 1.0}, {'time': 1.0, 'amount': 3.0, 'duration': 0.5, 'compartment': 'q_c'}]})
+        self.assertEqual(protocol.name, '[initial_dose=1.0, time=10.0, doses=2]')
+        self.assertEqual(protocol.events(['q_0', 'q_c']), ([(2.0, 1.0, 0)], [(1.0, 1.5, 6.0, 1)]))
+        with self.assertRaises(TypeError):
+            pk.Protocol.from_spec([1, 10])
+        with self.assertRaises(TypeError):
+            pk.Protocol.from_spec({'initial_dose': 1, 'time': 10, 'doses': [1.0]})
+        with self.assertRaises(ValueError):
+            pk.Protocol.from_spec({'initial_dose': 1})
+        with self.assertRaises(ValueError):
+            pk.Protocol.from_spec({'initial_dose': 1, 'time': 10, 'dose_func': 'sin'})
+        with self.assertRaises(ValueError):
+            pk.Protocol.from_spec({'initial_dose': 1, 'time': 10, 'doses': [{'time': 1.0, 'rate': 1.0}]})
+
+
+class DoseTest(unittest.TestCase):
+    """
+    Tests the :class:`Dose` class.
+    """
+    def test_create(self):
+        """
+        Tests Dose creation.
+        """
+        with self.assertRaises(TypeError):
+            pk.Dose('hello', 1.0)
+        with self.assertRaises(TypeError):
+            pk.Dose(1.0, None)
+        with self.assertRaises(ValueError):
+            pk.Dose(-1.0, 1.0)
+        with self.assertRaises(ValueError):
+            pk.Dose(1.0, 1.0, duration=-1.0)
+        with self.assertRaises(TypeError):
+            pk.Dose(1.0, 1.0, compartment=1)
+        dose = pk.Dose(1, 2)
+        self.assertTrue(dose.is_bolus)
+        self.assertEqual(dose.name, '[time=1.0, amount=2.0, duration=0.0, compartment=None]')
+        dose = pk.Dose(1, 2, 4, 'q_c')
+        self.assertFalse(dose.is_bolus)
+        self.assertEqual(dose.rate, 0.5)
+        self.assertEqual(str(dose), '[time=1.0, amount=2.0, duration=4.0, compartment=q_c]')
+
+    def test_repeat(self):
+        """
+        Tests creation of a repeated dosing regimen.
+        """
+        with self.assertRaises(TypeError):
+            pk.Dose.repeat(1.0, 8.0, 1.5)
+        with self.assertRaises(ValueError):
+            pk.Dose.repeat(1.0, 0.0, 3)
+        doses = pk.Dose.repeat(1.0, 8.0, 3, start=1.0, duration=0.5)
+        self.assertEqual([d.time for d in doses], [1.0, 9.0, 17.0])
+        self.assertTrue(all(d.duration == 0.5 and d.amount == 1.0 for d in doses))
+
+    def test_dose_rate(self):
+        """
+        Tests evaluating the dose function at many times.
+        """
+        t = numpy.array([0.0, 0.5, 1.0])
+        protocol = pk.Protocol(1, 1, lambda t, y: t + 1)
+        self.assertFalse(protocol.vectorized)
+        numpy.testing.assert_allclose(protocol.dose_rate(t), [1.0, 1.5, 2.0])
+        self.assertEqual(len(protocol.breakpoints), 0)
+        calls = []
+
+        def dose_func(t, y):
+            calls.append(t)
+            return numpy.ones_like(t)
+
+        protocol = pk.Protocol(1, 1, dose_func, vectorized=True)
+        calls.clear()
+        numpy.testing.assert_allclose(protocol.dose_rate(t), [1.0, 1.0, 1.0])
+        self.assertEqual(len(calls), 1)
+        with self.assertRaises(TypeError):
+            pk.Protocol(1, 1, lambda t, y: 'hi', vectorized=True)
+        table = pk.DoseTable([0.0, 0.5], [[1.0, 2.0], [3.0, 4.0]])
+        protocol = pk.Protocol(1, 1, table)
+        self.assertTrue(protocol.vectorized)
+        numpy.testing.assert_allclose(protocol.dose_rate(t), [[1.0, 2.0, 2.0], [3.0, 4.0, 4.0]])
+        numpy.testing.assert_allclose(protocol.breakpoints, [0.0, 0.5])
+
+
+class DoseTableTest(unittest.TestCase):
+    """
+    Tests the :class:`DoseTable` class.
+    """
+    def test_create(self):
+        """
+        Tests DoseTable creation.
+        """
+        with self.assertRaises(TypeError):
+            pk.DoseTable(['a'], [1.0])
+        with self.assertRaises(ValueError):
+            pk.DoseTable([1.0, 2.0], [1.0, 1.0])
+        with self.assertRaises(ValueError):
+            pk.DoseTable([0.0, 0.0], [1.0, 1.0])
+        with self.assertRaises(ValueError):
+            pk.DoseTable([0.0, 1.0], [1.0])
+        with self.assertRaises(ValueError):
+            pk.DoseTable([0.0, 1.0], [1.0, -1.0])
+        with self.assertRaises(ValueError):
+            pk.DoseTable([0.0, 1.0], [1.0, 1.0], kind='cubic')
+
+    def test_call(self):
+        """
+        Tests evaluating piecewise-constant and piecewise-linear tables.
+        """
+        t = [0.0, 0.5, 1.0, 1.5, 3.0]
+        table = pk.DoseTable([0.0, 1.0, 2.0], [1.0, 3.0, 0.0])
+        numpy.testing.assert_allclose(table(t), [1.0, 1.0, 3.0, 3.0, 0.0])
+        self.assertEqual(table(0.5, 1.0), 1.0)
+        table = pk.DoseTable([0.0, 1.0, 2.0], [1.0, 3.0, 0.0], kind='linear')
+        numpy.testing.assert_allclose(table(t), [1.0, 2.0, 3.0, 1.5, 0.0])
+        table = pk.DoseTable([0.0, 1.0], [[1.0, 3.0], [2.0, 2.0]], kind='linear')
+        numpy.testing.assert_allclose(table(0.5), [2.0, 2.0])
+        numpy.testing.assert_allclose(table(t).shape, (2, 5))
+
+    def test_stack(self):
+        """
+        Tests stacking single-patient tables.
+        """
+        a = pk.DoseTable([0.0, 1.0], [1.0, 3.0], kind='linear')
+        b = pk.DoseTable([0.0, 0.5, 2.0], [2.0, 0.0, 1.0], kind='linear')
+        table = pk.DoseTable.stack([a, b])
+        t = numpy.linspace(0, 3, 31)
+        numpy.testing.assert_allclose(table(t), [a(t), b(t)])
+        with self.assertRaises(ValueError):
+            pk.DoseTable.stack([a, pk.DoseTable([0.0], [1.0])])
+        with self.assertRaises(ValueError):
+            pk.DoseTable.stack([table])
+
+    def test_infusions(self):
+        """
+        Tests converting piecewise-constant tables to infusions.
+        """
+        table = pk.DoseTable([0.0, 1.0, 2.0], [1.0, 0.0, 2.0])
+        self.assertEqual(table.infusions(1), [(0.0, 1.0, 1.0, 1), (2.0, numpy.inf, 2.0, 1)])
+        with self.assertRaises(ValueError):
+            pk.DoseTable([0.0, 1.0], [1.0, 0.0], kind='linear').infusions()
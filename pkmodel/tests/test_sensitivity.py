@@ -0,0 +1,100 @@
+import unittest
+import unittest.mock
+import pkmodel as pk
+import numpy
+
+
+class SensitivityTest(unittest.TestCase):
+    """
+    Tests the :mod:`pkmodel.sensitivity` module.
+    """
+    def setUp(self):
+        # The AUC of this model is dose_scale / cl, independent of v_c,
+        # and its Cmax is dose_scale / v_c
+        self.model = pk.Model(pk.Compartment(1.5, 1.5), [])
+        self.protocol = pk.Protocol(1.0, 60.0)
+        self.bounds = {'v_c': (1.0, 2.0), 'cl': (1.0, 2.0), 'dose_scale': (0.5, 1.5)}
+
+    def expected(self):
+        """Returns the first-order indices of dose_scale and cl for the
+        AUC, from the moments of dose_scale and 1 / cl.
+        """
+        mean_g, mean_g2 = numpy.log(2.0), 0.5
+        mean_s, mean_s2 = 1.0, 13 / 12
+        variance = mean_s2 * mean_g2 - (mean_s * mean_g) ** 2
+        return (mean_s2 - mean_s ** 2) * mean_g ** 2 / variance, mean_s ** 2 * (mean_g2 - mean_g ** 2) / variance
+
+    def test_sobol(self):
+        """
+        Tests Sobol indices against their exact values.
+        """
+        s, cl = self.expected()
+        result = pk.sensitivity.sobol(self.model, self.protocol, self.bounds, ['auc', 'cmax'], n=512, block_size=1000, seed=1)
+        self.assertEqual(result.names, ['v_c', 'cl', 'dose_scale'])
+        self.assertEqual(result.nfev, 512 * 5)
+        numpy.testing.assert_allclose(result.first[0], [0.0, cl, s], atol=0.02)
+        numpy.testing.assert_allclose(result.total[0], [0.0, 1 - s, 1 - cl], atol=0.02)
+        # Cmax does not depend on cl
+        self.assertAlmostEqual(result.first[1, 1], 0.0, places=4)
+        self.assertEqual(result.first_conf.shape, (2, 3, 2))
+        low, high = numpy.moveaxis(result.first_conf[0, 1:], -1, 0)
+        self.assertTrue(numpy.all((low < [cl, s]) & ([cl, s] < high)))
+        low, high = numpy.moveaxis(result.total_conf[0, 1:], -1, 0)
+        self.assertTrue(numpy.all((low < [1 - s, 1 - cl]) & ([1 - s, 1 - cl] < high)))
+        # Random samples converge more slowly
+        result = pk.sensitivity.sobol(self.model, self.protocol, self.bounds, n=512, sampler='lhs', seed=1)
+        numpy.testing.assert_allclose(result.first, [0.0, cl, s], atol=0.1)
+        result = pk.sensitivity.sobol(
+            self.model, self.protocol, self.bounds, lambda r: r.auc * 2, n=64, n_bootstrap=10, seed=1)
+        self.assertEqual(result.first.shape, (3,))
+        self.assertEqual(result.total_conf.shape, (3, 2))
+        with self.assertRaises(TypeError):
+            pk.sensitivity.sobol(self.model, 'protocol', self.bounds)
+        with self.assertRaises(ValueError):
+            pk.sensitivity.sobol(self.model, self.protocol, {'k_a': (1.0, 2.0)})
+        with self.assertRaises(ValueError):
+            pk.sensitivity.sobol(self.model, self.protocol, {'cl': (2.0, 1.0)})
+        with self.assertRaises(ValueError):
+            pk.sensitivity.sobol(self.model, self.protocol, self.bounds, 'time_above')
+        with self.assertRaises(ValueError):
+            pk.sensitivity.sobol(self.model, self.protocol, self.bounds, sampler='grid')
+
+    def test_morris(self):
+        """
+        Tests screening by elementary effects.
+        """
+        result = pk.sensitivity.morris(
+            self.model, self.protocol, self.bounds, ['auc', 'time_above'], trajectories=10, threshold=0.2, seed=1)
+        self.assertEqual(result.nfev, 40)
+        self.assertEqual(result.mu_star.shape, (2, 3))
+        # The AUC does not depend on v_c, decreases with cl and increases
+        # with the dose
+        self.assertLess(result.mu_star[0, 0], 1e-3)
+        self.assertLess(result.mu[0, 1], 0)
+        self.assertGreater(result.mu[0, 2], 0)
+        numpy.testing.assert_allclose(result.mu_star[0, 1:], -result.mu[0, 1:] * [1, -1])
+        with self.assertRaises(ValueError):
+            pk.sensitivity.morris(self.model, self.protocol, self.bounds, levels=3)
+
+    def test_block_size(self):
+        """
+        Tests that the metrics of a block are computed in time linear in
+        the number of patients, by checking that the concentrations are
+        never evaluated at a number of times which grows with the block.
+        """
+        widths = []
+        add = pk.metrics.Metrics.add
+
+        def record(metrics, t0, t1, conc):
+            def wrapped(t):
+                widths.append(numpy.size(t))
+                return conc(t)
+            return add(metrics, t0, t1, wrapped)
+
+        with unittest.mock.patch.object(pk.metrics.Metrics, 'add', autospec=True, side_effect=record):
+            pk.sensitivity.sobol(
+                self.model, self.protocol, self.bounds, ['cmax', 'time_above'], n=1024, threshold=0.5,
+                n_bootstrap=10, seed=1,
+            )
+        self.assertGreater(len(widths), 0)
+        self.assertLessEqual(max(widths), pk.metrics.DEGREE + 1)
@@ -0,0 +1,134 @@
+import unittest
+import asyncio
+import json
+import pkmodel as pk
+import pkmodel.service
+import numpy
+
+
+def spec(cl, k_a=None, time=12.0):
+    parameters = {'v_c': 2.0, 'cl': cl, 'v_p1': 3.0, 'q_p1': 0.5}
+    doses = [{'time': 6.0, 'amount': 1.0}]
+    if k_a is not None:
+        parameters['k_a'] = k_a
+        doses.append({'time': 8.0, 'amount': 2.0, 'duration': 1.0, 'compartment': 'q_c'})
+    return {
+        'parameters': parameters,
+        'protocol': {'initial_dose': 1.0, 'time': time, 'doses': doses},
+        't_eval': [0.0, 3.0, 6.0, 9.0, 12.0],
+    }
+
+
+def solve(s):
+    """Solves a spec with a Model, for comparison.
+    """
+    p = s['parameters']
+    model = pk.Model(pk.Compartment(p['v_c'], p['cl']), [pk.Compartment(p['v_p1'], p['q_p1'])], p.get('k_a'))
+    protocol = s['protocol']
+    doses = [pk.Dose(**d) for d in protocol['doses']]
+    return model.solve(pk.Protocol(protocol['initial_dose'], protocol['time'], doses=doses),
+                       method='analytic', t_eval=s['t_eval'])
+
+
+class ServiceTest(unittest.TestCase):
+    """
+    Tests the :class:`SimulationService` class.
+    """
+    def test_parse(self):
+        """
+        Tests validation of request specs.
+        """
+        parse = pkmodel.service.parse
+        parameters, protocol, t_eval, method = parse(spec(1.0, 2.0))
+        self.assertEqual(parameters['k_a'], 2.0)
+        self.assertEqual(len(protocol.doses), 2)
+        self.assertEqual(t_eval, (0.0, 3.0, 6.0, 9.0, 12.0))
+        self.assertEqual(method, 'auto')
+        with self.assertRaises(TypeError):
+            parse([])
+        with self.assertRaises(ValueError):
+            parse(dict(spec(1.0), solver='RK45'))
+        with self.assertRaises(ValueError):
+            parse(dict(spec(1.0), method='analytic'))
+        with self.assertRaises(ValueError):
+            parse(dict(spec(1.0), parameters={'v_c': 1.0}))
+        with self.assertRaises(ValueError):
+            parse(dict(spec(1.0), parameters={'v_c': -1.0, 'cl': 1.0}))
+        with self.assertRaises(ValueError):
+            parse(dict(spec(1.0), protocol={'time': 1.0}))
+        with self.assertRaises(ValueError):
+            # There is no dosing compartment without k_a
+            bad = spec(1.0)
+            bad['protocol']['doses'] = [{'time': 1.0, 'amount': 1.0, 'compartment': 'q_0'}]
+            parse(bad)
+
+    def test_submit(self):
+        """
+        Tests that concurrent requests are batched and deduplicated, and
+        solved correctly.
+        """
+        specs = [spec(1.0 + i % 4, None if i % 2 else 1.5) for i in range(40)]
+
+        async def run():
+            async with pkmodel.service.SimulationService(workers=1) as service:
+                solutions = await asyncio.gather(*[service.submit(s) for s in specs])
+                return service, solutions
+        service, solutions = asyncio.run(run())
+        self.assertEqual(service.requests, 40)
+        self.assertEqual(service.duplicates, 36)
+        self.assertLessEqual(service.batches, 2)
+        for s, sol in zip(specs, solutions):
+            expected = solve(s)
+            self.assertEqual(sol.state_names, pk.parameter_sweep.to_population([s['parameters']]).state_names)
+            numpy.testing.assert_allclose(sol.t, expected.t)
+            numpy.testing.assert_allclose(sol.y, expected.y, rtol=1e-3, atol=1e-4)
+            self.assertFalse(sol.y.flags.writeable)
+
+    def test_backpressure(self):
+        """
+        Tests deadlines, and that at most max_pending requests are in
+        flight.
+        """
+        specs = [spec(1.0 + i) for i in range(20)]
+
+        async def run():
+            async with pkmodel.service.SimulationService(workers=1, max_batch=2, max_pending=3) as service:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await service.submit(specs[0], timeout=0)
+                peak = []
+
+                async def submit(s):
+                    sol = await service.submit(s, timeout=60.0)
+                    peak.append(len(service._inflight))
+                    return sol
+                solutions = await asyncio.gather(*[submit(s) for s in specs])
+                self.assertEqual(len(service._inflight), 0)
+                return peak, solutions
+        peak, solutions = asyncio.run(run())
+        self.assertLessEqual(max(peak), 3)
+        numpy.testing.assert_allclose(solutions[-1].y, solve(specs[-1]).y, rtol=1e-3, atol=1e-4)
+
+    def test_serve(self):
+        """
+        Tests the newline-delimited JSON server on the loopback
+        interface.
+        """
+        async def run():
+            async with pkmodel.service.SimulationService(workers=1) as service:
+                server = await pkmodel.service.serve(service)
+                port = server.sockets[0].getsockname()[1]
+                async with server:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                    for i, s in enumerate([spec(1.0), spec(2.0, 1.0), {'parameters': 1.0}]):
+                        writer.write(json.dumps(dict(s, id=i, timeout=30.0)).encode() + b'\n')
+                    writer.write(b'not json\n')
+                    writer.write_eof()
+                    responses = [json.loads(line) for line in (await reader.read()).splitlines()]
+                    writer.close()
+                    return responses
+        responses = {r['id']: r for r in asyncio.run(run())}
+        self.assertEqual(len(responses), 4)
+        numpy.testing.assert_allclose(responses[1]['y'], solve(spec(2.0, 1.0)).y, rtol=1e-3, atol=1e-4)
+        self.assertEqual(responses[1]['state_names'], ['q_0', 'q_c', 'q_p1'])
+        self.assertTrue(responses[2]['error'].startswith('TypeError'))
+        self.assertIn('error', responses[None])
@@ -0,0 +1,71 @@
+import unittest
+import pkmodel as pk
+import numpy
+
+
+class SolveStatsTest(unittest.TestCase):
+    """
+    Tests the :class:`SolveStats` and :class:`StatsCollector` classes.
+    """
+    def model(self):
+        return pk.Model(pk.Compartment(1.0, 1.0), [pk.Compartment(2.0, 0.5)], k_a=1.5)
+
+    def test_solve_stats(self):
+        """
+        Tests that Model.solve fills in the statistics of a solve.
+        """
+        model = self.model()
+        protocol = pk.Protocol(1.0, 2.0, dose_func=lambda t, q: 0.5, doses=[pk.Dose(1.0, 1.0)])
+        stats = pk.SolveStats()
+        sol = model.solve(protocol, method='BDF', stats=stats)
+        self.assertTrue(stats.success)
+        self.assertEqual(stats.method, 'BDF')
+        self.assertEqual(stats.model, model.name)
+        self.assertEqual(stats.nfev, sol.nfev)
+        self.assertEqual(stats.njev, sol.njev)
+        self.assertGreater(stats.nfev, 0)
+        self.assertGreater(stats.njev, 0)
+        # The steps cover the protocol time
+        self.assertEqual(stats.n_steps, len(sol.step_sizes))
+        self.assertAlmostEqual(numpy.sum(stats.step_sizes), 2.0)
+        for phase in pk.stats.PHASES:
+            self.assertGreaterEqual(stats.wall_time[phase], 0.0)
+        self.assertGreater(stats.wall_time['dose'], 0.0)
+        self.assertIn('BDF', str(stats))
+
+        # Instrumenting does not change the solution
+        numpy.testing.assert_array_equal(sol.y, model.solve(protocol, method='BDF').y)
+
+        # Callables are passed the statistics
+        received = []
+        model.solve(protocol, stats=received.append)
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0].method, 'RK45')
+        with self.assertRaises(TypeError):
+            model.solve(protocol, stats=1)
+
+    def test_collect_stats(self):
+        """
+        Tests collecting the statistics of many solves.
+        """
+        model = self.model()
+        protocol = pk.Protocol(1.0, 1.0)
+        with pk.collect_stats() as outer:
+            model.solve(protocol)
+            with pk.collect_stats() as inner:
+                model.solve(protocol, method='analytic')
+        model.solve(protocol)
+        self.assertFalse(pk.stats.active())
+        self.assertEqual(len(outer), 2)
+        self.assertEqual(len(inner), 1)
+        analytic = inner.solves[0]
+        self.assertEqual(analytic.nfev, 0)
+        self.assertEqual(analytic.n_steps, 0)
+        self.assertEqual(outer.nfev, outer.solves[0].nfev)
+        self.assertIs(outer.slowest(1, key='nfev')[0], outer.solves[0])
+        self.assertEqual(set(outer.wall_time), set(pk.stats.PHASES))
+        self.assertIn('2 solves', outer.summary())
+
+
+if __name__ == '__main__':
+    unittest.main()
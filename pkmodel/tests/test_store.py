@@ -0,0 +1,73 @@
+import unittest
+import tempfile
+import os
+import pkmodel as pk
+import numpy
+
+
+class ResultStoreTest(unittest.TestCase):
+    """
+    Tests the :class:`ResultStore` class.
+    """
+    def population(self, n):
+        return pk.Population(
+            numpy.linspace(1.0, 2.0, n), numpy.ones(n), numpy.full((n, 1), 2.0), numpy.full((n, 1), 0.5))
+
+    def test_create(self):
+        """
+        Tests creating and reopening a store.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results')
+            with self.assertRaises(TypeError):
+                pk.ResultStore.create(path, 'q_c', [0.0, 1.0])
+            store = pk.ResultStore.create(path, ['q_c', 'q_p1'], [0.0, 1.0, 2.0], dtype=numpy.float32)
+            self.assertEqual(len(store), 0)
+            self.assertEqual(store.y.shape, (0, 2, 3))
+            with self.assertRaises(KeyError):
+                store.patient(0)
+            with self.assertRaises(ValueError):
+                pk.ResultStore.create(path, ['q_c'], [0.0])
+            with self.assertRaises(ValueError):
+                store.append(numpy.zeros((2, 2)))
+            with self.assertRaises(ValueError):
+                store.append(numpy.zeros((2, 3)), ids=[1, 2])
+            store.append(numpy.ones((2, 3)), ids=7)
+            store.append(numpy.arange(12).reshape(2, 2, 3), ids=[3, 5])
+            store = pk.ResultStore(path)
+            self.assertEqual(len(store), 3)
+            self.assertEqual(store.dtype, numpy.float32)
+            numpy.testing.assert_array_equal(store.t, [0.0, 1.0, 2.0])
+            numpy.testing.assert_array_equal(store.ids, [7, 3, 5])
+            numpy.testing.assert_array_equal(store.patient(5), [[6, 7, 8], [9, 10, 11]])
+            numpy.testing.assert_array_equal(store.rows([5, 7]), [2, 0])
+
+    def test_select(self):
+        """
+        Tests reading slices of a store.
+        """
+        t_eval = numpy.linspace(0, 2.0, 21)
+        population = self.population(10)
+        protocol = pk.Protocol(1.0, 2.0)
+        expected = population.solve(protocol, t_eval=t_eval).y
+        with tempfile.TemporaryDirectory() as directory:
+            store = pk.ResultStore.create(directory, population.state_names, t_eval)
+            store.solve(population, protocol, chunk_size=4, ids=numpy.arange(100, 110))
+            self.assertEqual(len(store), 10)
+            # Chunks are solved separately, so the steps differ
+            numpy.testing.assert_allclose(store.y, expected, atol=5e-3)
+            expected = numpy.array(store.y)
+            # Compartments, times and slices of patients are views
+            y = store.select(slice(2, 5), 'q_p1', start=0.5, stop=1.0)
+            self.assertIsInstance(y.base, numpy.memmap)
+            numpy.testing.assert_array_equal(y, expected[2:5, 1, 5:11])
+            y = store.select(compartments=['q_c', 'q_p1'])
+            self.assertIsInstance(y.base, numpy.memmap)
+            y = store.select([109, 100], ['q_c'])
+            numpy.testing.assert_array_equal(y, expected[[9, 0], :1])
+            with self.assertRaises(ValueError):
+                store.solve(pk.Population([1.0], [1.0]), protocol)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,61 +1,41 @@
 import matplotlib.pylab as plt
 import numpy as np
-import scipy.integrate
+import pkmodel as pk
 
 
 def dose(t, X):
 
-    return X
-
-
-def rhs(t, y, Q_protocol1, V_c, V_protocol1, CL, X):
-
-    q_c, q_protocol1 = y
-    transition = Q_protocol1 * (q_c / V_c - q_protocol1 / V_protocol1)
-    dqc_dt = dose(t, X) - q_c / V_c * CL - transition
-    dqprotocol1_dt = transition
-    return [dqc_dt, dqprotocol1_dt]
+    return 1.0
 
 
 model1_args = {
 
-    'name': 'model1',
-    'Q_protocol1': 1.0,
-    'V_c': 1.0,
-    'V_protocol1': 1.0,
-    'CL': 1.0,
-    'X': 1.0,
+    'q_p1': 1.0,
+    'v_c': 1.0,
+    'v_p1': 1.0,
+    'cl': 1.0,
 }
 
 
 model2_args = {
 
-    'name': 'model2',
-    'Q_protocol1': 2.0,
-    'V_c': 1.0,
-    'V_protocol1': 1.0,
-    'CL': 1.0,
-    'X': 1.0,
+    'q_p1': 2.0,
+    'v_c': 1.0,
+    'v_p1': 1.0,
+    'cl': 1.0,
 }
 
 
-t_eval = np.linspace(0, 1, 1000)
-y0 = np.array([0.0, 0.0])
-
-fig = plt.figure()
-for model in [model1_args, model2_args]:
-    args = [
-        model['Q_protocol1'], model['V_c'], model['V_protocol1'], model['CL'], model['X']
-    ]
-    sol = scipy.integrate.solve_ivp(
-        fun=lambda t, y: rhs(t, y, *args),
-        t_span=[t_eval[0], t_eval[-1]],
-        y0=y0, t_eval=t_eval
-    )
-    plt.plot(sol.t, sol.y[0, :], label=model['name'] + '- q_c')
-    plt.plot(sol.t, sol.y[1, :], label=model['name'] + '- q_protocol1')
-
-plt.legend()
-plt.ylabel('drug mass [ng]')
-plt.xlabel('time [h]')
-plt.show()
+if __name__ == '__main__':
+    t_eval = np.linspace(0, 1, 1000)
+    protocol = pk.Protocol(initial_dose=0.0, time=1.0, dose_func=dose)
+
+    fig = plt.figure()
+    for name, (args, sol) in zip(['model1', 'model2'], pk.sweep([model1_args, model2_args], protocol, t_eval=t_eval)):
+        plt.plot(sol.t, sol.y[0, :], label=name + '- q_c')
+        plt.plot(sol.t, sol.y[1, :], label=name + '- q_protocol1')
+
+    plt.legend()
+    plt.ylabel('drug mass [ng]')
+    plt.xlabel('time [h]')
+    plt.show()